@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Aggregation of repeated acquisitions: mean, standard deviation, median and
+sigma-clipped mean of many spectra on a common X grid.
+
+Mean and variance are accumulated by Welford's algorithm while the files
+are read one by one, so memory is proportional to the grid only. The
+median needs all values at once; they are spooled to a temporary
+memory-mapped file in the same pass and the median is taken by blocks of
+grid points at the end. Only the sigma-clipped mean reads the files a
+second time.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from numpy.lib import format as npformat
+from scipy import interpolate
+
+import spectrum as sp
+import profiling
+
+
+MEDIAN_BLOCK = 1 << 14  # Grid points of the median taken at once
+
+
+def on_grid(spdata, x):
+    """
+    Returns Y of the spectrum at the grid points x and the boolean mask of
+    the points within the spectrum X range. Spectra on other X are
+    interpolated with spline of SPLINE_ORDER as in arithmetic.
+    """
+    if len(spdata.x) == len(x) and np.array_equal(spdata.x, x):
+        return spdata.y, np.ones(len(x), dtype=bool)
+    valid = (x >= spdata.x[0]) & (x <= spdata.x[-1])
+    y = np.zeros(len(x))
+    if valid.any():
+        kind = min(sp.SPLINE_ORDER, len(spdata) - 1)
+        with profiling.PROFILER.timer('interpolation'):
+            y[valid] = interpolate.interp1d(spdata.x, spdata.y, kind)(x[valid])
+    return y, valid
+
+
+class RunningStats(object):
+    """
+    Streaming mean and variance of spectra on the common X grid
+
+    RunningStats(x=None, spool=None)
+
+    The grid is X of the first spectrum added unless given. Each grid point
+    counts only the spectra covering it. Y on the grid is also written to
+    the MedianSpool spool, if any.
+    """
+
+    def __init__(self, x=None, spool=None):
+        self.x = None if x is None else np.asarray(x, dtype=float)
+        self.spool = spool
+        self.count = None
+        self._mean = None
+        self._m2 = None
+        self.headers = None
+        self.provenance = ()
+        self.paths = []
+
+    def add(self, spdata, where=None):
+        """
+        Add the spectrum to the statistics. where is the boolean mask of
+        grid points to take, all covered ones by default.
+        """
+        if self.x is None:
+            self.x = spdata.x.copy()
+        if self.count is None:
+            n = len(self.x)
+            self.count = np.zeros(n)
+            self._mean = np.zeros(n)
+            self._m2 = np.zeros(n)
+            self.headers = spdata.headers.copy()
+            self.provenance = spdata.provenance
+        y, valid = on_grid(spdata, self.x)
+        if self.spool is not None:
+            self.spool.add(y, valid)
+        if where is not None:
+            valid = valid & where
+        self.count += valid
+        # Welford's update, points not taken stay as they are
+        delta = np.where(valid, y - self._mean, 0.0)
+        self._mean += delta / np.maximum(self.count, 1)
+        self._m2 += delta * np.where(valid, y - self._mean, 0.0)
+        self.paths.append(spdata.headers.get('filepath', ''))
+
+    def mean_array(self):
+        """Returns mean array, NaN where no spectrum was taken"""
+        return np.where(self.count > 0, self._mean, np.nan)
+
+    def std_array(self, ddof=1):
+        """Returns standard deviation array, NaN where too few spectra were
+        taken"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof,
+                            np.sqrt(self._m2 / (self.count - ddof)), np.nan)
+
+    def _spectrum(self, y, header):
+        headers = self.headers.copy()
+        headers['filepath'] = (self.paths[0] if self.paths else 'stats') + \
+            '__' + header
+        headers[header] = '%d spectra' % len(self.paths)
+        return sp.Spectrum(self.x, y, headers, copy=False, presorted=True,
+                           provenance=self.provenance)
+
+    def mean(self):
+        """Returns the mean as Spectrum"""
+        return self._spectrum(self.mean_array(), 'mean')
+
+    def std(self, ddof=1):
+        """Returns the standard deviation as Spectrum"""
+        return self._spectrum(self.std_array(ddof), 'std')
+
+
+def running_stats(spectra, x=None, spool=None):
+    """Returns RunningStats of the spectra, an iterable read once, spooling
+    them to the MedianSpool spool if given"""
+    stats = RunningStats(x, spool)
+    for spdata in spectra:
+        stats.add(spdata)
+    return stats
+
+
+def clipped_mean(spectra, stats, nsigma=3.0):
+    """
+    Returns mean array of the spectra (a second pass over them) taking only
+    values within nsigma standard deviations of the first pass stats
+    """
+    mean, std = stats.mean_array(), stats.std_array()
+    clipped = RunningStats(stats.x)
+    for spdata in spectra:
+        y, _ = on_grid(spdata, stats.x)
+        with np.errstate(invalid='ignore'):
+            keep = ~(np.abs(y - mean) > nsigma * std)
+        clipped.add(spdata, keep)
+    return clipped.mean_array()
+
+
+class MedianSpool(object):
+    """
+    Median of up to count spectra on the common grid. Y added are spooled
+    to a temporary memory-mapped file of sp.DTYPE, NaN where a spectrum
+    does not cover the grid point, which is removed by close.
+
+    MedianSpool(count)
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.rows = 0
+        self._frames = None
+        self._path = None
+
+    def add(self, y, valid):
+        """Spool Y on the grid, taking only points of the valid mask"""
+        if self._frames is None:
+            fd, self._path = tempfile.mkstemp(suffix='.npy')
+            os.close(fd)
+            self._frames = npformat.open_memmap(
+                self._path, mode='w+', dtype=sp.DTYPE,
+                shape=(self.count, len(y)))
+        if self.rows == self.count:
+            raise ValueError("More than {0} spectra for the median".format(
+                self.count))
+        self._frames[self.rows] = np.where(valid, y, np.nan)
+        self.rows += 1
+
+    @profiling.timed('median')
+    def median_array(self):
+        """Returns median array of the spectra added"""
+        frames = self._frames[:self.rows]
+        result = np.empty(frames.shape[1])
+        for start in range(0, len(result), MEDIAN_BLOCK):
+            block = np.array(frames[:, start:start + MEDIAN_BLOCK])
+            with np.errstate(invalid='ignore'):
+                result[start:start + block.shape[1]] = np.nanmedian(block,
+                                                                    axis=0)
+        return result
+
+    def close(self):
+        """Remove the spool file"""
+        self._frames = None
+        if self._path is not None:
+            os.remove(self._path)
+            self._path = None
+
+
+def write_columns(filepath, x, columns, headers=None, provenance=()):
+    """
+    Write X and several Y columns, given as a list of (name, array) pairs,
+    to the file. Headers are written as by Spectrum along with the 'columns'
+    header naming them, so the file reads as a spectrum of the first column.
+    """
+    names = ', '.join(['x'] + [name for (name, _) in columns])
+    table = np.column_stack([x] + [y for (_, y) in columns])
+    with open(filepath, 'w') as out_file:
+        out_file.write(sp.format_headers(
+            headers or {}, provenance, filepath=os.path.basename(filepath),
+            columns=names))
+        out_file.write("\n\n")
+        np.savetxt(out_file, table, fmt='%f', delimiter='\t')
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Alignment of spectra to a reference by cross-correlation.
+
+Spectra are resampled to a uniform grid over the reference X range, and
+the cross-correlation with the reference is computed via FFT, with zero
+padding so that it is not circular. The lag of the correlation maximum is
+refined between grid points by a parabola through the maximum and its
+neighbours.
+
+A shift means spdata(x) ~ ref(x - shift). With a scale it means
+spdata(x) ~ ref(x / scale - shift), and the aligned spectrum is
+spdata.shift_x(-shift, 1 / scale). Near the X range a scale looks much
+like a shift, so the two are found jointly: the spectrum is scaled by
+candidates spaced so that the range ends move by one grid step, each
+candidate is correlated with the reference at its best shift, and the
+scale and shift of the highest normalized correlation maximum are refined
+together by the simplex method. The shift is then estimated again after
+applying that scale.
+"""
+
+import numpy as np
+from scipy import optimize
+
+import profiling
+
+
+BATCH_SIZE = 256  # Spectra correlated in one FFT pass
+MAX_SCALE = 0.02  # Relative scale error searched unless max_shift is given
+
+
+def reference_grid(ref, npoints=None):
+    """
+    Returns uniform grid over the reference X range of npoints, the number
+    of reference points by default
+    """
+    npoints = npoints or len(ref)
+    return np.linspace(ref.x[0], ref.x[-1], npoints)
+
+
+def _resample(spectra, grid):
+    """Returns array of Y of the spectra linearly interpolated to the grid,
+    one row per spectrum, with mean values subtracted"""
+    rows = np.empty((len(spectra), len(grid)))
+    x0 = spectra[0].x
+    if all(len(s.x) == len(x0) and np.array_equal(s.x, x0) for s in spectra):
+        # The same interpolation weights apply to all spectra
+        i = np.clip(np.searchsorted(x0, grid), 1, len(x0) - 1)
+        w = np.clip((grid - x0[i - 1]) / (x0[i] - x0[i - 1]), 0, 1)
+        ys = np.array([s.y for s in spectra])
+        rows[:] = ys[:, i - 1] * (1 - w) + ys[:, i] * w
+    else:
+        for row, spdata in zip(rows, spectra):
+            row[:] = np.interp(grid, spdata.x, spdata.y)
+    rows -= rows.mean(axis=1)[:, np.newaxis]
+    return rows
+
+
+def correlation_lags(rows, ref_row, max_lag=None, maxima=False):
+    """
+    Returns sub-sample lags of the maxima of cross-correlations of the rows
+    with the reference row, computed in one FFT pass. A positive lag means
+    the row is the reference delayed by lag samples. Lags are searched
+    within max_lag samples if it is given. With maxima=True returns
+    (lags, maxima), the correlation maxima refined as the lags are.
+    """
+    n = rows.shape[1]
+    nfft = 1 << int(np.ceil(np.log2(2 * n - 1)))
+    spectrum = np.fft.rfft(rows, nfft, axis=1)
+    spectrum *= np.conj(np.fft.rfft(ref_row, nfft))
+    corr = np.fft.irfft(spectrum, nfft, axis=1)
+    # Lags -(n - 1) .. n - 1 in order
+    corr = np.concatenate((corr[:, nfft - n + 1:], corr[:, :n]), axis=1)
+    lags = np.arange(-(n - 1), n)
+    if max_lag is not None:
+        keep = np.abs(lags) <= max_lag
+        corr, lags = corr[:, keep], lags[keep]
+    rows_index = np.arange(len(corr))
+    imax = np.argmax(corr, axis=1)
+    # Maxima at the ends of the lag range are not refined
+    i = np.clip(imax, 1, corr.shape[1] - 2)
+    c0 = corr[rows_index, i - 1]
+    c1 = corr[rows_index, i]
+    c2 = corr[rows_index, i + 1]
+    curvature = c0 - 2 * c1 + c2
+    inner = (i == imax) & (curvature < 0)
+    offset = np.zeros(len(corr))
+    offset[inner] = 0.5 * (c0 - c2)[inner] / curvature[inner]
+    if maxima:
+        return lags[imax] + offset, c1 - 0.25 * (c0 - c2) * offset
+    return lags[imax] + offset
+
+
+def _lags(spectra, grid, ref_row, max_lag):
+    """Returns lags of the spectra correlated in batches of BATCH_SIZE"""
+    lags = np.empty(len(spectra))
+    for start in range(0, len(spectra), BATCH_SIZE):
+        batch = spectra[start:start + BATCH_SIZE]
+        lags[start:start + len(batch)] = correlation_lags(
+            _resample(batch, grid), ref_row, max_lag)
+    return lags
+
+
+def _correlation(spdata, grid, ref_row, scale, shift):
+    """Returns correlation of the spectrum aligned by the scale and the
+    shift with the normalized reference row, normalized"""
+    row = _resample([spdata.shift_x(-shift, 1 / scale)], grid)[0]
+    norm = np.linalg.norm(row)
+    return np.dot(row, ref_row) / norm if norm > 0 else 0.0
+
+
+def _scale(spdata, grid, ref_row, max_scale, max_lag):
+    """
+    Returns scale of the spectrum relative to the reference resampled to
+    the grid as ref_row, the normalized reference row, see the module
+    description
+    """
+    step = grid[1] - grid[0]
+    scale_step = 2 * step / (grid[-1] - grid[0])
+    count = max(1, int(np.ceil(np.log1p(max_scale) / scale_step)))
+    scales = np.exp(np.arange(-count, count + 1) * scale_step)
+    rows = _resample([spdata.shift_x(0, 1 / k) for k in scales], grid)
+    rows /= np.maximum(np.linalg.norm(rows, axis=1), 1e-300)[:, np.newaxis]
+    lags, maxima = correlation_lags(rows, ref_row, max_lag, maxima=True)
+    best = np.argmax(maxima)
+    # Joint refinement, the scale in steps moving the range ends by one
+    # grid step and the shift in grid steps
+    start = (np.log(scales[best]) / scale_step, lags[best])
+    result = optimize.minimize(
+        lambda p: -_correlation(spdata, grid, ref_row,
+                                np.exp(p[0] * scale_step), p[1] * step),
+        start, method='Nelder-Mead', options={'xatol': 1e-3, 'fatol': 1e-12})
+    return float(np.exp(np.clip(result.x[0], -count, count) * scale_step))
+
+
+@profiling.timed('align')
+def estimate_shifts(spectra, ref, max_shift=None, scale=False, npoints=None):
+    """
+    Returns arrays of shifts and scales of the spectra relative to the
+    reference, see the module description. Shifts larger than max_shift
+    (and scales farther from 1 than max_shift relative to the X range
+    middle) are not searched. Scales are all 1 unless scale=True.
+    """
+    spectra = list(spectra)
+    scales = np.ones(len(spectra))
+    if not spectra:
+        return np.zeros(0), scales
+    grid = reference_grid(ref, npoints)
+    step = grid[1] - grid[0]
+    max_lag = None if max_shift is None else max_shift / step
+    ref_row = _resample([ref], grid)[0]
+    if scale:
+        max_scale = MAX_SCALE
+        if max_shift is not None:
+            max_scale = max_shift / (0.5 * (ref.x[0] + ref.x[-1]))
+        ref_row = ref_row / np.linalg.norm(ref_row)
+        scales = np.array([_scale(s, grid, ref_row, max_scale, max_lag)
+                           for s in spectra])
+        spectra = [s.shift_x(0, 1 / k) for (s, k) in zip(spectra, scales)]
+    return _lags(spectra, grid, ref_row, max_lag) * step, scales
+
+
+def estimate_shift(spdata, ref, max_shift=None, scale=False, npoints=None):
+    """
+    Returns (shift, scale) of the spectrum relative to the reference, see
+    estimate_shifts
+    """
+    shifts, scales = estimate_shifts([spdata], ref, max_shift, scale, npoints)
+    return shifts[0], scales[0]
+
+
+def align(spectra, ref, max_shift=None, scale=False, npoints=None):
+    """
+    Returns the list of spectra aligned to the reference, X arrays being
+    shifted and scaled. The corrections are recorded in provenance.
+    """
+    shifts, scales = estimate_shifts(spectra, ref, max_shift, scale, npoints)
+    return [spdata.shift_x(-shift, 1 / k)
+            for (spdata, shift, k) in zip(spectra, shifts, scales)]
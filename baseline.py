@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Baseline (background) estimation of spectra.
+
+Methods, each taking time linear in the number of points for the given
+parameters:
+
+als         asymmetric least squares smoothing (Eilers and Boelens): the
+            pentadiagonal system is solved by banded Cholesky decomposition
+poly        iterative polynomial fit, points above the fit being clipped
+rollingball morphological opening of Y with a flat element followed by
+            moving average smoothing
+snip        statistics-sensitive non-linear iterative peak clipping
+
+Baselines are cached per spectrum data and method parameters.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from scipy import linalg
+from scipy import ndimage
+
+import spectrum as sp
+import profiling
+
+
+CACHE_SIZE = 64  # Baselines kept in memory
+
+
+def als(x, y, lam=1e5, p=0.01, niter=10):
+    """
+    Asymmetric least squares baseline: smooth Z minimizing
+    sum(w (y - z)**2) + lam * sum((second difference of z)**2), where the
+    weights are p above the baseline and 1 - p below it.
+    """
+    n = len(y)
+    if n < 3:
+        return np.array(y, dtype=float)
+    # Upper banded form of lam * D'D, D being the second difference matrix
+    ab = np.zeros((3, n))
+    ab[0, 2:] = lam
+    ab[1, 1:] = -4 * lam
+    ab[1, 1], ab[1, -1] = -2 * lam, -2 * lam
+    ab[2, :] = 6 * lam
+    ab[2, 0], ab[2, -1] = lam, lam
+    ab[2, 1], ab[2, -2] = 5 * lam, 5 * lam
+    if n == 3:
+        ab[2, 1] = 4 * lam
+    w = np.ones(n)
+    z = y
+    for _ in range(int(niter)):
+        system = ab.copy()
+        system[2] += w
+        z = linalg.solveh_banded(system, w * y, check_finite=False)
+        w_new = np.where(y > z, p, 1 - p)
+        if np.array_equal(w_new, w):
+            break
+        w = w_new
+    return z
+
+
+def poly(x, y, degree=3, niter=100, tol=1e-3):
+    """
+    Iterative polynomial baseline: the polynomial of degree is fitted to Y,
+    Y above the fit is replaced with the fit, and so on until the fit
+    changes by less than tol relative to the previous one.
+    """
+    # X is scaled to [-1, 1] for the fit to be well conditioned
+    span = (x[-1] - x[0]) or 1.0
+    t = 2 * (np.asarray(x, dtype=float) - x[0]) / span - 1
+    clipped = np.array(y, dtype=float)
+    fit = clipped
+    for _ in range(int(niter)):
+        coefs = np.polynomial.polynomial.polyfit(t, clipped, int(degree))
+        fit_new = np.polynomial.polynomial.polyval(t, coefs)
+        np.minimum(clipped, fit_new, out=clipped)
+        change = np.linalg.norm(fit_new - fit) / (np.linalg.norm(fit) or 1.0)
+        fit = fit_new
+        if change < tol:
+            break
+    return fit
+
+
+def rollingball(x, y, radius=50, smooth=None):
+    """
+    Rolling ball baseline: minimum then maximum filters of 2 * radius + 1
+    points (grey opening) take peaks narrower than the ball away, moving
+    average of smooth points (radius by default) rounds the corners.
+    """
+    size = 2 * int(radius) + 1
+    opened = ndimage.maximum_filter1d(
+        ndimage.minimum_filter1d(y, size, mode='nearest'), size, mode='nearest')
+    smooth = int(radius if smooth is None else smooth)
+    if smooth > 1:
+        opened = ndimage.uniform_filter1d(opened, smooth, mode='nearest')
+    return np.minimum(opened, y)
+
+
+def snip(x, y, iterations=40, lls=True, decreasing=False):
+    """
+    SNIP baseline: for window half widths p = 1 .. iterations every point is
+    clipped to the mean of the points p away if that is lower. With lls=True
+    Y is taken through log-log-square root transform first, which flattens
+    peaks of very different heights. With decreasing=True the half widths go
+    from the largest to 1.
+    """
+    y = np.asarray(y, dtype=float)
+    offset = 0.0
+    v = y
+    if lls:
+        offset = min(np.min(y), 0.0)
+        v = np.log(np.log(np.sqrt(y - offset + 1) + 1) + 1)
+    v = v.copy()
+    iterations = min(int(iterations), (len(v) - 1) // 2)
+    widths = range(1, iterations + 1)
+    if decreasing:
+        widths = reversed(widths)
+    for p in widths:
+        mean = 0.5 * (v[:-2 * p] + v[2 * p:])
+        np.minimum(v[p:-p], mean, out=v[p:-p])
+    if lls:
+        v = (np.exp(np.exp(v) - 1) - 1) ** 2 - 1 + offset
+    return v
+
+
+# Method name: (function, default parameters)
+METHODS = OrderedDict([('als', (als, {'lam': 1e5, 'p': 0.01, 'niter': 10})),
+                       ('poly', (poly, {'degree': 3, 'niter': 100,
+                                        'tol': 1e-3})),
+                       ('rollingball', (rollingball, {'radius': 50,
+                                                      'smooth': None})),
+                       ('snip', (snip, {'iterations': 40, 'lls': True,
+                                        'decreasing': False}))])
+
+_cache = OrderedDict()
+
+
+def method_params(method, params=None):
+    """
+    Returns full parameters dict of the method, defaults updated with params,
+    or raises ValueError for unknown methods or parameters
+    """
+    if method not in METHODS:
+        raise ValueError("Unsupported baseline method: '" + method + "'")
+    full = dict(METHODS[method][1])
+    for name, value in (params or {}).items():
+        if name not in full:
+            raise ValueError("Unknown parameter of {0}: '{1}'".format(method,
+                                                                     name))
+        full[name] = value
+    return full
+
+
+def parse_params(text):
+    """
+    Returns parameters dict from 'name=value,name=value' string, values being
+    numbers, True, False or None
+    """
+    constants = {'True': True, 'False': False, 'None': None}
+    params = {}
+    if text:
+        for item in text.split(','):
+            name, value = item.split('=', 1)
+            value = value.strip()
+            params[name.strip()] = constants[value] if value in constants \
+                else float(value)
+    return params
+
+
+def describe(method, params=None):
+    """Returns text description of the method and its parameters"""
+    full = method_params(method, params)
+    return '%s, %s' % (method, ', '.join('%s=%s' % kv
+                                         for kv in sorted(full.items())))
+
+
+@profiling.timed('baseline')
+def estimate(spdata, method='als', params=None):
+    """
+    Returns baseline Y array of the spectrum found by the method with the
+    parameters (see METHODS for the defaults). Results are cached per data
+    and parameters, the last CACHE_SIZE ones being kept.
+    """
+    full = method_params(method, params)
+    digest = hashlib.sha1(spdata.x.tobytes())
+    digest.update(spdata.y.tobytes())
+    key = (method, tuple(sorted(full.items())), digest.hexdigest())
+    if key in _cache:
+        _cache.move_to_end(key)
+        profiling.PROFILER.count('baseline cache hits')
+        return _cache[key]
+    baseline = METHODS[method][0](spdata.x, spdata.y, **full)
+    baseline.flags.writeable = False  # Cached arrays are shared
+    _cache[key] = baseline
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return baseline
+
+
+def baseline_spectrum(spdata, method='als', params=None):
+    """Returns the baseline of the spectrum as Spectrum"""
+    headers = spdata.headers.copy()
+    headers['baseline'] = describe(method, params)
+    return sp.Spectrum(spdata.x, estimate(spdata, method, params), headers,
+                       presorted=True, provenance=spdata.provenance)
+
+
+def subtract(spdata, method='als', params=None):
+    """Returns the spectrum with the baseline subtracted"""
+    provenance = spdata.provenance + (('baseline_subtracted',
+                                       describe(method, params)),)
+    return sp.Spectrum(spdata.x, spdata.y - estimate(spdata, method, params),
+                       spdata.headers.copy(), copy=False, presorted=True,
+                       provenance=provenance)
+
+
+def baseline_stage(spdata, method='als', params=None):
+    """Pipeline stage subtracting the baseline, see
+    pipeline.stages_from_argv"""
+    if len(spdata) == 0:
+        return spdata
+    return subtract(spdata, method, params)
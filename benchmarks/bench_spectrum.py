@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# Benchmarks of the spectrum module hot paths on synthetic data.
+#
+# Every case is timed for every size, the best of several runs is kept.
+# Results can be saved as a baseline and later runs compared to it, so that
+# slowdowns between versions are visible:
+#
+#   bench_spectrum.py --save baseline.json
+#   bench_spectrum.py --compare baseline.json
+#
+# --float32 runs the cases with Y stored as float32, and compared to a
+# baseline saved without it shows the gain of the reduced precision.
+
+import sys
+import os
+import json
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import pipeline
+
+
+SIZES = [1000, 10000, 100000, 1000000, 10000000]
+MIN_TIME = 0.2  # seconds of repeated runs per case and size
+MAX_TIME = 10.0  # larger sizes are skipped once a single run is that long
+SLOWDOWN = 1.2  # ratio to the baseline reported as a regression
+# Points and count of spectra of the memory cases: small ones per pixel of
+# a map, where headers weigh, and long ones, where data does
+MEMORY_SIZES = [(16, 100000), (100000, 20)]
+
+
+def make_xy(n, step=0.001, x0=1.0, seed=0):
+    """Returns x and y arrays of a noisy spectrum with two peaks on a
+    uniform grid"""
+    rng = np.random.RandomState(seed)
+    x = x0 + step * np.arange(n)
+    xc = x0 + step * n * np.array([0.3, 0.7])
+    width = step * n * 0.05
+    y = (100 + 1000 * np.exp(-(x - xc[0]) ** 2 / (2 * width ** 2)) +
+         500 * np.exp(-(x - xc[1]) ** 2 / (2 * width ** 2)) +
+         rng.normal(0, 5, n))
+    return x, y
+
+
+def make_spectrum(n, **kwargs):
+    """Returns synthetic spectrum of n points"""
+    x, y = make_xy(n, **kwargs)
+    return sp.Spectrum(x, y, {'filepath': 'synthetic_%d' % n})
+
+
+def make_file(n, tmpdir):
+    """Writes synthetic spectrum of n points to a file and returns the path"""
+    path = os.path.join(tmpdir, 'synthetic_%d.txt' % n)
+    if not os.path.exists(path):
+        with open(path, 'w') as datafile:
+            datafile.write(str(make_spectrum(n)))
+    return path
+
+
+# Case name: function of (size, temporary directory) returning the callable
+# to time. Preparations done in the function are not timed.
+
+def case_from_file(n, tmpdir):
+    path = make_file(n, tmpdir)
+    return lambda: sp.spectrum_from_file(path)
+
+
+def case_init_sorted(n, tmpdir):
+    x, y = make_xy(n)
+    return lambda: sp.Spectrum(x, y)
+
+
+def case_init_unsorted(n, tmpdir):
+    x, y = make_xy(n)
+    order = np.random.RandomState(1).permutation(n)
+    x, y = x[order], y[order]
+    return lambda: sp.Spectrum(x, y)
+
+
+def case_arithmetic_same_grid(n, tmpdir):
+    sp1, sp2 = make_spectrum(n), make_spectrum(n, seed=1)
+    return lambda: sp1 - sp2
+
+
+def case_arithmetic_other_grid(n, tmpdir):
+    sp1 = make_spectrum(n)
+    sp2 = make_spectrum(n, step=0.001 * 1.0001, x0=0.9995, seed=1)
+    return lambda: sp1 - sp2
+
+
+def case_arithmetic_number(n, tmpdir):
+    sp1 = make_spectrum(n)
+    return lambda: sp1 * 2.0
+
+
+def case_merge(n, tmpdir):
+    x, y = make_xy(n)
+    sp2 = sp.Spectrum(x + 0.001 * n / 2, y)
+
+    def merge():
+        sp1 = sp.Spectrum(x, y)
+        sp1.merge(sp2)
+    return merge
+
+
+def case_xfilter(n, tmpdir):
+    spdata = make_spectrum(n)
+    xl, xr = spdata.x[n // 4], spdata.x[3 * n // 4]
+    return lambda: spdata.xfilter(xl, xr)
+
+
+def case_area(n, tmpdir):
+    spdata = make_spectrum(n)
+    return spdata.area
+
+
+def case_deduplicate(n, tmpdir):
+    x, y = make_xy(n)
+    x = np.round(x, 2)  # Many duplicates
+
+    def deduplicate():
+        sp.Spectrum(x, y, presorted=True).deduplicate()
+    return deduplicate
+
+
+def case_y_shift(n, tmpdir):
+    spdata = make_spectrum(n)
+    return spdata.y_shift
+
+
+def case_ary_deriv(n, tmpdir):
+    x, y = make_xy(n)
+    return lambda: sp.ary_deriv(x, y)
+
+
+def case_despike(n, tmpdir):
+    spdata = make_spectrum(n)
+    return spdata.despike
+
+
+def case_str(n, tmpdir):
+    spdata = make_spectrum(n)
+    return spdata.__str__
+
+
+CASES = [('spectrum_from_file', case_from_file),
+         ('init_sorted', case_init_sorted),
+         ('init_unsorted', case_init_unsorted),
+         ('arithmetic_same_grid', case_arithmetic_same_grid),
+         ('arithmetic_other_grid', case_arithmetic_other_grid),
+         ('arithmetic_number', case_arithmetic_number),
+         ('merge', case_merge),
+         ('xfilter', case_xfilter),
+         ('area', case_area),
+         ('deduplicate', case_deduplicate),
+         ('y_shift', case_y_shift),
+         ('ary_deriv', case_ary_deriv),
+         ('despike', case_despike),
+         ('str', case_str)]
+
+
+def time_call(func, min_time=MIN_TIME):
+    """Returns the best time of func runs repeated for at least min_time
+    seconds"""
+    best = None
+    total = 0.0
+    while total < min_time:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(cases, sizes, max_time=MAX_TIME):
+    """Returns dict {case: {size: seconds or None if skipped}}"""
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix='bench_spectrum_')
+    try:
+        for name, make_case in cases:
+            results[name] = {}
+            skip = False
+            for n in sizes:
+                if skip:
+                    results[name][str(n)] = None
+                    print("%-24s %10d  skipped" % (name, n))
+                    continue
+                seconds = time_call(make_case(n, tmpdir))
+                results[name][str(n)] = seconds
+                print("%-24s %10d  %12.6f s" % (name, n, seconds))
+                sys.stdout.flush()
+                # Sizes grow tenfold, so a slow run predicts a too slow next one
+                skip = seconds * 10 > max_time
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def measure_memory(npoints=16, count=100000, results=None):
+    """Returns dict {case: {size: bytes per instance}} of many spectra made
+    from one, as per-pixel spectra of a map are, updating results if given"""
+    x, y = make_xy(npoints)
+    base = sp.Spectrum(x, y, {'filepath': 'synthetic_%d' % npoints,
+                              'T': '10K', 'sample': 'A12'})
+    xl, xr = x[npoints // 4], x[3 * npoints // 4]
+    headers = dict(base.headers.items())
+    cases = [('memory_construct', lambda: sp.Spectrum(x, y, headers)),
+             ('memory_number_arithmetic', lambda: base * 2.0),
+             ('memory_chained_arithmetic', lambda: (base * 2.0) + 1.0),
+             ('memory_xfilter', lambda: base.xfilter(xl, xr))]
+    results = {} if results is None else results
+    for name, make in cases:
+        tracemalloc.start()
+        keep = [make() for _ in range(count)]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del keep
+        results.setdefault(name, {})[str(npoints)] = size / count
+        print("%-24s %10d  %12.0f bytes" % (name, npoints, size / count))
+    return results
+
+
+def compare(results, baseline, slowdown=SLOWDOWN):
+    """Prints time ratios to the baseline and returns the number of cases
+    slower than the baseline by more than the slowdown factor"""
+    regressions = 0
+    print("\n%-24s %10s  %8s" % ("case", "size", "ratio"))
+    for name in sorted(results):
+        for n, seconds in sorted(results[name].items(), key=lambda kv: int(kv[0])):
+            base = baseline.get(name, {}).get(n)
+            if seconds is None or base is None:
+                continue
+            ratio = seconds / base
+            mark = ""
+            if ratio > slowdown:
+                mark = "  SLOWER"
+                regressions += 1
+            print("%-24s %10s  %8.2f%s" % (name, n, ratio, mark))
+    return regressions
+
+
+if __name__ == '__main__':
+    usage = """usage: {0} [--sizes 1e3,1e4,...] [--cases name1,name2,...]
+          [--max-time seconds] [--memory] [--float32] [--save results.json]
+          [--compare baseline.json]
+cases: {1}
+--memory also measures bytes per instance of small and long derived spectra
+--float32 stores Y as float32"""
+    sizes = pipeline.pop_option(sys.argv, '--sizes')
+    names = pipeline.pop_option(sys.argv, '--cases')
+    max_time = float(pipeline.pop_option(sys.argv, '--max-time', MAX_TIME))
+    save_path = pipeline.pop_option(sys.argv, '--save')
+    baseline_path = pipeline.pop_option(sys.argv, '--compare')
+    memory = pipeline.pop_flag(sys.argv, '--memory')
+    if pipeline.pop_flag(sys.argv, '--float32'):
+        sp.set_dtype('float32')
+    if len(sys.argv) > 1:
+        print(usage.format(os.path.basename(sys.argv[0]),
+                           ', '.join(name for name, _ in CASES)))
+        sys.exit(0)
+
+    sizes = SIZES if sizes is None else [int(float(s)) for s in sizes.split(',')]
+    cases = CASES
+    if names is not None:
+        cases = [case for case in CASES if case[0] in names.split(',')]
+
+    results = run(cases, sizes, max_time)
+    if memory:
+        for (npoints, count) in MEMORY_SIZES:
+            measure_memory(npoints, count, results)
+
+    if save_path is not None:
+        record = {'version': sp.__version__,
+                  'python': platform.python_version(),
+                  'numpy': np.__version__,
+                  'dtype': sp.DTYPE.name,
+                  'machine': platform.machine(),
+                  'results': results}
+        with open(save_path, 'w') as save_file:
+            json.dump(record, save_file, indent=1, sort_keys=True)
+
+    if baseline_path is not None:
+        with open(baseline_path, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        print("Baseline: version %s, python %s, numpy %s, %s" % (
+            baseline['version'], baseline['python'], baseline['numpy'],
+            baseline.get('dtype', 'float64')))
+        if compare(results, baseline['results']):
+            sys.exit(1)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Out-of-core processing of spectra larger than memory.
+
+Spectra are stored as .npy files of n x 2 (X, Y) float arrays, or of n
+(x, y) records of float64 X and float32 Y when sp.DTYPE is float32, which
+are memory-mapped and processed in chunks of a fixed number of points, so the
+peak memory does not depend on the spectrum length. Headers and provenance
+are kept in a JSON file next to the data (HEADERS_SUFFIX).
+
+Operations reading neighbours of a point (Savitzky-Golay filter, area)
+read chunks with an overlap, so their results coincide with ones for the
+whole spectrum in memory. Areas are summed in float64 whatever the storage
+type is.
+"""
+
+import bisect
+import json
+import os
+
+import numpy as np
+from numpy.lib import format as npformat
+from scipy import interpolate
+from scipy import signal
+
+import spectrum as sp
+import profiling
+import readers
+
+
+CHUNK_POINTS = 1 << 20  # Points processed at once
+HEADERS_SUFFIX = '.headers.json'
+
+
+def _parse_xy(line):
+    """Returns (x, y) of a data line or None for a header line"""
+    try:
+        xy = line.replace(",", ".").split()
+        return float(xy[0]), float(xy[1])
+    except (ValueError, IndexError):
+        return None
+
+
+def storage_type(ytype):
+    """Returns (dtype, row shape) of the storage of Y of ytype: n x 2 floats
+    for float64, (x, y) records keeping X float64 for others"""
+    if np.dtype(ytype) == np.dtype(float):
+        return np.dtype(float), (2,)
+    return np.dtype([('x', float), ('y', ytype)]), ()
+
+
+def columns(data):
+    """Returns X and Y views of the storage array or of its chunk"""
+    if data.dtype.names:
+        return data['x'], data['y']
+    return data[:, 0], data[:, 1]
+
+
+def open_storage(filepath, length, ytype):
+    """Returns new memory-mapped storage array of length points of Y of
+    ytype"""
+    dtype, row = storage_type(ytype)
+    return npformat.open_memmap(filepath, mode='w+', dtype=dtype,
+                                shape=(length,) + row)
+
+
+class ChunkedSpectrum(object):
+    """
+    Spectrum stored in a .npy file and processed by chunks
+
+    ChunkedSpectrum(filepath, chunk_size=CHUNK_POINTS)
+
+    X must be sorted in ascending order. Operations write their results to
+    new files and return ChunkedSpectrum instances of them.
+    """
+    __op_headers = {'__add__':     'added_to',
+                    '__sub__':     'subtracted',
+                    '__mul__':     'multiplied_by',
+                    '__truediv__': 'divided_by'}
+
+    def __init__(self, filepath, chunk_size=CHUNK_POINTS):
+        self.filepath = filepath
+        self.chunk_size = int(chunk_size)
+        self.data = np.load(filepath, mmap_mode='r')
+        if self.data.dtype.names:
+            if self.data.ndim != 1 or self.data.dtype.names != ('x', 'y'):
+                raise ValueError("Not (x, y) records: " + filepath)
+        elif self.data.ndim != 2 or self.data.shape[1] != 2:
+            raise ValueError("Not n x 2 (X, Y) array: " + filepath)
+        self.x, self.y = columns(self.data)
+        self.headers, self.provenance = read_headers(filepath)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def index_of(self, xv):
+        """
+        Returns the index of X point nearest to xv. Binary search reads only
+        the pages of the points it visits, numpy.searchsorted would copy X.
+        """
+        i = bisect.bisect_left(self.x, xv)
+        if i == len(self) or (i > 0 and xv - self.x[i - 1] <= self.x[i] - xv):
+            return i - 1
+        return i
+
+    def _xrange(self, xl=None, xr=None):
+        """
+        Returns index range [lpos, rpos) of X interval from xl to xr, see
+        Spectrum._xrange
+        """
+        lpos, rpos = 0, len(self)
+        if xl is not None and xl > self.x[0]:
+            lpos = self.index_of(xl)
+        if xr is not None and xr < self.x[-1]:
+            rpos = self.index_of(xr)
+        return lpos, rpos
+
+    def chunks(self, lpos=0, rpos=None, overlap=0):
+        """
+        Yields (start, stop, chunk) for index ranges [start, stop) covering
+        [lpos, rpos). The chunk is the storage array (see columns) of the
+        range extended by up to overlap points on both sides, clipped to
+        [lpos, rpos).
+        """
+        rpos = len(self) if rpos is None else rpos
+        for start in range(lpos, rpos, self.chunk_size):
+            stop = min(start + self.chunk_size, rpos)
+            profiling.PROFILER.count('chunks read')
+            yield start, stop, np.array(self.data[max(start - overlap, lpos):
+                                                  min(stop + overlap, rpos)])
+
+    def _output(self, filepath, length, provenance):
+        """Returns memory-mapped output array of the type of this one with
+        headers written"""
+        write_headers(filepath, self.headers, provenance)
+        return open_storage(filepath, length, self.y.dtype)
+
+    @profiling.timed('filter')
+    def xfilter(self, filepath, xl=None, xr=None):
+        """
+        Write X interval from xl to xr to the file
+        """
+        lpos, rpos = self._xrange(xl, xr)
+        out = self._output(filepath, rpos - lpos, self.provenance)
+        for start, stop, chunk in self.chunks(lpos, rpos):
+            out[start - lpos:stop - lpos] = chunk
+        out.flush()
+        del out
+        return ChunkedSpectrum(filepath, self.chunk_size)
+
+    @profiling.timed('filter')
+    def savgol(self, filepath, window_size, poly_order):
+        """
+        Write Y smoothed with Savitzky-Golay filter to the file. Chunks
+        overlap by the window, and the spectrum ends are fitted as
+        scipy.signal.savgol_filter does for the whole array.
+        """
+        if window_size > self.chunk_size:
+            raise ValueError("Window is larger than the chunk size")
+        provenance = self.provenance + (
+            ('filter', 'savgol, %d, %d' % (window_size, poly_order)),)
+        out = self._output(filepath, len(self), provenance)
+        out_x, out_y = columns(out)
+        # Half of the window is enough for the inner points, the full one
+        # keeps the last chunk longer than the window
+        for start, stop, chunk in self.chunks(overlap=window_size):
+            left = start - max(start - window_size, 0)
+            x, y = columns(chunk)
+            y = signal.savgol_filter(y, window_size, poly_order)
+            out_x[start:stop] = x[left:left + stop - start]
+            out_y[start:stop] = y[left:left + stop - start]
+        out.flush()
+        del out
+        return ChunkedSpectrum(filepath, self.chunk_size)
+
+    @profiling.timed('arithmetic')
+    def arithmetic(self, filepath, other, method):
+        """
+        Write the result of the arithmetic operation (a Spectrum method name,
+        e.g. '__sub__') with a number or a reference Spectrum to the file.
+        The reference is interpolated with spline of SPLINE_ORDER where X
+        points differ, and only the overlap of X ranges is kept.
+        """
+        op_header = self.__op_headers[method]
+        if isinstance(other, (int, float)):
+            lpos, rpos = 0, len(self)
+            provenance = self.provenance + ((op_header, str(other)),)
+        else:
+            # Nearest points found outside of the reference X are not kept
+            lpos = bisect.bisect_left(self.x, other.x[0])
+            rpos = bisect.bisect_right(self.x, other.x[-1])
+            if rpos <= lpos:
+                raise ValueError("X ranges do not overlap")
+            provenance = self.provenance + (
+                (op_header, other.headers.get('filepath', 'spectrum')),)
+            spline = None
+
+        out = self._output(filepath, rpos - lpos, provenance)
+        out_x, out_y = columns(out)
+        for start, stop, chunk in self.chunks(lpos, rpos):
+            x, y = columns(chunk)
+            if isinstance(other, (int, float)):
+                operand = other
+            else:
+                # Reference points at the same X are taken as they are
+                i = np.clip(np.searchsorted(other.x, x), 0, len(other) - 1)
+                operand = other.y[i]
+                differ = other.x[i] != x
+                if differ.any():
+                    if spline is None:
+                        with profiling.PROFILER.timer('interpolation'):
+                            spline = interpolate.interp1d(other.x, other.y,
+                                                          sp.SPLINE_ORDER)
+                    operand[differ] = spline(x[differ])
+            out_x[start - lpos:stop - lpos] = x
+            out_y[start - lpos:stop - lpos] = getattr(y, method)(operand)
+        out.flush()
+        del out
+        return ChunkedSpectrum(filepath, self.chunk_size)
+
+    def area(self, xl=None, xr=None):
+        """
+        Area under the Y curve in X range [xl, xr]. Chunks overlap by one
+        point so that no interval between points is lost.
+        """
+        lpos, rpos = self._xrange(xl, xr)
+        s = 0.0
+        for start, stop, chunk in self.chunks(lpos, rpos, overlap=1):
+            # Intervals from the first point of the chunk to the first point
+            # of the next one, the point before it is dropped
+            x, y = columns(chunk[int(start > lpos):])
+            y = np.asarray(y, dtype=float)
+            s += 0.5 * np.sum((y[1:] + y[:-1]) * np.diff(x))
+        return s
+
+    def to_spectrum(self):
+        """Returns the whole spectrum in memory"""
+        headers = dict(self.headers)
+        headers['filepath'] = self.filepath
+        return sp.Spectrum(self.x, self.y, headers,
+                           presorted=True, provenance=self.provenance)
+
+    @profiling.timed('serialize')
+    def write_text(self, filepath):
+        """
+        Write the spectrum to a text file in the format of Spectrum
+        """
+        with open(filepath, 'w') as text_file:
+            text_file.write(sp.format_headers(
+                self.headers, self.provenance,
+                filepath=os.path.basename(filepath)))
+            text_file.write("\n\n")
+            for start, stop, chunk in self.chunks():
+                np.savetxt(text_file, np.column_stack(columns(chunk)),
+                           fmt='%f', delimiter='\t')
+
+
+def read_headers(filepath):
+    """Returns headers dict and provenance tuple recorded for the file"""
+    try:
+        with open(filepath + HEADERS_SUFFIX, 'r') as headers_file:
+            record = json.load(headers_file)
+    except (IOError, ValueError):
+        return {}, ()
+    return (record.get('headers', {}),
+            tuple(tuple(pair) for pair in record.get('provenance', [])))
+
+
+def write_headers(filepath, headers, provenance=()):
+    """Writes headers and provenance next to the data file"""
+    with open(filepath + HEADERS_SUFFIX, 'w') as headers_file:
+        json.dump({'headers': dict(headers), 'provenance': list(provenance)},
+                  headers_file, indent=1, sort_keys=True)
+
+
+@profiling.timed('load')
+def convert_text(txtpath, filepath, chunk_size=CHUNK_POINTS):
+    """
+    Convert a two-column text file to the .npy storage reading it twice:
+    lines are counted first, then parsed by chunks straight into the
+    memory-mapped array. Descending X is stored reversed, unordered X is
+    not supported. Returns ChunkedSpectrum of the new file.
+    """
+    headers = {}
+    npoints = 0
+    first = last = None
+    ascending = descending = True
+    with open(txtpath, 'r') as datafile:
+        for line in datafile:
+            if line.strip() == '':
+                continue
+            xy = _parse_xy(line)
+            if xy is None:
+                readers.parse_header(line, headers)
+                continue
+            if last is not None:
+                ascending = ascending and xy[0] >= last
+                descending = descending and xy[0] <= last
+            first = xy[0] if first is None else first
+            last = xy[0]
+            npoints += 1
+    if not (ascending or descending):
+        raise ValueError("X is not sorted in " + txtpath)
+    reverse = descending and not ascending
+    headers['filepath'] = txtpath
+
+    write_headers(filepath, headers)
+    out = open_storage(filepath, npoints, sp.DTYPE)
+    pos = 0
+    block = []
+    with open(txtpath, 'r') as datafile:
+        for line in datafile:
+            xy = _parse_xy(line) if line.strip() else None
+            if xy is not None:
+                block.append(xy)
+            if len(block) == chunk_size:
+                pos = _store(out, block, pos, reverse)
+                block = []
+        if block:
+            pos = _store(out, block, pos, reverse)
+    out.flush()
+    del out
+    profiling.PROFILER.count('points loaded', npoints)
+    return ChunkedSpectrum(filepath, chunk_size)
+
+
+def _store(out, block, pos, reverse):
+    """Stores parsed points at pos counted from the start or from the end
+    of the output array, returns the next position"""
+    block = np.array(block, dtype=float)
+    at = pos
+    if reverse:
+        block = block[::-1]
+        at = len(out) - pos - len(block)
+    out_x, out_y = columns(out[at:at + len(block)])
+    out_x[:] = block[:, 0]
+    out_y[:] = block[:, 1]
+    return pos + len(block)
+
+
+def from_spectrum(spdata, filepath, chunk_size=CHUNK_POINTS):
+    """Stores the spectrum in memory to the file, returns ChunkedSpectrum"""
+    write_headers(filepath, spdata.headers, spdata.provenance)
+    dtype, row = storage_type(sp.DTYPE)
+    data = np.empty((len(spdata),) + row, dtype=dtype)
+    x, y = columns(data)
+    x[:], y[:] = spdata.x, spdata.y
+    with open(filepath, 'wb') as npy_file:
+        np.save(npy_file, data)
+    return ChunkedSpectrum(filepath, chunk_size)
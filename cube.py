@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Spectral cubes: spectra of all pixels of a spatial map on one X grid.
+
+Data is kept as a 2D array of pixels x X points, so operations on spectra
+(subtraction of a background, Savitzky-Golay smoothing, X range cuts,
+areas and peak positions) are made at once for all pixels. Results over
+pixels are maps, i.e. arrays of the cube map shape.
+
+A cube is read either from a set of two-column files, one per pixel, or
+from one matrix file whose first numeric row is X and the other rows are
+pixel spectra preceded by the pixel coordinates. The Y columns of a
+multi-column file (channels, polarizations, repeats) are read as a cube
+too, and written back as columns.
+"""
+
+import os
+import re
+
+import numpy as np
+from scipy import interpolate
+from scipy import signal
+
+import spectrum as sp
+import pipeline
+import profiling
+import readers
+
+
+# Pixel coordinates in a file name, e.g. map_x10.5_y-3.txt or map_X=1_Y=2
+COORDS = re.compile(r'x[_=]?([-+]?\d+(?:\.\d*)?).*?y[_=]?([-+]?\d+(?:\.\d*)?)',
+                    flags=re.IGNORECASE)
+
+
+class SpectralCube(object):
+    """
+    Spectra of the map pixels sharing X
+
+    SpectralCube(x, data, headers=None, shape=None, coords=None, paths=None,
+                 provenance=(), names=None)
+
+    x       sorted X array of n points
+    data    array of npix x n Y values, stored as sp.DTYPE
+    shape   map shape, e.g. (rows, columns), (npix,) by default
+    coords  array of npix x 2 pixel (x, y) coordinates or None
+    paths   list of npix source file paths or None
+    names   list of npix column names of a multi-column file or None
+    """
+    __op_headers = {'__add__':     'added_to',
+                    '__sub__':     'subtracted',
+                    '__mul__':     'multiplied_by',
+                    '__truediv__': 'divided_by'}
+
+    def __init__(self, x, data, headers=None, shape=None, coords=None,
+                 paths=None, provenance=(), names=None):
+        x = np.asarray(x, dtype=float)
+        data = np.asarray(data, dtype=sp.DTYPE)
+        if data.ndim != 2 or data.shape[1] != len(x):
+            raise ValueError("Cube data must be of pixels x len(X) shape")
+        if shape is None:
+            shape = (data.shape[0],)
+        if int(np.prod(shape)) != data.shape[0]:
+            raise ValueError("Map shape {0} does not fit {1} pixels".format(
+                shape, data.shape[0]))
+        self.x = x
+        self.data = data
+        if not isinstance(headers, sp.Headers):
+            headers = sp.Headers.wrap(dict(headers or {}))
+        self.headers = headers
+        self.shape = tuple(shape)
+        self.coords = coords
+        self.paths = paths
+        self.provenance = tuple(provenance)
+        self.names = names
+
+    def __len__(self):
+        """Number of pixels"""
+        return self.data.shape[0]
+
+    def __getitem__(self, i):
+        """Returns spectrum of the i-th pixel sharing arrays with the cube"""
+        headers = self.headers.copy()
+        if self.paths is not None:
+            headers['filepath'] = self.paths[i]
+        if self.coords is not None:
+            headers['pixel'] = '%g, %g' % tuple(self.coords[i])
+        if self.names is not None:
+            headers['column'] = self.names[i]
+        return sp.Spectrum(self.x, self.data[i], headers, copy=False,
+                           presorted=True, provenance=self.provenance)
+
+    def _derived(self, x, data, provenance=None):
+        """Returns new cube of the same pixels with other X or Y"""
+        if provenance is None:
+            provenance = self.provenance
+        return SpectralCube(x, data, self.headers.copy(), self.shape,
+                            self.coords, self.paths, provenance, self.names)
+
+    def __add__(self, other):
+        return self.__arithmetic(other, '__add__')
+
+    def __sub__(self, other):
+        return self.__arithmetic(other, '__sub__')
+
+    def __mul__(self, other):
+        return self.__arithmetic(other, '__mul__')
+
+    def __truediv__(self, other):
+        return self.__arithmetic(other, '__truediv__')
+
+    @profiling.timed('cube arithmetic')
+    def __arithmetic(self, other, method):
+        """
+        Arithmetic operation of every pixel with a number, a spectrum or the
+        same pixel of another cube. A spectrum on other X is interpolated
+        with spline of SPLINE_ORDER in the overlap of X ranges, and the cube
+        is cut to the overlap.
+        """
+        op_header = self.__op_headers[method]
+        if isinstance(other, (int, float)):
+            return self._derived(self.x, getattr(self.data, method)(other),
+                                 self.provenance + ((op_header, str(other)),))
+
+        if other.__class__ is SpectralCube:
+            if len(other) != len(self) or not np.array_equal(other.x, self.x):
+                raise ValueError("Cubes must have the same pixels and X")
+            return self._derived(self.x, getattr(self.data, method)(other.data),
+                                 self.provenance + ((op_header, 'cube'),))
+
+        if other.__class__ is not sp.Spectrum:
+            raise TypeError("Not SpectralCube, Spectrum instance or a number")
+        operand = other.headers.get('filepath', 'spectrum')
+        provenance = self.provenance + ((op_header, operand),)
+        if np.array_equal(other.x, self.x):
+            return self._derived(self.x, getattr(self.data, method)(other.y),
+                                 provenance)
+        lpos, rpos = sp.xrange_indices(self.x, other.x[0], other.x[-1])
+        # Nearest points may lie just outside of the other X range
+        lpos += int(self.x[lpos] < other.x[0])
+        rpos -= int(rpos > lpos and self.x[rpos - 1] > other.x[-1])
+        if rpos <= lpos:
+            raise ValueError("X ranges do not overlap")
+        x = self.x[lpos:rpos]
+        with profiling.PROFILER.timer('interpolation'):
+            y = interpolate.interp1d(other.x, other.y, sp.SPLINE_ORDER)(x)
+        return self._derived(x, getattr(self.data[:, lpos:rpos], method)(y),
+                             provenance)
+
+    def xfilter(self, xl=None, xr=None):
+        """
+        Cut X interval from xl to xr, the data being a view of this cube
+        """
+        lpos, rpos = sp.xrange_indices(self.x, xl, xr)
+        if lpos > 0 or rpos < len(self.x):
+            return self._derived(self.x[lpos:rpos], self.data[:, lpos:rpos])
+        return self
+
+    def apply_stages(self, stages):
+        """
+        Returns cube of the pixel spectra passed through the pipeline stages
+        (see pipeline.stages_from_argv) as pixel files are by
+        cube_from_files.
+        Spectra on other X are linearly interpolated to X of the first one.
+        """
+        if not stages or len(self) == 0:
+            return self
+        data = None
+        for i in range(len(self)):
+            spdata = pipeline.apply_stages(self[i], stages)
+            if data is None:
+                x0 = spdata.x
+                data = np.empty((len(self), len(x0)), dtype=sp.DTYPE)
+            if len(spdata) == len(x0) and np.array_equal(spdata.x, x0):
+                data[i] = spdata.y
+            else:
+                data[i] = np.interp(x0, spdata.x, spdata.y)
+        return self._derived(x0, data)
+
+    @profiling.timed('cube filter')
+    def savgol(self, window_size, poly_order):
+        """
+        Returns cube of all pixel spectra smoothed with Savitzky-Golay
+        filter
+        """
+        provenance = self.provenance + (
+            ('filter', 'savgol, %d, %d' % (window_size, poly_order)),)
+        return self._derived(self.x, signal.savgol_filter(
+            self.data, window_size, poly_order, axis=1), provenance)
+
+    def mean(self):
+        """Returns the spectrum averaged over pixels"""
+        headers = self.headers.copy()
+        headers['averaged'] = '%d pixels' % len(self)
+        return sp.Spectrum(self.x, self.data.mean(axis=0, dtype=float), headers,
+                           copy=False, presorted=True,
+                           provenance=self.provenance)
+
+    def to_map(self, values):
+        """Returns the per-pixel values reshaped to the map shape"""
+        return np.asarray(values).reshape(self.shape)
+
+    def area(self, xl=None, xr=None):
+        """
+        Returns the map of areas under pixel spectra in X range [xl, xr],
+        summed in float64
+        """
+        lpos, rpos = sp.xrange_indices(self.x, xl, xr)
+        x, data = self.x[lpos:rpos], self.data[:, lpos:rpos]
+        # Trapezoids weigh the points by half of their X intervals
+        weights = np.zeros(len(x))
+        dx = np.diff(x)
+        weights[1:] += 0.5 * dx
+        weights[:-1] += 0.5 * dx
+        areas = data.dot(weights)
+        return self.to_map(areas)
+
+    def peak_position(self, xl=None, xr=None):
+        """
+        Returns maps of X and Y of the maximum of pixel spectra in X range
+        [xl, xr]. The position is refined between points by the parabola
+        through the maximum and its neighbours.
+        """
+        lpos, rpos = sp.xrange_indices(self.x, xl, xr)
+        x, data = self.x[lpos:rpos], self.data[:, lpos:rpos]
+        rows = np.arange(len(data))
+        imax = np.argmax(data, axis=1)
+        xpeak, ypeak = x[imax], data[rows, imax]
+        if len(x) < 3:
+            return self.to_map(xpeak), self.to_map(ypeak)
+        # Maxima at the range ends are not refined
+        i = np.clip(imax, 1, len(x) - 2)
+        y0, y1, y2 = data[rows, i - 1], data[rows, i], data[rows, i + 1]
+        curvature = y0 - 2 * y1 + y2
+        inner = (imax == i) & (curvature < 0)
+        offset = np.zeros(len(data))
+        offset[inner] = 0.5 * (y0 - y2)[inner] / curvature[inner]
+        step = np.where(offset < 0, x[i] - x[i - 1], x[i + 1] - x[i])
+        xpeak = np.where(inner, x[i] + offset * step, xpeak)
+        ypeak = np.where(inner, y1 - 0.25 * (y0 - y2) * offset, ypeak)
+        return self.to_map(xpeak), self.to_map(ypeak)
+
+    @profiling.timed('serialize')
+    def write(self, filepath):
+        """
+        Write the cube as a matrix file readable by cube_from_matrix: headers,
+        X row and pixel rows with coordinates if they are known
+        """
+        ncoords = 0 if self.coords is None else self.coords.shape[1]
+        with open(filepath, 'w') as cube_file:
+            cube_file.write(sp.format_headers(
+                self.headers, self.provenance, filepath=None,
+                shape=' '.join(str(n) for n in self.shape)))
+            cube_file.write('\n\n' + '\t' * ncoords +
+                            '\t'.join('%f' % xv for xv in self.x) + '\n')
+            table = self.data if ncoords == 0 else \
+                np.column_stack((self.coords, self.data))
+            np.savetxt(cube_file, table, fmt='%f', delimiter='\t')
+
+    def write_columns(self, filepath):
+        """
+        Write the cube as a multi-column file of X and a Y column per pixel,
+        readable by cube_from_columns and, as its first column, by
+        spectrum_from_file
+        """
+        import aggregate
+        names = self.names or ['y%d' % (i + 1) for i in range(len(self))]
+        aggregate.write_columns(filepath, self.x, list(zip(names, self.data)),
+                                self.headers, self.provenance)
+
+
+def file_coords(paths, pattern=COORDS):
+    """
+    Returns array of npix x 2 pixel coordinates found in the file names or
+    None if some file name has no coordinates
+    """
+    coords = []
+    for path in paths:
+        match = pattern.search(os.path.basename(path))
+        if match is None:
+            return None
+        coords.append([float(match.group(1)), float(match.group(2))])
+    return np.array(coords)
+
+
+def grid_order(coords):
+    """
+    Returns the pixel order and the (rows, columns) map shape if the
+    coordinates fill a rectangular grid, otherwise None and None. Rows go
+    along the first coordinate, i.e. X is horizontal on a map.
+    """
+    xs, xpos = np.unique(coords[:, 0], return_inverse=True)
+    ys, ypos = np.unique(coords[:, 1], return_inverse=True)
+    if len(xs) * len(ys) != len(coords):
+        return None, None
+    order = np.lexsort((xpos, ypos))
+    if len(np.unique(ypos * len(xs) + xpos)) != len(coords):
+        return None, None  # Repeated pixels
+    return order, (len(ys), len(xs))
+
+
+def _load(job):
+    """Reads the file and returns its x and y passed through the stages"""
+    path, stages = job
+    spdata = pipeline.apply_stages(sp.spectrum_from_file(path), stages)
+    return spdata.x, spdata.y, spdata.headers
+
+
+@profiling.timed('cube load')
+def cube_from_files(paths, shape=None, stages=(), jobs=None):
+    """
+    Returns SpectralCube of the per-pixel files read in jobs worker
+    processes. Spectra on other X are linearly interpolated to X of the
+    first one.
+
+    Pixels are arranged in a grid if all file names carry coordinates (see
+    COORDS), otherwise they go in the order of paths into the map shape.
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No files for the cube")
+    coords = file_coords(paths)
+    if shape is None and coords is not None:
+        order, grid_shape = grid_order(coords)
+        if order is not None:
+            paths = [paths[i] for i in order]
+            coords = coords[order]
+            shape = grid_shape
+
+    data = None
+    headers = {}
+    jobs_list = [(path, tuple(stages)) for path in paths]
+    for i, (x, y, spheaders) in enumerate(
+            pipeline.parallel_map(_load, jobs_list, jobs=jobs)):
+        if data is None:
+            x0 = x
+            data = np.empty((len(paths), len(x0)), dtype=sp.DTYPE)
+            headers = dict(spheaders.items())
+        if len(x) == len(x0) and np.array_equal(x, x0):
+            data[i] = y
+        else:
+            data[i] = np.interp(x0, x, y)
+    headers['filepath'] = os.path.commonprefix(paths) or paths[0]
+    return SpectralCube(x0, data, headers, shape, coords, paths)
+
+
+@profiling.timed('cube load')
+def cube_from_matrix(filepath):
+    """
+    Returns SpectralCube read from a matrix file. Lines before the first
+    numeric one are headers as in spectrum_from_file. The first numeric row
+    is X, every next row is a pixel spectrum preceded by as many pixel
+    coordinates as it is longer than X row. The map shape is taken from
+    'shape' header or from the grid of coordinates.
+    """
+    headers = {}
+    x = None
+    with open(filepath, 'r') as datafile:
+        for line in datafile:
+            if line.strip() == '':
+                continue
+            try:
+                x = np.array(line.replace(',', '.').split(), dtype=float)
+                break
+            except ValueError:
+                readers.parse_header(line, headers)
+        if x is None:
+            raise ValueError("No X row in " + filepath)
+        table = np.loadtxt([line.replace(',', '.') for line in datafile],
+                           ndmin=2)
+    ncoords = table.shape[1] - len(x)
+    if not 0 <= ncoords <= 2:
+        raise ValueError("Pixel rows do not match X row in " + filepath)
+    coords = table[:, :ncoords] if ncoords == 2 else None
+    data = table[:, ncoords:]
+    if len(x) > 1 and x[0] > x[-1]:
+        x, data = x[::-1], data[:, ::-1]
+
+    shape = None
+    if 'shape' in headers:
+        shape = tuple(int(n) for n in headers.pop('shape').split())
+    elif coords is not None:
+        order, shape = grid_order(coords)
+        if order is not None:
+            coords, data = coords[order], data[order]
+    headers['filepath'] = filepath
+    return SpectralCube(x, data, headers, shape, coords)
+
+
+@profiling.timed('cube load')
+def cube_from_columns(filepath, selection=None):
+    """
+    Returns SpectralCube of the Y columns of a multi-column file sharing X,
+    of the selection only if given (see readers.select_columns)
+    """
+    x, ys, headers = readers.read(filepath)
+    names = readers.column_names(headers, len(ys))
+    if selection is not None:
+        ys, names = readers.select_columns(ys, names, selection)
+    headers.pop('columns', None)
+    if len(x) > 1 and (np.diff(x) < 0).any():
+        order = np.argsort(x, kind='mergesort')
+        x, ys = x[order], ys[:, order]
+    return SpectralCube(x, ys, headers, names=names)
+
+
+def write_map(values, filepath):
+    """Write the map as a tab separated matrix, one map row per line"""
+    values = np.asarray(values)
+    np.savetxt(filepath, values.reshape(values.shape[0], -1), fmt='%g',
+               delimiter='\t')
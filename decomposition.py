@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Decomposition of collections of spectra into components: principal
+component analysis (PCA) and non-negative matrix factorization (NMF).
+
+Spectra are resampled to the common X grid, X of the first spectrum unless
+given, and taken as rows of a matrix. The rows are spooled to a temporary
+memory-mapped file while the spectra are read, and the methods read it by
+blocks of BLOCK_ROWS, so the matrix is never held in memory as a whole:
+
+incremental  PCA updated block by block by SVD of the current components
+             stacked with the block (Ross et al.), one pass over the rows
+randomized   PCA by randomized SVD (Halko et al.), 2 + 2 * power passes
+nmf          NMF by multiplicative updates (Lee and Seung), one pass per
+             iteration; negative values are taken as zeros
+
+The components make a Model, which can be saved and used to denoise
+spectra by reconstruction from the leading components, e.g. by the
+--denoise pipeline stage.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from scipy import optimize
+
+import spectrum as sp
+import profiling
+
+
+METHODS = ('randomized', 'incremental', 'nmf')
+BLOCK_ROWS = 256  # Rows of the spooled matrix read at once
+OVERSAMPLING = 10  # Extra random vectors of the randomized SVD
+POWER_ITERATIONS = 2
+NMF_ITERATIONS = 200
+EPS = 1e-12  # Guards divisions of the multiplicative updates
+SEED = 0  # Random generator seed, results are reproducible
+
+
+def resample(spdata, x):
+    """Returns Y of the spectrum linearly interpolated to x, held at the edge
+    values out of the spectrum X range"""
+    if len(spdata.x) == len(x) and np.array_equal(spdata.x, x):
+        return spdata.y
+    return np.interp(x, spdata.x, spdata.y)
+
+
+class Spool(object):
+    """
+    Rows of spectra on the common grid in a temporary file
+
+    Spool(x=None)
+
+    Use as a context manager, the file is removed on exit.
+    """
+
+    def __init__(self, x=None):
+        self.x = None if x is None else np.asarray(x, dtype=float)
+        self.paths = []
+        self.headers = None
+        self.provenance = ()
+        fd, self._path = tempfile.mkstemp(suffix='.rows')
+        self._file = os.fdopen(fd, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, spdata):
+        """Append the spectrum resampled to the grid"""
+        if self.x is None:
+            self.x = spdata.x.copy()
+        if self.headers is None:
+            self.headers = spdata.headers.copy()
+            self.provenance = spdata.provenance
+        row = np.asarray(resample(spdata, self.x), dtype=float)
+        self._file.write(row.tobytes())
+        self.paths.append(spdata.headers.get('filepath', ''))
+
+    def matrix(self):
+        """Returns read-only memory map of the rows"""
+        self._file.flush()
+        if not self.paths:
+            raise ValueError("No spectra to decompose")
+        return np.memmap(self._path, dtype=float, mode='r',
+                         shape=(len(self.paths), len(self.x)))
+
+    def close(self):
+        self._file.close()
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+
+def blocks(matrix, size=BLOCK_ROWS):
+    """Yields start row and array of the rows of every block"""
+    for start in range(0, matrix.shape[0], size):
+        yield start, np.array(matrix[start:start + size])
+
+
+def column_mean(matrix):
+    """Returns mean of the matrix rows, read by blocks"""
+    total = np.zeros(matrix.shape[1])
+    for (_, block) in blocks(matrix):
+        total += block.sum(axis=0)
+    return total / matrix.shape[0]
+
+
+def _flip_signs(components, scores):
+    """Fix the signs of the singular vectors to the largest loadings being
+    positive, so that results are deterministic"""
+    signs = np.sign(components[np.arange(len(components)),
+                               np.argmax(np.abs(components), axis=1)])
+    signs[signs == 0] = 1
+    return components * signs[:, np.newaxis], scores * signs
+
+
+@profiling.timed('incremental PCA')
+def incremental_pca(matrix, ncomponents):
+    """
+    Returns mean, components, fractions of the variance explained and
+    scores by PCA of the matrix rows updated block by block
+    """
+    nrows, npoints = matrix.shape
+    k = min(ncomponents, nrows, npoints)
+    mean = np.zeros(npoints)
+    m2 = np.zeros(npoints)  # Sums of squared deviations of the columns
+    singular = np.zeros(0)
+    components = np.zeros((0, npoints))
+    seen = 0
+    for (_, block) in blocks(matrix):
+        count = seen + len(block)
+        block_mean = block.mean(axis=0)
+        centered = block - block_mean
+        # The shift of the mean adds a row to the stacked matrix
+        shift = np.sqrt(seen * len(block) / count) * (mean - block_mean)
+        stacked = np.vstack((singular[:, np.newaxis] * components, centered,
+                             shift))
+        _, s, vt = np.linalg.svd(stacked, full_matrices=False)
+        singular, components = s[:k], vt[:k]
+        m2 += (centered ** 2).sum(axis=0) + shift ** 2
+        mean += (block_mean - mean) * len(block) / count
+        seen = count
+    scores = np.empty((nrows, k))
+    for (start, block) in blocks(matrix):
+        scores[start:start + len(block)] = (block - mean).dot(components.T)
+    components, scores = _flip_signs(components, scores)
+    explained = singular ** 2 / m2.sum() if m2.sum() > 0 else np.zeros(k)
+    return mean, components, explained, scores
+
+
+def randomized_svd(matrix, mean, size, power=POWER_ITERATIONS):
+    """
+    Returns U, S, V^T of the rank size randomized SVD of the matrix rows
+    with the mean subtracted and the total squared norm of them
+    """
+    nrows, npoints = matrix.shape
+    rng = np.random.RandomState(SEED)
+
+    def rows_times(basis):
+        product = np.empty((nrows, basis.shape[1]))
+        for (start, block) in blocks(matrix):
+            product[start:start + len(block)] = (block - mean).dot(basis)
+        return product
+
+    def transposed_times(q):
+        product = np.zeros((npoints, q.shape[1]))
+        for (start, block) in blocks(matrix):
+            product += (block - mean).T.dot(q[start:start + len(block)])
+        return product
+
+    total = sum(((block - mean) ** 2).sum() for (_, block) in blocks(matrix))
+    q, _ = np.linalg.qr(rows_times(rng.standard_normal((npoints, size))))
+    for _ in range(power):
+        z, _ = np.linalg.qr(transposed_times(q))
+        q, _ = np.linalg.qr(rows_times(z))
+    # SVD of the projection of the rows to the range found, B = Q^T A
+    u, s, vt = np.linalg.svd(transposed_times(q).T, full_matrices=False)
+    return q.dot(u), s, vt, total
+
+
+@profiling.timed('randomized PCA')
+def randomized_pca(matrix, ncomponents, power=POWER_ITERATIONS,
+                   oversampling=OVERSAMPLING):
+    """
+    Returns mean, components, fractions of the variance explained and
+    scores by randomized SVD of the matrix rows with the mean subtracted
+    """
+    nrows, npoints = matrix.shape
+    k = min(ncomponents, nrows, npoints)
+    mean = column_mean(matrix)
+    u, s, vt, total = randomized_svd(
+        matrix, mean, min(k + oversampling, nrows, npoints), power)
+    components, scores = _flip_signs(vt[:k], u[:, :k] * s[:k])
+    explained = s[:k] ** 2 / total if total > 0 else np.zeros(k)
+    return mean, components, explained, scores
+
+
+def nndsvd(matrix, k):
+    """
+    Returns initial non-negative scores and components by the SVD based
+    initialization of Boutsidis and Gallopoulos, zeros being filled with
+    the mean value (NNDSVDa)
+    """
+    nrows, npoints = matrix.shape
+    u, s, vt, _ = randomized_svd(matrix, 0.0, min(k + OVERSAMPLING, nrows,
+                                                  npoints))
+    scores = np.zeros((nrows, k))
+    components = np.zeros((k, npoints))
+    for j in range(k):
+        # The positive or the negative part of the singular vectors, the
+        # one of the larger norm product
+        parts = []
+        for sign in (1, -1):
+            up, vp = np.maximum(sign * u[:, j], 0), np.maximum(sign * vt[j], 0)
+            parts.append((np.linalg.norm(up) * np.linalg.norm(vp), up, vp))
+        norm, up, vp = max(parts, key=lambda part: part[0])
+        if norm > 0:
+            weight = np.sqrt(s[j] * norm)
+            scores[:, j] = weight * up / np.linalg.norm(up)
+            components[j] = weight * vp / np.linalg.norm(vp)
+    fill = max(column_mean(matrix).mean(), EPS)
+    scores[scores == 0] = fill
+    components[components == 0] = fill
+    return scores, components
+
+
+@profiling.timed('NMF')
+def nmf(matrix, ncomponents, iterations=NMF_ITERATIONS):
+    """
+    Returns zero mean, components, fractions of the squared norm explained
+    and scores by non-negative factorization of the matrix rows. Components
+    are scaled to the maximum of 1.
+    """
+    nrows, npoints = matrix.shape
+    k = min(ncomponents, nrows, npoints)
+    scores, components = nndsvd(matrix, k)
+    for _ in range(iterations):
+        # Rows of the scores update independently, so they are updated
+        # block by block and used for the components update in one pass
+        hht = components.dot(components.T)
+        wta = np.zeros((k, npoints))
+        for (start, block) in blocks(matrix):
+            np.maximum(block, 0, out=block)
+            w = scores[start:start + len(block)]
+            w *= block.dot(components.T) / (w.dot(hht) + EPS)
+            wta += w.T.dot(block)
+        components *= wta / (scores.T.dot(scores).dot(components) + EPS)
+
+    peaks = components.max(axis=1)
+    peaks[peaks == 0] = 1
+    components /= peaks[:, np.newaxis]
+    scores *= peaks
+    norm2 = sum((np.maximum(block, 0) ** 2).sum() for (_, block) in
+                blocks(matrix))
+    explained = (scores ** 2).sum(axis=0) * (components ** 2).sum(axis=1)
+    explained = explained / norm2 if norm2 > 0 else explained
+    return np.zeros(npoints), components, explained, scores
+
+
+class Model(object):
+    """
+    Components of spectra on the grid x
+
+    Model(x, mean, components, explained, method)
+
+    PCA components are orthonormal rows, NMF ones are non-negative and
+    the mean is zero. explained are fractions of the variance (of the
+    squared norm for NMF) explained by every component.
+    """
+
+    def __init__(self, x, mean, components, explained, method):
+        self.x = np.asarray(x, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.components = np.asarray(components, dtype=float)
+        self.explained = np.asarray(explained, dtype=float)
+        self.method = str(method)
+
+    def __len__(self):
+        return len(self.components)
+
+    def transform(self, y, ncomponents=None):
+        """Returns scores of Y on the grid by the first ncomponents"""
+        components = self.components[:ncomponents]
+        if self.method == 'nmf':
+            return optimize.nnls(components.T, np.maximum(y, 0))[0]
+        return (y - self.mean).dot(components.T)
+
+    def reconstruct(self, scores):
+        """Returns Y on the grid from the scores of the first components"""
+        return self.mean + np.dot(scores, self.components[:len(scores)])
+
+    def denoise(self, spdata, ncomponents=None, filepath=''):
+        """
+        Returns the spectrum reconstructed from its scores by the first
+        ncomponents, all by default, on X of the spectrum
+        """
+        y = self.reconstruct(self.transform(resample(spdata, self.x),
+                                            ncomponents))
+        if not (len(spdata.x) == len(self.x) and
+                np.array_equal(spdata.x, self.x)):
+            y = np.interp(spdata.x, self.x, y)
+        provenance = spdata.provenance + (
+            ('denoised', '%d %s components %s' %
+             (len(self.components[:ncomponents]), self.method,
+              filepath)),)
+        return sp.Spectrum(spdata.x, y, spdata.headers.copy(), copy=False,
+                           presorted=True, provenance=provenance)
+
+    def component_names(self):
+        prefix = 'nmf' if self.method == 'nmf' else 'pc'
+        return ['%s%d' % (prefix, i + 1) for i in range(len(self))]
+
+    def save(self, filepath):
+        """Saves the model to .npz file"""
+        with open(filepath, 'wb') as model_file:
+            np.savez(model_file, x=self.x, mean=self.mean,
+                     components=self.components, explained=self.explained,
+                     method=self.method)
+
+
+def load(filepath):
+    """Returns Model saved to the file"""
+    try:
+        with np.load(filepath) as saved:
+            return Model(saved['x'], saved['mean'], saved['components'],
+                         saved['explained'], saved['method'])
+    except (IOError, ValueError, KeyError) as e:
+        raise ValueError("Cannot load model %s: %s" % (filepath, e))
+
+
+def decompose(spectra, ncomponents, method='randomized', x=None, **options):
+    """
+    Returns Model, array of scores (a row per spectrum) and Spool of the
+    spectra, an iterable read once. The spool is closed, it keeps paths,
+    headers and provenance of the spectra. Options are passed to the
+    method function.
+    """
+    functions = {'randomized': randomized_pca,
+                 'incremental': incremental_pca, 'nmf': nmf}
+    if method not in functions:
+        raise ValueError("Unknown method '%s', one of %s expected" %
+                         (method, ', '.join(METHODS)))
+    with Spool(x) as spool:
+        for spdata in spectra:
+            spool.add(spdata)
+        mean, components, explained, scores = functions[method](
+            spool.matrix(), ncomponents, **options)
+    return Model(spool.x, mean, components, explained, method), scores, spool
+
+
+_models = {}
+
+
+def denoise_stage(spdata, model=None, ncomponents=None):
+    """Pipeline stage reconstructing the spectrum from the components of
+    the model file, see pipeline.stages_from_argv"""
+    if model not in _models:
+        _models[model] = load(model)
+    return _models[model].denoise(spdata, ncomponents, model)
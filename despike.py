@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Detection of cosmic ray spikes.
+
+Spikes of a spectrum stand above the rolling median of a window by a
+threshold of robust standard deviations, from the rolling median absolute
+deviation. Spikes of repeated acquisitions stand above the median of all
+frames at the point. Rolling windows are sliding views processed by
+blocks, without loops over points.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from profiling import PROFILER, timed
+
+
+SPIKE_WINDOW = 11  # Points of the rolling window for spike detection
+SPIKE_THRESHOLD = 6.0  # Spike height in robust standard deviations
+MAD_SIGMA = 1.4826  # Standard deviation of normal noise per its MAD
+WINDOW_BLOCK = 1 << 16  # Rows of sliding window views processed at once
+
+
+def despike_stage(spdata, window=SPIKE_WINDOW, threshold=SPIKE_THRESHOLD):
+    """Pipeline stage replacing spikes with the rolling median in place"""
+    if len(spdata) == 0:
+        return spdata
+    return spdata.despike(window, threshold, inplace=True)
+
+
+def rolling_median(y, window):
+    """
+    Returns the median of every odd window of points centered on each point
+    and the median absolute deviation from it in the window. The ends are
+    reflected. Windows are sliding views of Y partitioned by blocks, without
+    loops over points.
+    """
+    half = window // 2
+    padded = np.pad(np.asarray(y, dtype=float), half, mode='reflect')
+    median = np.empty(len(y))
+    mad = np.empty(len(y))
+    for start in range(0, len(y), WINDOW_BLOCK):
+        views = sliding_window_view(padded[start:start + WINDOW_BLOCK + 2 * half],
+                                    window)
+        block = np.partition(views, half, axis=1)
+        median[start:start + len(block)] = block[:, half]
+        deviations = np.abs(views - block[:, half, np.newaxis])
+        mad[start:start + len(block)] = np.partition(deviations, half,
+                                                     axis=1)[:, half]
+    return median, mad
+
+
+@timed('despike')
+def spike_mask(y, window=SPIKE_WINDOW, threshold=SPIKE_THRESHOLD):
+    """
+    Returns boolean array of the points of Y which are spikes (e.g. cosmic
+    rays on CCD spectra) and the rolling median of Y. A spike is higher than
+    the rolling median of the window by threshold robust standard deviations,
+    which are MAD_SIGMA times the rolling MAD but not less than its median
+    over the spectrum, so that flat regions do not turn noise into spikes.
+    Spikes must be narrower than half of the window.
+    """
+    if window % 2 == 0 or window < 3:
+        raise ValueError("Spike window must be an odd number of at least 3")
+    if len(y) <= window:
+        return np.zeros(len(y), dtype=bool), np.asarray(y, dtype=float)
+    median, mad = rolling_median(y, window)
+    sigma = MAD_SIGMA * np.maximum(mad, np.median(mad))
+    mask = y - median > threshold * sigma
+    PROFILER.count('spikes', int(np.count_nonzero(mask)))
+    return mask, median
+
+
+@timed('despike')
+def despike_frames(frames, threshold=SPIKE_THRESHOLD):
+    """
+    Returns the copy of frames, the 2D array of repeated acquisitions on the
+    same X (one per row), with spikes replaced, and the boolean mask of the
+    spikes. A spike is higher than the median of all frames at its point
+    by threshold robust standard deviations. These are MAD_SIGMA times the
+    MAD of the frames at the point, but not less than the one of all
+    nonzero deviations from the medians. Spikes are replaced by the median,
+    or by the lower value if there are two frames only.
+    """
+    frames = np.array(frames, dtype=float)
+    if frames.ndim != 2 or len(frames) < 2:
+        raise ValueError("Need a 2D array of at least two frames")
+    if len(frames) == 2:
+        # The median of two is their mean, which a spike spoils
+        median = frames.min(axis=0)
+    else:
+        median = np.median(frames, axis=0)
+    deviations = np.abs(frames - median)
+    nonzero = deviations[deviations > 0]
+    sigma = MAD_SIGMA * (np.median(nonzero) if len(nonzero) else 0.0)
+    if len(frames) > 2:
+        # With two frames the deviation at a point is the spike itself
+        sigma = np.maximum(MAD_SIGMA * np.median(deviations, axis=0), sigma)
+    mask = frames - median > threshold * sigma
+    frames[mask] = np.broadcast_to(median, frames.shape)[mask]
+    PROFILER.count('spikes', int(np.count_nonzero(mask)))
+    return frames, mask
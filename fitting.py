@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Fitting of spectra with sums of line shapes (Gaussian, Lorentzian, Voigt)
+over a constant or linear background.
+
+Every line shape is parametrized by its area ('amplitude'), 'center' and
+widths: Gaussian 'sigma', Lorentzian half width 'gamma' and Voigt both.
+Parameters are named as 'p<N>_<name>' for the N-th peak and 'bg_c0',
+'bg_c1' for the background. Analytic Jacobians are supplied to the solver,
+parameters can be bounded and shared between peaks.
+"""
+
+import itertools
+import multiprocessing
+
+import numpy as np
+from scipy import optimize
+from scipy import special
+
+import spectrum as sp
+import pipeline
+import profiling
+
+
+SQRT2 = np.sqrt(2)
+SQRT2PI = np.sqrt(2 * np.pi)
+MIN_WIDTH = 1e-12  # Widths are kept positive
+
+
+def gaussian(x, amplitude, center, sigma):
+    """Gaussian of the given area and its Jacobian columns"""
+    d = x - center
+    g = np.exp(-d ** 2 / (2 * sigma ** 2)) / (sigma * SQRT2PI)
+    y = amplitude * g
+    return y, [g, y * d / sigma ** 2, y * (d ** 2 / sigma ** 3 - 1 / sigma)]
+
+
+def lorentzian(x, amplitude, center, gamma):
+    """Lorentzian of the given area and its Jacobian columns"""
+    d = x - center
+    denom = d ** 2 + gamma ** 2
+    l = gamma / (np.pi * denom)
+    y = amplitude * l
+    return y, [l, y * 2 * d / denom,
+               amplitude * (d ** 2 - gamma ** 2) / (np.pi * denom ** 2)]
+
+
+def voigt(x, amplitude, center, sigma, gamma):
+    """Voigt profile of the given area and its Jacobian columns computed
+    with the Faddeeva function w(z) and its derivative -2 z w + 2i/sqrt(pi)"""
+    z = (x - center + 1j * gamma) / (sigma * SQRT2)
+    w = special.wofz(z)
+    dw = -2 * z * w + 2j / np.sqrt(np.pi)
+    norm = 1 / (sigma * SQRT2PI)
+    v = w.real * norm
+    y = amplitude * v
+    return y, [v,
+               -amplitude * norm * dw.real / (sigma * SQRT2),
+               amplitude * norm * (-(dw * z).real - w.real) / sigma,
+               -amplitude * norm * dw.imag / (sigma * SQRT2)]
+
+
+# Line shape name: (function, parameter names)
+LINE_SHAPES = {'gaussian': (gaussian, ('amplitude', 'center', 'sigma')),
+               'lorentzian': (lorentzian, ('amplitude', 'center', 'gamma')),
+               'voigt': (voigt, ('amplitude', 'center', 'sigma', 'gamma'))}
+BACKGROUNDS = {'none': 0, 'constant': 1, 'linear': 2}
+
+
+class PeakModel(object):
+    """
+    Sum of line shapes over a polynomial background
+
+    PeakModel(shapes, background='constant', shared=None)
+
+    shapes      list of line shape names, see LINE_SHAPES
+    background  'none', 'constant' or 'linear'
+    shared      dict {parameter: source parameter}, e.g. {'p1_sigma':
+                'p0_sigma'} makes the second peak width follow the first one
+    """
+
+    def __init__(self, shapes, background='constant', shared=None):
+        for shape in shapes:
+            if shape not in LINE_SHAPES:
+                raise ValueError("Unsupported line shape: '" + shape + "'")
+        if background not in BACKGROUNDS:
+            raise ValueError("Unsupported background: '" + background + "'")
+        self.shapes = list(shapes)
+        self.background = background
+        self.names = []
+        for i, shape in enumerate(self.shapes):
+            self.names += ['p%d_%s' % (i, name) for name in LINE_SHAPES[shape][1]]
+        self.names += ['bg_c%d' % i for i in range(BACKGROUNDS[background])]
+
+        self.shared = dict(shared or {})
+        for name, source in self.shared.items():
+            if name not in self.names or source not in self.names:
+                raise ValueError("Unknown parameter in '{0}={1}'".format(name, source))
+            if source in self.shared:
+                raise ValueError("Shared parameter {0} follows another one".format(source))
+        self.free = [name for name in self.names if name not in self.shared]
+        # Full parameters are tie @ free parameters
+        self.tie = np.zeros((len(self.names), len(self.free)))
+        for i, name in enumerate(self.names):
+            self.tie[i, self.free.index(self.shared.get(name, name))] = 1
+
+    def evaluate(self, x, params, jacobian=False):
+        """Returns the model Y at x for the full parameters array and the
+        Jacobian over them if asked"""
+        x = np.asarray(x, dtype=float)
+        y = np.zeros(len(x))
+        columns = []
+        pos = 0
+        for shape in self.shapes:
+            func, names = LINE_SHAPES[shape]
+            yp, jac = func(x, *params[pos:pos + len(names)])
+            y += yp
+            columns += jac
+            pos += len(names)
+        for power in range(BACKGROUNDS[self.background]):
+            y += params[pos + power] * x ** power
+            columns.append(x ** power)
+        if jacobian:
+            return y, np.column_stack(columns)
+        return y
+
+    def expand(self, free_params):
+        """Returns full parameters array for the free parameters one"""
+        return self.tie.dot(free_params)
+
+    def bounds(self, bounds=None):
+        """Returns lower and upper bounds arrays of the free parameters.
+        Widths are positive unless bounded explicitly."""
+        bounds = bounds or {}
+        lower, upper = [], []
+        for name in self.free:
+            default = (MIN_WIDTH, np.inf) if name.endswith(('sigma', 'gamma')) \
+                else (-np.inf, np.inf)
+            lo, hi = bounds.get(name, default)
+            lower.append(lo)
+            upper.append(hi)
+        return np.array(lower), np.array(upper)
+
+    def guess(self, spdata):
+        """Returns initial parameters dict for the spectrum: the most
+        prominent peaks are taken in order of decreasing prominence"""
+        _, ymin, _ = spdata.min()
+        found = spdata.peaks(prominence=0)
+        if len(found) == 0:
+            found = np.array([spdata.max()[2]])
+        heights = spdata.y[found] - ymin
+        found = found[np.argsort(heights)[::-1]]
+        step = (spdata.x[-1] - spdata.x[0]) / max(len(spdata) - 1, 1)
+        params = {}
+        for i, shape in enumerate(self.shapes):
+            pos = found[i % len(found)]
+            height = max(spdata.y[pos] - ymin, 0)
+            # Half width is taken where Y drops to half of the peak height
+            level = ymin + height / 2
+            lpos, rpos = pos, pos
+            while lpos > 0 and spdata.y[lpos] > level:
+                lpos -= 1
+            while rpos < len(spdata) - 1 and spdata.y[rpos] > level:
+                rpos += 1
+            hwhm = max((spdata.x[rpos] - spdata.x[lpos]) / 2, step)
+            params['p%d_center' % i] = spdata.x[pos]
+            params['p%d_sigma' % i] = hwhm / np.sqrt(2 * np.log(2))
+            params['p%d_gamma' % i] = hwhm
+            params['p%d_amplitude' % i] = height * hwhm * 2
+        params['bg_c0'] = ymin
+        params['bg_c1'] = 0.0
+        return dict((name, params[name]) for name in self.names)
+
+
+class FitResult(object):
+    """Fitted parameters with their standard errors"""
+
+    def __init__(self, model, solution, filepath=None):
+        self.model = model
+        self.filepath = filepath
+        self.success = solution.success
+        self.message = solution.message
+        self.rss = 2 * solution.cost
+        full = model.expand(solution.x)
+        self.params = dict(zip(model.names, full))
+        # Standard errors from the Jacobian at the solution
+        dof = max(len(solution.fun) - len(solution.x), 1)
+        try:
+            cov = np.linalg.inv(solution.jac.T.dot(solution.jac)) * self.rss / dof
+            errors = np.sqrt(np.abs(model.tie.dot(np.diag(cov))))
+        except np.linalg.LinAlgError:
+            errors = np.full(len(full), np.nan)
+        self.errors = dict(zip(model.names, errors))
+
+    def spectrum(self, x):
+        """Returns the fitted model as Spectrum at x"""
+        params = [self.params[name] for name in self.model.names]
+        headers = {'filepath': (self.filepath or 'model') + '__fit'}
+        return sp.Spectrum(x, self.model.evaluate(x, params), headers)
+
+
+@profiling.timed('fit')
+def fit(spdata, model, p0=None, bounds=None, xl=None, xr=None):
+    """
+    Fit the spectrum in X range [xl, xr] with the model by the bounded
+    trust region least squares. p0 is a dict of initial parameters,
+    guessed from the spectrum if missing. Returns FitResult.
+    """
+    spcut = spdata.xfilter(xl, xr)
+    initial = model.guess(spcut)
+    initial.update(p0 or {})
+    lower, upper = model.bounds(bounds)
+    x0 = np.clip([initial[name] for name in model.free], lower, upper)
+    # Y stored as float32 is fitted in float64
+    y = np.asarray(spcut.y, dtype=float)
+
+    def residuals(free):
+        return model.evaluate(spcut.x, model.expand(free)) - y
+
+    def jacobian(free):
+        _, jac = model.evaluate(spcut.x, model.expand(free), jacobian=True)
+        return jac.dot(model.tie)
+
+    solution = optimize.least_squares(residuals, x0, jac=jacobian,
+                                      bounds=(lower, upper))
+    return FitResult(model, solution, spdata.headers.get('filepath'))
+
+
+def _fit_chunk(job):
+    """Fits spectra of the chunk in order warm-starting every fit from the
+    previous successful one"""
+    items, model, p0, bounds, xl, xr, warm_start, stages = job
+    results = []
+    start = p0
+    for item in items:
+        spdata = item
+        if isinstance(item, str):
+            spdata = pipeline.apply_stages(sp.spectrum_from_file(item), stages)
+        result = fit(spdata, model, start, bounds, xl, xr)
+        results.append(result)
+        if warm_start:
+            start = result.params if result.success else p0
+    return results
+
+
+def fit_batch(items, model, p0=None, bounds=None, xl=None, xr=None,
+              warm_start=True, jobs=None, stages=()):
+    """
+    Fit many spectra, given as Spectrum instances or file paths, in a pool
+    of jobs worker processes. Neighbouring items go to the same worker in
+    a contiguous chunk, where each fit starts from the previous solution.
+    Yields FitResult instances in the order of items.
+    """
+    items = list(items)
+    nchunks = jobs or multiprocessing.cpu_count()
+    size = max(1, -(-len(items) // nchunks))  # Ceiling division
+    chunks = [(items[i:i + size], model, p0, bounds, xl, xr, warm_start,
+               tuple(stages))
+              for i in range(0, len(items), size)]
+    for results in pipeline.parallel_map(_fit_chunk, chunks, jobs=jobs):
+        for result in results:
+            yield result
+
+
+def write_table(results, table):
+    """Write tab separated table of fitted parameters and their errors,
+    one line per result, to the open file"""
+    results = iter(results)
+    first = next(results, None)
+    if first is None:
+        return
+    names = first.model.names
+    table.write('\t'.join(['filepath', 'success', 'rss'] + names +
+                          ['err_' + name for name in names]) + '\n')
+    for result in itertools.chain([first], results):
+        row = [str(result.filepath), str(int(result.success)), '%g' % result.rss]
+        row += ['%g' % result.params[name] for name in names]
+        row += ['%g' % result.errors[name] for name in names]
+        table.write('\t'.join(row) + '\n')
+
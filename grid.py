@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Uniform grids of X, kept by Spectrum as (start, step, count) rather than
+an array.
+
+X is taken for a grid only if it lies on it within round-off, GRID_ULPS,
+so that the array made of the grid differs from the original one below
+any printed precision. Index lookups on a grid are computed rather than
+searched, as numpy.searchsorted would find them in the array.
+"""
+
+import math
+
+import numpy as np
+
+
+GRID_ULPS = 4  # Deviation of X from a uniform grid taken as round-off, in ulps
+
+
+def grid_tolerance(start, step, count, ulps=GRID_ULPS):
+    """Returns the deviation of X from the (start, step, count) grid taken
+    as round-off, ulps of the largest X magnitude"""
+    end = start + step * (count - 1)
+    return ulps * np.finfo(float).eps * max(abs(start), abs(end))
+
+
+def uniform_grid(x, ulps=GRID_ULPS):
+    """
+    Returns (start, step, count) of sorted array x if its points lie on the
+    uniform grid within round-off of ulps, otherwise None. X made from the
+    grid thus differs from x only below any printed precision.
+    """
+    count = len(x)
+    if count < 3:
+        return None
+    start = float(x[0])
+    step = (float(x[-1]) - start) / (count - 1)
+    if not step > 0:
+        return None
+    tolerance = grid_tolerance(start, step, count, ulps)
+    # Most of non-uniform X fail at a few points already
+    for i in (count // 4, count // 2, 3 * count // 4):
+        if abs(x[i] - (start + step * i)) > tolerance:
+            return None
+    deviation = np.arange(count, dtype=float)
+    deviation *= step
+    deviation += start
+    deviation -= x
+    if np.abs(deviation, out=deviation).max() > tolerance:
+        return None
+    return start, step, count
+
+
+def grid_array(grid):
+    """Returns X array of the (start, step, count) grid"""
+    start, step, count = grid
+    return start + step * np.arange(count)
+
+
+def grid_searchsorted(grid, xv):
+    """Returns the index of the first grid point not below xv, computed as
+    numpy.searchsorted does for the grid array"""
+    start, step, count = grid
+    i = min(max(math.ceil((xv - start) / step), 0), count)
+    # Rounding of the division is corrected by the points themselves
+    while i > 0 and start + step * (i - 1) >= xv:
+        i -= 1
+    while i < count and start + step * i < xv:
+        i += 1
+    return i
+
+
+def grid_index(grid, xv):
+    """Returns the index of the grid point nearest to xv as nearest_index
+    does for the grid array"""
+    start, step, count = grid
+    i = grid_searchsorted(grid, xv)
+    if i == count or (i > 0 and
+                      xv - (start + step * (i - 1)) <= start + step * i - xv):
+        return i - 1
+    return i
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Spectral library index for identification of measured spectra.
+
+References are resampled once to the common X grid of the index and kept
+as rows of one contiguous matrix on disk, mean-centered and scaled to unit
+norm, their means and scales being recorded along with them. A query is
+resampled to the grid and matched against all references at once by one
+matrix-vector product, from which the cosine similarity, the Pearson
+correlation and the least-squares residual are all derived.
+
+The index is a directory of GRID_FILE, ROWS_FILE and INDEX_FILE. New rows
+are appended to the matrix and references changed since they were indexed
+are rewritten in their rows, so updates do not rebuild the index.
+"""
+
+import json
+import os
+
+import numpy as np
+
+import profiling
+
+
+GRID_FILE = 'grid.npy'
+ROWS_FILE = 'rows.bin'
+INDEX_FILE = 'index.json'
+ROW_DTYPE = np.dtype('<f8')
+METRICS = ('cosine', 'correlation', 'lsq')
+TOP_K = 10
+
+
+def normalize(y):
+    """Returns mean-centered y scaled to unit norm, its mean and scale.
+    Constant y gives zero row and zero scale."""
+    mean = y.mean()
+    row = y - mean
+    scale = np.sqrt(np.dot(row, row))
+    if scale > 0:
+        row /= scale
+    return row, mean, scale
+
+
+def create(directory, grid):
+    """Returns new empty Library in the directory on the X grid"""
+    if os.path.exists(os.path.join(directory, INDEX_FILE)):
+        raise ValueError("Library index already exists: %s" % directory)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    np.save(os.path.join(directory, GRID_FILE), np.asarray(grid, dtype=float))
+    open(os.path.join(directory, ROWS_FILE), 'wb').close()
+    _write_index(directory, [])
+    return Library(directory)
+
+
+def _write_index(directory, entries):
+    """Writes the index atomically, so that an interrupted update leaves the
+    previous one"""
+    path = os.path.join(directory, INDEX_FILE)
+    with open(path + '.tmp', 'w') as index_file:
+        json.dump({'dtype': ROW_DTYPE.str, 'entries': entries}, index_file,
+                  indent=1)
+    os.replace(path + '.tmp', path)
+
+
+class Library(object):
+    """
+    Spectral library index in the directory
+
+    Library(directory)
+
+    entries are dicts of reference 'path', 'mtime', 'mean' and 'scale' in
+    the order of the matrix rows.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            self.grid = np.load(os.path.join(directory, GRID_FILE))
+            with open(os.path.join(directory, INDEX_FILE), 'r') as index_file:
+                record = json.load(index_file)
+        except (IOError, ValueError) as e:
+            raise ValueError("Cannot open library index %s: %s" % (directory, e))
+        self.entries = record['entries']
+        self._positions = {os.path.normpath(entry['path']): i
+                           for (i, entry) in enumerate(self.entries)}
+        self._update_stats()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _update_stats(self):
+        self.mean = np.array([entry['mean'] for entry in self.entries])
+        self.scale = np.array([entry['scale'] for entry in self.entries])
+
+    def rows(self):
+        """Returns read-only memory map of the normalized reference rows"""
+        if not self.entries:
+            return np.zeros((0, len(self.grid)))
+        return np.memmap(os.path.join(self.directory, ROWS_FILE),
+                         dtype=ROW_DTYPE, mode='r',
+                         shape=(len(self.entries), len(self.grid)))
+
+    def is_current(self, path):
+        """Returns whether the file is indexed and not modified since"""
+        pos = self._positions.get(os.path.normpath(path))
+        return pos is not None and \
+            self.entries[pos]['mtime'] == os.path.getmtime(path)
+
+    def stale(self, paths):
+        """Returns the paths to be (re)indexed"""
+        return [path for path in paths if not self.is_current(path)]
+
+    @profiling.timed('library add')
+    def add(self, spectra):
+        """
+        Add the spectra, an iterable read once, to the index. Spectra of
+        files already indexed replace their rows. Returns the number of
+        spectra added.
+        """
+        row_bytes = len(self.grid) * ROW_DTYPE.itemsize
+        added = 0
+        with open(os.path.join(self.directory, ROWS_FILE), 'r+b') as rows_file:
+            # Drop rows of an interrupted update not recorded in the index
+            rows_file.truncate(len(self.entries) * row_bytes)
+            for spdata in spectra:
+                path = spdata.headers['filepath']
+                row, mean, scale = normalize(
+                    np.interp(self.grid, spdata.x, spdata.y))
+                entry = {'path': path, 'mean': float(mean),
+                         'scale': float(scale),
+                         'mtime': os.path.getmtime(path)
+                         if os.path.isfile(path) else None}
+                pos = self._positions.setdefault(os.path.normpath(path),
+                                                 len(self.entries))
+                if pos == len(self.entries):
+                    self.entries.append(entry)
+                else:
+                    self.entries[pos] = entry
+                rows_file.seek(pos * row_bytes)
+                rows_file.write(row.astype(ROW_DTYPE).tobytes())
+                added += 1
+        _write_index(self.directory, self.entries)
+        self._update_stats()
+        return added
+
+    @profiling.timed('library scores')
+    def scores(self, spdata, metric='cosine'):
+        """
+        Returns array of the match scores of the spectrum against every
+        reference: cosine similarity, Pearson correlation, or for 'lsq' RMS
+        residual of the spectrum fitted by the scaled reference. Only grid
+        points within the spectrum X range are compared.
+        """
+        if metric not in METRICS:
+            raise ValueError("Unknown metric '%s', one of %s expected" %
+                             (metric, ', '.join(METRICS)))
+        valid = (self.grid >= spdata.x[0]) & (self.grid <= spdata.x[-1])
+        npoints = np.count_nonzero(valid)
+        if npoints < 2:
+            raise ValueError("%s does not overlap the library grid" %
+                             spdata.headers.get('filepath', 'Spectrum'))
+        q = np.interp(self.grid[valid], spdata.x, spdata.y)
+        rows = self.rows()
+        if npoints == len(self.grid):
+            # Rows are centered and of unit norm (zero for constant ones)
+            zq = rows.dot(q)
+            zsum = np.zeros(len(self))
+            zz = (self.scale > 0).astype(float)
+        else:
+            rows = rows[:, valid]
+            zq = rows.dot(q)
+            zsum = rows.sum(axis=1)
+            zz = np.einsum('ij,ij->i', rows, rows)
+
+        # Sums of the references r = scale * row + mean over the points
+        qsum, qq = q.sum(), np.dot(q, q)
+        rq = self.scale * zq + self.mean * qsum
+        rr = self.scale ** 2 * zz + 2 * self.scale * self.mean * zsum + \
+            npoints * self.mean ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if metric == 'cosine':
+                result = rq / np.sqrt(rr * qq)
+            elif metric == 'correlation':
+                # Rows are centered already, so the scale and the mean of the
+                # references drop out; raw sums cancel for Y far from zero
+                qc = q - qsum / npoints
+                result = (zq - zsum * qsum / npoints) / np.sqrt(
+                    (zz - zsum ** 2 / npoints) * np.dot(qc, qc))
+            else:
+                residual = np.where(rr > 0, qq - rq ** 2 / rr, qq)
+                result = np.sqrt(np.maximum(residual, 0) / npoints)
+        return result
+
+    def search(self, spdata, k=TOP_K, metric='cosine'):
+        """Returns list of (path, score) of the k best matches, the best
+        first"""
+        result = self.scores(spdata, metric)
+        # Undefined scores (constant spectra) rank last
+        key = np.nan_to_num(result if metric == 'lsq' else -result, nan=np.inf)
+        k = min(k, len(key))
+        if k <= 0:
+            return []
+        best = np.argpartition(key, k - 1)[:k]
+        best = best[np.argsort(key[best], kind='stable')]
+        return [(self.entries[i]['path'], result[i]) for i in best]
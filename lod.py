@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Levels of detail of spectra for drawing.
+
+Sorted X and Y arrays are decimated to about the number of points a plot
+can show: by min/max per column, which keeps every peak, or by the
+Largest-Triangle-Three-Buckets algorithm, which keeps the shape.
+Spectrum.lod caches a pyramid of min/max levels LOD_FACTOR apart.
+"""
+
+import numpy as np
+
+
+LOD_POINTS = 4096  # Default number of points drawn per spectrum
+LOD_FACTOR = 4  # Size ratio of the neighbouring levels of detail
+
+
+def minmax_decimate(x, y, nbuckets):
+    """
+    Reduce sorted x and y arrays for drawing: X range is split into nbuckets
+    equal columns (e.g. pixel columns of a plot) and only the first and last
+    points plus the points of minimum and maximum Y of every column are kept.
+    Returns x and y arrays of at most 2 * nbuckets + 2 points.
+    """
+    n = len(x)
+    if n <= 2 * nbuckets + 2:
+        return x, y
+    edges = np.linspace(x[0], x[-1], nbuckets + 1)[:-1]
+    starts = np.unique(np.searchsorted(x, edges))
+    counts = np.diff(np.append(starts, n))
+    index = np.arange(n)
+    # First position of the extreme value in every bucket
+    ymin = np.repeat(np.minimum.reduceat(y, starts), counts)
+    imin = np.minimum.reduceat(np.where(y == ymin, index, n), starts)
+    ymax = np.repeat(np.maximum.reduceat(y, starts), counts)
+    imax = np.minimum.reduceat(np.where(y == ymax, index, n), starts)
+    keep = np.unique(np.concatenate(([0, n - 1], imin, imax)))
+    keep = keep[keep < n]  # NaN buckets have no extreme positions
+    return x[keep], y[keep]
+
+
+def lttb_decimate(x, y, npoints):
+    """
+    Reduce sorted x and y arrays to npoints with Largest-Triangle-Three-
+    Buckets algorithm: the first and last points are kept, and one point per
+    bucket in between which forms the largest triangle with the previously
+    chosen point and the average of the next bucket.
+    """
+    n = len(x)
+    if npoints >= n or npoints < 3:
+        return x, y
+    # Bounds of npoints - 2 buckets between the first and the last points
+    edges = np.linspace(1, n - 1, npoints - 1).astype(int)
+    counts = np.diff(edges)
+    xmean = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    ymean = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    xmean = np.append(xmean[1:], x[-1])
+    ymean = np.append(ymean[1:], y[-1])
+    keep = np.empty(npoints, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(npoints - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - xmean[i]) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (ymean[i] - y[a]))
+        a = lo + np.argmax(area)
+        keep[i + 1] = a
+    return x[keep], y[keep]
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Manifests of incremental processing and watching of directories.
+
+A manifest next to an output file records checksums of its input files,
+the parameters and the tool version it was made with, so that the output
+is made again only when one of them changes. watch_directory polls a
+directory for new and modified files to process.
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+import time
+
+import spectrum as sp
+
+
+MANIFEST_SUFFIX = '.manifest.json'  # Incremental processing records
+
+
+def file_checksum(filepath, blocksize=1 << 20):
+    """
+    Returns SHA-1 hex digest of the file content
+    """
+    digest = hashlib.sha1()
+    with open(filepath, 'rb') as datafile:
+        for block in iter(lambda: datafile.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(output):
+    """
+    Returns the manifest recorded for the output file or None
+    """
+    try:
+        with open(output + MANIFEST_SUFFIX, 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, ValueError):
+        return None
+
+
+def _input_record(path, previous=None):
+    """
+    Returns manifest record [checksum, size, mtime] of the input file.
+    The checksum of the previous record is reused if size and mtime match.
+    """
+    stat = os.stat(path)
+    if previous and previous[1:] == [stat.st_size, stat.st_mtime]:
+        return previous
+    return [file_checksum(path), stat.st_size, stat.st_mtime]
+
+
+def output_is_current(output, inputs, params):
+    """
+    Returns True if the output file exists and its manifest records the same
+    input files content, parameters and tool version
+    """
+    manifest = read_manifest(output)
+    if manifest is None or not os.path.isfile(output):
+        return False
+    if manifest.get('version') != sp.__version__:
+        return False
+    # Round trip through JSON to compare parameters as they are stored
+    if manifest.get('params') != json.loads(json.dumps(params)):
+        return False
+    recorded = manifest.get('inputs', {})
+    inputs = [os.path.abspath(path) for path in inputs]
+    if sorted(recorded) != sorted(inputs):
+        return False
+    for path in inputs:
+        if _input_record(path, recorded[path])[0] != recorded[path][0]:
+            return False
+    return True
+
+
+def write_manifest(output, inputs, params):
+    """
+    Record input files checksums, parameters and tool version the output
+    file was made with, see output_is_current. Inputs are recorded by
+    absolute paths, so that e.g. a.txt and ./a.txt are the same input.
+    """
+    manifest = {'version': sp.__version__,
+                'params': params,
+                'inputs': dict((os.path.abspath(path), _input_record(path))
+                               for path in inputs)}
+    with open(output + MANIFEST_SUFFIX, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+
+def watch_directory(dirpath, interval=2.0, pattern='*', ignore=()):
+    """
+    Poll the directory forever and yield paths of new and modified files
+    matching the pattern. A file is yielded when its size and modification
+    time stay the same between two polls, i.e. it is written completely.
+    Files with any of ignore substrings in the name and manifests are skipped.
+    """
+    ignore = tuple(ignore) + (MANIFEST_SUFFIX,)
+    pending, reported = {}, {}
+    while True:
+        for fname in sorted(os.listdir(dirpath)):
+            path = os.path.join(dirpath, fname)
+            if (not fnmatch.fnmatch(fname, pattern) or
+                    any(s in fname for s in ignore) or
+                    not os.path.isfile(path)):
+                continue
+            stat = os.stat(path)
+            state = (stat.st_size, stat.st_mtime)
+            if reported.get(path) == state:
+                continue
+            if pending.get(path) == state:
+                reported[path] = state
+                yield path
+            else:
+                pending[path] = state
+        time.sleep(interval)
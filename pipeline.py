@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Command line and batch infrastructure of the sp_* scripts.
+
+Options common to the scripts are popped from argv: profiling, IO,
+pipeline stages applied to every spectrum loaded, and render options.
+Files are read ahead and written behind in background threads
+(ReadAhead, AsyncWriter), so that IO overlaps with processing, and work
+is spread over worker processes by parallel_map.
+"""
+
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+import despike
+import profiling
+import spectrum as sp
+
+
+IO_ENV = 'SPECTOOL_IO'  # Number of files read or written at once
+IO_CONCURRENCY = 4
+
+
+def pop_flag(argv, flag):
+    """
+    Remove all occurrences of the flag from argv list and return whether
+    it was there
+    """
+    found = flag in argv
+    while flag in argv:
+        argv.remove(flag)
+    return found
+
+
+def pop_option(argv, option, default=None):
+    """
+    Remove the option along with its value from argv list and return the
+    value, or default if the option is absent
+    """
+    if option not in argv:
+        return default
+    i = argv.index(option)
+    if i + 1 >= len(argv):
+        print("Option {0} needs a value".format(option))
+        sys.exit(1)
+    value = argv[i + 1]
+    del argv[i:i + 2]
+    return value
+
+
+def setup_profiling(argv):
+    """
+    Pop profiling options from argv and enable the profiler if asked by
+    them or by SPECTOOL_PROFILE environment variable (1 or a trace path).
+    The summary is printed to stderr at exit. Work done in worker
+    processes is not included.
+
+      --profile             print per-stage timings summary
+      --profile-json path   also write JSON trace of all timed calls
+    """
+    enabled = pop_flag(argv, '--profile')
+    trace_path = pop_option(argv, '--profile-json')
+    env = os.environ.get(profiling.PROFILE_ENV, '')
+    if env and env != '0':
+        enabled = True
+        if env != '1' and trace_path is None:
+            trace_path = env
+    if not (enabled or trace_path):
+        return
+
+    profiling.PROFILER.enable(trace=trace_path is not None)
+
+    def report():
+        sys.stderr.write(profiling.PROFILER.summary() + '\n')
+        if trace_path is not None:
+            profiling.PROFILER.write_trace(trace_path)
+    atexit.register(report)
+
+
+def setup_io(argv):
+    """
+    Pop --io N option from argv and set the number of files read or written
+    at once, IO_CONCURRENCY, to N. SPECTOOL_IO environment variable sets it
+    if the option is absent. 1 makes reads and writes synchronous.
+
+    Pop --column C option and make sp.spectrum_from_file take Y column C
+    (name or number from 1) of multi-column files. It is passed to worker
+    processes as SPECTOOL_COLUMN environment variable.
+
+    Pop --float32 flag and store Y of spectra as float32 rather than
+    float64, see sp.set_dtype. SPECTOOL_DTYPE environment variable sets the
+    type if the flag is absent.
+    """
+    global IO_CONCURRENCY
+    value = pop_option(argv, '--io', os.environ.get(IO_ENV))
+    if value is not None:
+        IO_CONCURRENCY = max(1, int(value))
+    column = pop_option(argv, '--column')
+    if column is not None:
+        os.environ[sp.COLUMN_ENV] = column
+    if pop_flag(argv, '--float32'):
+        sp.set_dtype('float32')
+    elif os.environ.get(sp.DTYPE_ENV):
+        sp.set_dtype(os.environ[sp.DTYPE_ENV])
+
+
+def pop_render_options(argv):
+    """
+    Pop render mode options of the plot scripts from argv whether --render
+    is there or not, so that their values are never taken for data files.
+    Returns None without --render, otherwise dict of the options for
+    render.render_files: outdir, formats, group, dpi and jobs, None for
+    the defaults of render.
+    """
+    outdir = pop_option(argv, '--render')
+    formats = pop_option(argv, '--format', 'png').split(',')
+    group = int(pop_option(argv, '--group', 1))
+    dpi = pop_option(argv, '--dpi')
+    jobs = pop_option(argv, '--jobs')
+    if outdir is None:
+        return None
+    return {'outdir': outdir, 'formats': formats, 'group': group,
+            'dpi': None if dpi is None else int(dpi),
+            'jobs': None if jobs is None else int(jobs)}
+
+
+def parallel_map(func, items, jobs=None, ordered=True, threads=False):
+    """
+    Lazily map func over items in a pool of worker processes, one per CPU
+    by default. With jobs=1 the items are processed in this process.
+    func must be picklable, i.e. defined at module level, unless threads
+    are used instead of processes (threads=True), e.g. for I/O.
+    """
+    if jobs == 1:
+        for item in items:
+            yield func(item)
+        return
+    pool_class = ThreadPool if threads else multiprocessing.Pool
+    with pool_class(jobs) as pool:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        for result in mapper(func, items):
+            yield result
+
+
+def nmev_stage(spdata, target='ev', jacobian=False):
+    """
+    Pipeline stage converting spectrum X to target units ('ev' or 'nm') in
+    place if it is not there yet. Units are guessed with sp.EVNM_BORDER.
+    """
+    if len(spdata) == 0:
+        return spdata
+    is_nm = spdata.x[-1] >= sp.EVNM_BORDER
+    if is_nm == (target == 'nm'):
+        return spdata
+    return spdata.convert_nmev(jacobian=jacobian, inplace=True)
+
+
+def stages_from_argv(argv):
+    """
+    Pop pipeline stage flags from argv and return the list of stages, each
+    being a callable taking and returning a Spectrum instance.
+
+      --ev, --nm    convert X to electron-volts or nanometers if needed
+      --jacobian    apply the nm<->eV jacobian to Y along with X conversion
+      --despike     replace cosmic ray spikes with the rolling median
+      --baseline method[:name=value,...]
+                    subtract the baseline, see baseline.METHODS
+      --denoise model.npz[:N]
+                    reconstruct from the first N (all by default) components
+                    of the model saved by decomposition
+    """
+    stages = []
+    if pop_flag(argv, '--despike'):
+        stages.append(partial(despike.despike_stage))
+    jacobian = pop_flag(argv, '--jacobian')
+    for target in ('ev', 'nm'):
+        if pop_flag(argv, '--' + target):
+            stages.append(partial(nmev_stage, target=target, jacobian=jacobian))
+    baseline_option = pop_option(argv, '--baseline')
+    if baseline_option is not None:
+        import baseline
+        method, _, params = baseline_option.partition(':')
+        params = baseline.parse_params(params)
+        try:
+            baseline.method_params(method, params)
+        except ValueError as e:
+            print("Error: {0}".format(e))
+            sys.exit(1)
+        stages.append(partial(baseline.baseline_stage, method=method,
+                              params=params))
+    denoise_option = pop_option(argv, '--denoise')
+    if denoise_option is not None:
+        import decomposition
+        model, _, ncomponents = denoise_option.rpartition(':')
+        if model and ncomponents.isdigit():
+            ncomponents = int(ncomponents)
+        else:
+            model, ncomponents = denoise_option, None
+        try:
+            decomposition.load(model)
+        except ValueError as e:
+            print("Error: {0}".format(e))
+            sys.exit(1)
+        stages.append(partial(decomposition.denoise_stage, model=model,
+                              ncomponents=ncomponents))
+    return stages
+
+
+def apply_stages(spdata, stages):
+    """Pass the spectrum through the pipeline stages in order"""
+    for stage in stages:
+        spdata = stage(spdata)
+    return spdata
+
+
+def describe_stages(stages):
+    """
+    Returns stable text description of the pipeline stages, e.g. for
+    the parameters recorded in manifests
+    """
+    names = []
+    for stage in stages:
+        if isinstance(stage, partial):
+            kwargs = ', '.join('%s=%s' % kv for kv in sorted(stage.keywords.items()))
+            names.append('%s(%s)' % (stage.func.__name__, kwargs))
+        else:
+            names.append(getattr(stage, '__name__', stage.__class__.__name__))
+    return names
+
+
+def check_and_exit(data):
+    """
+    Check whether the argument is Spectrum instance and exit otherwise
+    """
+    if not data.__class__ is sp.Spectrum:
+        print("Not XY data: {0}".format(data))
+        sys.exit(1)
+
+
+def get_ref_data(file_or_number, stages=()):
+    """
+    Get reference data for a calculation via detecting whether the input is
+    a number or a file path. Returns either float or Spectrum instance with
+    the content of the file.
+    """
+    if os.path.exists(file_or_number) and os.path.isfile(file_or_number):
+        refdata = apply_stages(sp.spectrum_from_file(file_or_number), stages)
+    else:
+        refdata = float(file_or_number)
+    return refdata
+
+
+def existing_files(filelist):
+    """
+    Returns the list of paths of existing files warning about missing ones
+    """
+    paths = []
+    for fname in filelist:
+        if not (os.path.exists(fname) and os.path.isfile(fname)):
+            print("Warning! Cannot open file <" + fname + ">. Skipping.")
+            continue
+        paths.append(fname)
+    return paths
+
+
+def load_spectra(filelist, stages=()):
+    """
+    Returns a list of spectrum instances read from the files passed through
+    the pipeline stages. Missing files are skipped with a warning.
+    """
+    return list(ReadAhead(existing_files(filelist), stages))
+
+
+def get_data_list(filelist, usagefmt='usage: {0} reffile datafile1 [datafile2 ...]',
+                  minfiles=1, maxfiles=1024, stages=(), lazy=False):
+    """
+    Returns reference file name, reference data and a list of spectrum
+    instances. With lazy=True the list is a ReadAhead of the files read in
+    background while the spectra are processed.
+    """
+    if not minfiles < len(filelist) < maxfiles:
+        print(usagefmt.format(os.path.basename(filelist[0])))
+        sys.exit(1)  # Maybe throwing an exception would be better here
+
+    refdata = get_ref_data(filelist[1], stages)
+    if lazy:
+        datalist = ReadAhead(existing_files(filelist[2:]), stages)
+    else:
+        datalist = load_spectra(filelist[2:], stages)
+
+    ref_fname = str(refdata)
+    if refdata.__class__ is sp.Spectrum:
+        ref_fname = os.path.basename(refdata.headers['filepath'])
+
+    return ref_fname, refdata, datalist
+
+
+def _read_spectrum(path, stages):
+    return apply_stages(sp.spectrum_from_file(path), stages)
+
+
+class ReadAhead(object):
+    """
+    Spectra of the files, passed through the pipeline stages, in the order
+    of paths. While a spectrum is processed, next files are being read in
+    background threads, up to twice the concurrency ahead.
+
+    ReadAhead(paths, stages=(), concurrency=IO_CONCURRENCY)
+    """
+
+    def __init__(self, paths, stages=(), concurrency=None):
+        self.paths = list(paths)
+        self.stages = tuple(stages)
+        self.concurrency = concurrency
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        concurrency = self.concurrency or IO_CONCURRENCY
+        if concurrency <= 1:
+            for path in self.paths:
+                yield _read_spectrum(path, self.stages)
+            return
+        paths = iter(self.paths)
+        with ThreadPoolExecutor(concurrency) as pool:
+            pending = deque()
+            for path in paths:
+                pending.append(pool.submit(_read_spectrum, path, self.stages))
+                if len(pending) == 2 * concurrency:
+                    break
+            while pending:
+                spdata = pending.popleft().result()
+                path = next(paths, None)
+                if path is not None:
+                    pending.append(pool.submit(_read_spectrum, path, self.stages))
+                yield spdata
+
+
+def write_spectrum(path, spdata):
+    """Write the spectrum to the file"""
+    with open(path, 'w') as new_file:
+        new_file.write(str(spdata))
+
+
+class AsyncWriter(object):
+    """
+    Context manager writing spectra to files in background threads, so that
+    the next spectrum is computed while the previous ones are written. At
+    most twice the concurrency of writes are queued, write blocks when the
+    queue is full. All writes are finished on exit, the first write error
+    is raised by write or on exit.
+
+    with AsyncWriter() as writer:
+        writer.write(path, spdata)
+
+    AsyncWriter(concurrency=IO_CONCURRENCY)
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or IO_CONCURRENCY
+        self._pool = None
+        self._slots = None
+        self._futures = deque()
+
+    def __enter__(self):
+        if self.concurrency > 1:
+            self._pool = ThreadPoolExecutor(self.concurrency)
+            self._slots = threading.BoundedSemaphore(2 * self.concurrency)
+        return self
+
+    def _write(self, path, spdata, then):
+        try:
+            write_spectrum(path, spdata)
+            if then is not None:
+                then()
+        finally:
+            self._slots.release()
+
+    def write(self, path, spdata, then=None):
+        """
+        Queue writing of the spectrum to the file, then call then() if it is
+        given, e.g. to record a manifest of the file
+        """
+        if self._pool is None:
+            write_spectrum(path, spdata)
+            if then is not None:
+                then()
+            return
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._write, path, spdata, then))
+        # Report errors of the finished writes
+        while self._futures and self._futures[0].done():
+            self._futures.popleft().result()
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._pool is None:
+            return False
+        self._pool.shutdown(wait=True)
+        self._pool = None
+        futures, self._futures = self._futures, deque()
+        if exc_type is None:
+            for future in futures:
+                future.result()
+        return False
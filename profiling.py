@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Profiling instrumentation of the processing stages.
+
+PROFILER collects named timers and counters of the stages timed by the
+timed decorator or its timer context manager, and counters of processed
+items. It is off unless enabled by pipeline.setup_profiling, and costs
+one attribute check per timed call when off.
+"""
+
+import json
+import os
+import time
+from functools import wraps
+
+
+PROFILE_ENV = 'SPECTOOL_PROFILE'  # Set to 1 to profile, or to a trace path
+
+
+class _NullTimer(object):
+    """Timer doing nothing, used when profiling is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Timer(object):
+    """Context manager adding its run time to the profiler stage"""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler(object):
+    """
+    Named timers and counters of processing stages. Disabled profiler costs
+    one attribute check per timed call.
+
+    with PROFILER.timer('load'):
+        ...
+    PROFILER.count('points', n)
+    """
+    _null_timer = _NullTimer()
+
+    def __init__(self):
+        self.enabled = False
+        self.timers = {}  # name: [calls, seconds]
+        self.counters = {}
+        self.events = None  # Trace events, collected only if asked
+
+    def enable(self, trace=False):
+        self.enabled = True
+        if trace:
+            self.events = []
+
+    def timer(self, name):
+        if not self.enabled:
+            return self._null_timer
+        return _Timer(self, name)
+
+    def add_time(self, name, start, end):
+        record = self.timers.setdefault(name, [0, 0.0])
+        record[0] += 1
+        record[1] += end - start
+        if self.events is not None:
+            self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(),
+                                'tid': 0, 'ts': start * 1e6,
+                                'dur': (end - start) * 1e6})
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        """Returns per-stage summary text. Stages nest, e.g. 'construct' is
+        also a part of 'load', so times do not sum up to the total."""
+        lines = ["%-16s %8s %12s %12s" % ("stage", "calls", "total, s", "mean, ms")]
+        for name, (calls, seconds) in sorted(self.timers.items(),
+                                             key=lambda kv: -kv[1][1]):
+            lines.append("%-16s %8d %12.4f %12.4f" % (
+                name, calls, seconds, 1000 * seconds / calls))
+        for name, value in sorted(self.counters.items()):
+            lines.append("%-16s %8d" % (name, value))
+        return '\n'.join(lines)
+
+    def write_trace(self, path):
+        """Write collected events in Chrome trace JSON format"""
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': self.events or []}, trace_file)
+
+
+PROFILER = Profiler()
+
+
+def timed(name):
+    """Decorator timing the function calls as the profiler stage name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
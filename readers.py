@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Readers of spectrum file formats.
+
+Readers are registered with file name extensions and optionally a sniffer
+recognizing the format by the first SNIFF_BYTES of a file. A file is read
+by the reader of its extension, otherwise by the first one whose sniffer
+accepts it, otherwise as text. Every reader takes the file path and returns
+X array, 2D array of Y columns (one row per column) and headers dict, so
+that files of several Y columns are read at once.
+
+text    whitespace separated columns, commas taken as decimal points; lines
+        which cannot be parsed as numbers go to headers
+csv     columns separated by commas or semicolons (commas are decimal
+        points then), the last header row naming the columns
+spe     Princeton Instruments WinSpec binary files, X calibrated by the
+        polynomial of the file, every strip of every frame being a column
+jcamp   JCAMP-DX of (X++(Y..Y)) data in AFFN or compressed ASDF form, or of
+        (XY..XY) points
+
+Use register() to add readers of other formats.
+"""
+
+import os
+import re
+
+import numpy as np
+
+
+SNIFF_BYTES = 4096
+HEADER_SEPARATORS = (':', '=', None)
+
+_readers = []  # (name, extensions, sniffer, reader) in registration order
+
+
+def register(name, extensions=(), sniffer=None):
+    """
+    Decorator registering the reader function for the file name extensions
+    (with the dot, case-insensitive). The sniffer takes the bytes of the
+    start of a file and returns whether the reader can read it.
+    """
+    def decorator(reader):
+        _readers.append((name, tuple(ext.lower() for ext in extensions),
+                         sniffer, reader))
+        return reader
+    return decorator
+
+
+def reader_for(filepath):
+    """Returns name and function of the reader of the file"""
+    extension = os.path.splitext(filepath)[1].lower()
+    for (name, extensions, _, reader) in _readers:
+        if extension in extensions:
+            return name, reader
+    with open(filepath, 'rb') as datafile:
+        head = datafile.read(SNIFF_BYTES)
+    for (name, _, sniffer, reader) in _readers:
+        if sniffer is not None and sniffer(head):
+            return name, reader
+    return 'text', read_text
+
+
+def read(filepath):
+    """Returns X, Y columns and headers of the file read by its reader"""
+    x, ys, headers = reader_for(filepath)[1](filepath)
+    # The file path read from a previously written file is outdated
+    headers['filepath'] = filepath
+    return x, ys, headers
+
+
+def parse_header(line, headers, separators=HEADER_SEPARATORS):
+    """Put "key: value", "key = value" or "key value" line to headers"""
+    for sep in separators:
+        info = line.split(sep, 1)
+        if len(info) == 2:
+            headers[info[0].strip()] = info[1].strip()
+            break
+
+
+def _numbers(fields):
+    """Returns list of floats of the fields up to the first non-number"""
+    values = []
+    for field in fields:
+        try:
+            values.append(float(field))
+        except ValueError:
+            break
+    return values
+
+
+def decimal_commas(text):
+    """Returns text with commas taken as decimal points"""
+    return text.replace(',', '.')
+
+
+def parse_table(lines, normalize=decimal_commas, headers=None):
+    """
+    Returns 2D array of rows of the numeric lines, at least two numbers
+    each, and headers of the other lines. normalize turns text into
+    whitespace separated fields.
+
+    The data usually follows the headers and is converted at once; lines
+    are parsed one by one only when the data rows are interrupted or
+    ragged.
+    """
+    headers = {} if headers is None else headers
+    start = len(lines)
+    for (i, line) in enumerate(lines):
+        if len(_numbers(normalize(line).split()[:2])) == 2:
+            start = i
+            break
+        if line.strip():
+            parse_header(line, headers)
+    body = [line for line in lines[start:] if line.strip()]
+    if not body:
+        return np.zeros((0, 2)), headers
+    ncols = len(normalize(body[0]).split())
+    fields = normalize('\n'.join(body)).split()
+    if len(fields) == ncols * len(body):
+        try:
+            return np.array(fields, dtype=float).reshape(-1, ncols), headers
+        except ValueError:
+            pass
+    table = []
+    for line in body:
+        values = _numbers(normalize(line).split()[:ncols])
+        if len(values) < 2:
+            parse_header(line, headers)
+            continue
+        table.append(values + [np.nan] * (ncols - len(values)))
+    return np.array(table, dtype=float).reshape(-1, ncols), headers
+
+
+def _columns(table):
+    """Returns X and Y columns of the table rows"""
+    return table[:, 0].copy(), table[:, 1:].T.copy()
+
+
+@register('text')
+def read_text(filepath):
+    """Reads whitespace separated columns, commas being decimal points"""
+    with open(filepath, 'r') as datafile:
+        lines = datafile.read().splitlines()
+    table, headers = parse_table(lines)
+    return _columns(table) + (headers,)
+
+
+def _csv_delimiter(lines):
+    """Returns delimiter of the first line starting with a number, ',' or
+    ';', headers like "T: 10 K" being skipped"""
+    for line in lines:
+        if re.match(r'^\s*[-+.\d]', line):
+            return ';' if ';' in line else ','
+    return ','
+
+
+def sniff_csv(head):
+    """Accepts text whose first numeric line is a single whitespace field
+    of delimited numbers"""
+    for line in head.decode('latin-1').splitlines()[:-1]:
+        fields = line.split()
+        if len(fields) >= 2 and \
+                len(_numbers(decimal_commas(line).split()[:2])) == 2:
+            return False
+        if len(fields) == 1 and re.match(r'^[-+.\d]', fields[0]):
+            return re.match(r'^[-+.\deE]+([,;][-+.,\deE]+)+$',
+                            fields[0]) is not None
+    return False
+
+
+@register('csv', ('.csv',), sniff_csv)
+def read_csv(filepath):
+    """Reads comma or semicolon separated columns, the last non-numeric
+    line before the data naming the columns"""
+    with open(filepath, 'r') as datafile:
+        lines = datafile.read().splitlines()
+    delimiter = _csv_delimiter(lines)
+    if delimiter == ';':
+        def normalize(text):
+            return text.replace(',', '.').replace(';', ' ').replace('"', ' ')
+    else:
+        def normalize(text):
+            return text.replace(',', ' ').replace('"', ' ')
+    # The last row of delimited fields before the data names the columns
+    names, names_index = None, None
+    for (i, line) in enumerate(lines):
+        if len(_numbers(normalize(line).split()[:2])) == 2:
+            break
+        fields = [field.strip().strip('"') for field in line.split(delimiter)]
+        if len(fields) >= 2:
+            names, names_index = fields, i
+    if names is not None:
+        lines = lines[:names_index] + lines[names_index + 1:]
+    table, headers = parse_table(lines, normalize)
+    if names is not None and len(names) == table.shape[1]:
+        headers['columns'] = ', '.join(names)
+    return _columns(table) + (headers,)
+
+
+SPE_HEADER = 4100
+SPE_DTYPES = {0: '<f4', 1: '<i4', 2: '<i2', 3: '<u2', 5: '<f8', 6: '<u1',
+              8: '<u4'}
+
+
+def _spe_field(head, offset, dtype):
+    return np.frombuffer(head, dtype=dtype, count=1, offset=offset)[0]
+
+
+def _spe_shape(head, size):
+    """Returns frames, strips, pixels and dtype of SPE file of the size, or
+    None if the header does not match the size"""
+    if len(head) < SPE_HEADER:
+        return None
+    xdim = int(_spe_field(head, 42, '<u2'))
+    ydim = int(_spe_field(head, 656, '<u2'))
+    frames = int(_spe_field(head, 1446, '<i4'))
+    dtype = SPE_DTYPES.get(int(_spe_field(head, 108, '<i2')))
+    if dtype is None or min(xdim, ydim, frames) <= 0:
+        return None
+    data_size = xdim * ydim * frames * np.dtype(dtype).itemsize
+    # Version 3 files have XML footer after the data
+    if size < SPE_HEADER + data_size:
+        return None
+    return frames, ydim, xdim, dtype
+
+
+@register('spe', ('.spe',))
+def read_spe(filepath):
+    """Reads WinSpec SPE file, a column per strip of every frame"""
+    with open(filepath, 'rb') as datafile:
+        head = datafile.read(SPE_HEADER)
+    shape = _spe_shape(head, os.path.getsize(filepath))
+    if shape is None:
+        raise ValueError("Not a valid SPE file: %s" % filepath)
+    frames, ydim, xdim, dtype = shape
+    data = np.memmap(filepath, dtype=dtype, mode='r', offset=SPE_HEADER,
+                     shape=(frames * ydim, xdim))
+    ys = np.array(data, dtype=float)
+    del data
+
+    pixels = np.arange(1, xdim + 1, dtype=float)
+    order = int(_spe_field(head, 3101, 'u1'))
+    coeffs = np.frombuffer(head, dtype='<f8', count=6, offset=3263)
+    if 0 < order < 6 and coeffs[1:order + 1].any():
+        x = np.polyval(coeffs[order::-1], pixels)
+    else:
+        x = pixels
+    headers = {'exposure': '%g' % _spe_field(head, 10, '<f4'),
+               'date': head[20:30].split(b'\0')[0].decode('latin-1'),
+               'frames': str(frames), 'strips': str(ydim)}
+    return x, ys, headers
+
+
+def sniff_jcamp(head):
+    return head.lstrip()[:2] == b'##' and b'JCAMP' in head.upper()
+
+
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+ASDF_TOKEN = re.compile(r'[@A-Ia-i%J-Rj-rS-Zs]\d*\.?\d*|'
+                        r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+SQZ = dict(zip('@ABCDEFGHIabcdefghi', [0] + list(range(1, 10)) +
+               list(range(-1, -10, -1))))
+DIF = dict(zip('%JKLMNOPQRjklmnopqr', [0] + list(range(1, 10)) +
+               list(range(-1, -10, -1))))
+DUP = dict(zip('STUVWXYZs', range(1, 10)))
+
+
+def _digit_value(digit, rest):
+    """Returns number of the pseudo-digit value and the following digits"""
+    return float('-' + str(-digit) + rest if digit < 0 else str(digit) + rest)
+
+
+def decode_asdf(lines):
+    """
+    Returns Y values of (X++(Y..Y)) data lines in AFFN or ASDF (SQZ, DIF
+    and DUP) form. The abscissa starting every line is skipped, so is the
+    Y check value repeating the last DIF value of the previous line.
+    """
+    ys = []
+    check = False
+    for line in lines:
+        tokens = ASDF_TOKEN.findall(line)
+        if not tokens:
+            continue
+        values = []
+        dif = None  # Last difference while in DIF form
+        for token in tokens[1:]:
+            head = token[0]
+            if head in SQZ:
+                values.append(_digit_value(SQZ[head], token[1:]))
+                dif = None
+            elif head in DIF:
+                dif = _digit_value(DIF[head], token[1:])
+                values.append(values[-1] + dif if values else
+                              (ys[-1] if ys else 0) + dif)
+            elif head in DUP:
+                for _ in range(int(str(DUP[head]) + token[1:]) - 1):
+                    values.append(values[-1] + (dif or 0))
+            else:
+                values.append(float(token))
+                dif = None
+        if check and values:
+            values = values[1:]
+        check = dif is not None
+        ys.extend(values)
+    return ys
+
+
+@register('jcamp', ('.jdx', '.dx', '.jcamp'), sniff_jcamp)
+def read_jcamp(filepath):
+    """Reads the first spectrum of JCAMP-DX file"""
+    with open(filepath, 'r') as datafile:
+        lines = datafile.read().splitlines()
+    headers = {}
+    data_label, data = None, []
+    for line in lines:
+        line = line.split('$$', 1)[0]  # Comments
+        if line.startswith('##'):
+            if data_label is not None:
+                break
+            label, _, value = line[2:].partition('=')
+            label, value = label.strip().upper(), value.strip()
+            if label in ('XYDATA', 'XYPOINTS', 'PEAK TABLE'):
+                data_label = value.replace(' ', '')
+            else:
+                headers[label] = value
+        elif data_label is not None:
+            data.append(line)
+    if data_label is None:
+        raise ValueError("No XY data in JCAMP-DX file %s" % filepath)
+
+    def number(label, default=None):
+        try:
+            return float(headers[label])
+        except (KeyError, ValueError):
+            if default is None:
+                raise ValueError("JCAMP-DX file %s lacks ##%s" %
+                                 (filepath, label))
+            return default
+    xfactor, yfactor = number('XFACTOR', 1.0), number('YFACTOR', 1.0)
+    if data_label.startswith('(X++(Y..Y))'):
+        y = np.array(decode_asdf(data)) * yfactor
+        npoints = int(number('NPOINTS', len(y)))
+        if len(y) != npoints:
+            raise ValueError("JCAMP-DX file %s has %d points of %d" %
+                             (filepath, len(y), npoints))
+        x = np.linspace(number('FIRSTX'), number('LASTX'), npoints)
+    else:
+        # (XY..XY) pairs, possibly several per line
+        pairs = np.array(NUMBER.findall(' '.join(data)), dtype=float)
+        pairs = pairs[:len(pairs) // 2 * 2].reshape(-1, 2)
+        x, y = pairs[:, 0] * xfactor, pairs[:, 1] * yfactor
+    return x, y[np.newaxis, :], headers
+
+
+def column_names(headers, ncolumns):
+    """Returns names of the Y columns from 'columns' header naming X and
+    them, y1, y2, ... otherwise"""
+    names = [name.strip() for name in headers.get('columns', '').split(',')]
+    if len(names) == ncolumns + 1:
+        return names[1:]
+    return ['y%d' % (i + 1) for i in range(ncolumns)]
+
+
+def select_columns(ys, names, selection):
+    """
+    Returns Y columns and names of the selection, comma separated names or
+    numbers of Y columns starting from 1
+    """
+    indices = []
+    for item in selection.split(','):
+        item = item.strip()
+        if item in names:
+            indices.append(names.index(item))
+        elif item.isdigit() and 1 <= int(item) <= len(names):
+            indices.append(int(item) - 1)
+        else:
+            raise ValueError("No column '%s' of %s" % (item, ', '.join(names)))
+    return ys[indices], [names[i] for i in indices]
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Headless rendering of spectra plots to image files.
+
+Figures are drawn with the non-interactive Agg backend in parallel worker
+processes. Spectra are decimated to the plot width in pixels beforehand
+(min/max per pixel column), so that huge spectra cost as much as small ones.
+"""
+
+import os
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as pl
+import numpy as np
+
+import spectrum as sp
+import pipeline
+
+
+MAX_LEGEND_ENTRY_LEN = 30
+FIGURE_SIZE = (8, 6)  # inches
+DPI = 100
+FORMATS = ('png', 'svg', 'pdf')
+
+
+def legend_entry(filepath):
+    """Returns legend entry for the file shortened as in the plot scripts"""
+    legend_item = os.path.basename(filepath)
+    # Get rid of useless prefix in legend
+    legend_item = legend_item.replace("ev-", "")
+    if len(legend_item) > MAX_LEGEND_ENTRY_LEN:
+        legend_item = legend_item[0:MAX_LEGEND_ENTRY_LEN - 3] + "..."
+    return legend_item
+
+
+def render_group(job):
+    """Draws spectra from the files of the job into one figure and saves it
+    in every format requested. Returns the list of files written.
+
+    job is a tuple (paths, outbase, kind, formats, dpi, stages), kind being
+    the name of the plot function: 'plot', 'semilogy' or 'polar'."""
+    paths, outbase, kind, formats, dpi, stages = job
+    fig = pl.figure(figsize=FIGURE_SIZE, dpi=dpi)
+    ax = fig.add_subplot(111, polar=(kind == 'polar'))
+    width_px = int(FIGURE_SIZE[0] * dpi)
+    for path in paths:
+        spdata = pipeline.apply_stages(sp.spectrum_from_file(path), stages)
+        x, y = spdata.lod(2 * width_px)
+        if kind == 'polar':
+            ax.plot(x * np.pi / 180, y, label=legend_entry(path))
+        else:
+            getattr(ax, 'semilogy' if kind == 'semilogy' else 'plot')(
+                x, y, label=legend_entry(path))
+    ax.grid(True)
+    ax.legend()
+    written = []
+    for fmt in formats:
+        fpath = outbase + '.' + fmt
+        fig.savefig(fpath, dpi=dpi)
+        written.append(fpath)
+    pl.close(fig)
+    return written
+
+
+def render_files(paths, outdir, kind='plot', formats=('png',), group=1,
+                 dpi=DPI, stages=(), jobs=None):
+    """Renders the files into outdir, group files per figure, in a pool of
+    jobs worker processes. Yields lists of files written per figure."""
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError("Unsupported image format: '" + fmt + "'")
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    jobs_list = []
+    for i in range(0, len(paths), group):
+        chunk = paths[i:i + group]
+        name = os.path.basename(chunk[0])
+        if len(chunk) > 1:
+            name += "__and_%d_more" % (len(chunk) - 1)
+        outbase = os.path.join(outdir, name)
+        jobs_list.append((chunk, outbase, kind, tuple(formats), dpi,
+                          tuple(stages)))
+    return pipeline.parallel_map(render_group, jobs_list, jobs=jobs)
+
+
+def render_from_argv(argv, kind, stages=(), options=None):
+    """Handles render mode options of a plot script and renders the files
+    if --render dir was passed. Returns False if it was not. options are
+    the ones popped by pipeline.pop_render_options already, if any.
+
+      --render dir        write images to dir instead of showing the plot
+      --format png,svg    image formats, png by default
+      --group N           spectra per figure, one by default
+      --dpi N             resolution, which also sets the decimation width
+      --jobs N            worker processes, one per CPU by default
+    """
+    if options is None:
+        options = pipeline.pop_render_options(argv)
+    if options is None:
+        return False
+    paths = pipeline.existing_files(argv[1:])
+    for written in render_files(paths, options['outdir'], kind,
+                                options['formats'], options['group'],
+                                options['dpi'] or DPI, stages, options['jobs']):
+        print('\n'.join(written))
+    return True
+
+
+def render_map(values, filepath, label='', extent=None, dpi=DPI):
+    """Draws the map of per-pixel values, e.g. areas or peak positions of a
+    SpectralCube, with a colorbar and saves it to the image file. Maps of
+    one row are drawn as curves over pixel numbers."""
+    values = np.asarray(values)
+    fig = pl.figure(figsize=FIGURE_SIZE, dpi=dpi)
+    if values.ndim == 1:
+        pl.plot(values)
+        pl.xlabel('pixel')
+        pl.ylabel(label)
+    else:
+        pl.imshow(values, origin='lower', extent=extent,
+                  interpolation='nearest', aspect='auto')
+        pl.colorbar(label=label)
+    fig.savefig(filepath, dpi=dpi)
+    pl.close(fig)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# This program aligns spectra to a reference spectrum correcting the drift
+# of the spectrometer: X shifts (and scales if asked) are found by
+# cross-correlation and the shifted spectra are written.
+
+import sys
+import os
+
+import pipeline
+import align
+
+
+newfmt = "{0}__aligned"
+usage = """usage: {0} [options] reffile datafile1 [datafile2 ...]
+options:
+  --scale          estimate X scale along with the shift
+  --max-shift dx   largest shift searched, in X units
+  --points N       points of the correlation grid, as in reffile by default
+  --table file     write the table of shifts and scales instead of stdout
+  --dry-run        only estimate, do not write aligned spectra
+  --ev|--nm [--jacobian] convert X before the alignment"""
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+scale = pipeline.pop_flag(sys.argv, '--scale')
+max_shift = pipeline.pop_option(sys.argv, '--max-shift')
+max_shift = None if max_shift is None else float(max_shift)
+npoints = pipeline.pop_option(sys.argv, '--points')
+npoints = None if npoints is None else int(npoints)
+table_path = pipeline.pop_option(sys.argv, '--table')
+dry_run = pipeline.pop_flag(sys.argv, '--dry-run')
+
+if len(sys.argv) < 3:
+    print(usage.format(os.path.basename(sys.argv[0])))
+    sys.exit(0)
+
+ref = pipeline.get_ref_data(sys.argv[1], stages)
+pipeline.check_and_exit(ref)
+data = pipeline.load_spectra(sys.argv[2:], stages)
+try:
+    shifts, scales = align.estimate_shifts(data, ref, max_shift, scale, npoints)
+except ValueError as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
+
+table = sys.stdout if table_path is None else open(table_path, 'w')
+table.write('filepath\tshift\tscale\n')
+with pipeline.AsyncWriter() as writer:
+    for (spdata, shift, k) in zip(data, shifts, scales):
+        table.write('%s\t%g\t%g\n' % (spdata.headers['filepath'], shift, k))
+        if not dry_run:
+            fpath_new = newfmt.format(spdata.headers['filepath'])
+            writer.write(fpath_new, spdata.shift_x(-shift, 1 / k))
+if table_path is not None:
+    table.close()
@@ -2,13 +2,16 @@
 
 import sys
 import os
-import spectrum as sp
+import pipeline
 
-usagefmt = "usage: {0} file1 [file2 ... ]"
+usagefmt = "usage: {0} [--io N] file1 [file2 ... ]"
 
-_, refdata, data = sp.get_data_list(sys.argv, usagefmt=usagefmt, minfiles=1)
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+_, refdata, data = pipeline.get_data_list(sys.argv, usagefmt=usagefmt,
+                                          minfiles=1)
 data = [refdata] + data
 
 for spdata in data:
-    sp.check_and_exit(spdata)
+    pipeline.check_and_exit(spdata)
     print( ("%.6f" % spdata.area()).rjust(15), "  ", spdata.headers['filepath'])
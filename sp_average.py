@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# This program averages repeated acquisitions in one pass over the files
+# and writes the mean and the standard deviation columns, optionally the
+# median and the sigma-clipped mean, into one file. Spectra on other X are
+# interpolated to X of the first one.
+
+import sys
+import os
+
+import pipeline
+import aggregate
+
+
+newfmt = "{0}__average{1}"
+usage = """usage: {0} [options] datafile1 datafile2 [datafile3 ...]
+options:
+  --median         also write the median (values are spooled to disk in
+                   the same pass)
+  --clip N         also write the mean of values within N standard
+                   deviations of the mean (a second pass over the files)
+  --out file       output file, {1} by default
+  --ev|--nm [--jacobian] convert X before averaging"""
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+with_median = pipeline.pop_flag(sys.argv, '--median')
+clip = pipeline.pop_option(sys.argv, '--clip')
+out_path = pipeline.pop_option(sys.argv, '--out')
+
+if len(sys.argv) < 3:
+    print(usage.format(os.path.basename(sys.argv[0]),
+                       newfmt.format('datafile1', 'N')))
+    sys.exit(0)
+
+paths = pipeline.existing_files(sys.argv[1:])
+if not paths:
+    sys.exit(1)
+spool = aggregate.MedianSpool(len(paths)) if with_median else None
+try:
+    stats = aggregate.running_stats(pipeline.ReadAhead(paths, stages),
+                                    spool=spool)
+    columns = [('mean', stats.mean_array()), ('std', stats.std_array())]
+    if with_median:
+        columns.append(('median', spool.median_array()))
+    if clip is not None:
+        columns.append(('clipped_mean', aggregate.clipped_mean(
+            pipeline.ReadAhead(paths, stages), stats, float(clip))))
+except (UnicodeDecodeError, ValueError) as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
+finally:
+    if spool is not None:
+        spool.close()
+
+if out_path is None:
+    out_path = newfmt.format(paths[0], len(paths))
+headers = dict(stats.headers.items())
+headers['averaged'] = ', '.join(stats.paths)
+aggregate.write_columns(out_path, stats.x, columns, headers, stats.provenance)
+print("Saving {0}".format(out_path))
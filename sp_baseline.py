@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# This program estimates baselines of spectra and writes the spectra with
+# the baselines subtracted. Files are processed in parallel worker
+# processes.
+
+import sys
+import os
+
+import spectrum as sp
+import manifest
+import pipeline
+import baseline
+
+
+newfmt = "{0}__bl_sub_{1}"
+blfmt = "{0}__bl_{1}"
+usage = """usage: {0} [options] datafile1 [datafile2 ...]
+options:
+  --method M            {1} (als by default)
+  --params p=0.01,...   method parameters, defaults are
+{2}
+  --write-baseline      also write the baselines
+  --incremental         skip files whose outputs are up to date
+  --jobs N              worker processes, one per CPU by default
+  --ev|--nm [--jacobian] convert X before the baseline estimation"""
+
+
+def process(job):
+    """Writes the file with the baseline subtracted and the baseline if
+    asked. Returns the new path or None if the outputs are up to date."""
+    fpath, method, params, write_baseline, incremental, stages = job
+    fname = os.path.basename(fpath)
+    fdir = os.path.dirname(fpath)
+    fpath_new = os.path.join(fdir, newfmt.format(fname, method))
+    fpath_bl = os.path.join(fdir, blfmt.format(fname, method))
+    manifest_params = {'baseline': baseline.describe(method, params),
+                       'write_baseline': write_baseline,
+                       'stages': pipeline.describe_stages(stages)}
+    if incremental and manifest.output_is_current(fpath_new, [fpath],
+                                                  manifest_params):
+        return None
+
+    spdata = pipeline.apply_stages(sp.spectrum_from_file(fpath), stages)
+    pipeline.write_spectrum(fpath_new,
+                            baseline.subtract(spdata, method, params))
+    if write_baseline:
+        pipeline.write_spectrum(fpath_bl, baseline.baseline_spectrum(
+            spdata, method, params))
+    if incremental:
+        manifest.write_manifest(fpath_new, [fpath], manifest_params)
+    return fpath_new
+
+
+if __name__ == '__main__':
+    pipeline.setup_profiling(sys.argv)
+    pipeline.setup_io(sys.argv)
+    stages = pipeline.stages_from_argv(sys.argv)
+    method = pipeline.pop_option(sys.argv, '--method', 'als')
+    params = baseline.parse_params(pipeline.pop_option(sys.argv, '--params'))
+    write_baseline = pipeline.pop_flag(sys.argv, '--write-baseline')
+    incremental = pipeline.pop_flag(sys.argv, '--incremental')
+    jobs = pipeline.pop_option(sys.argv, '--jobs')
+    jobs = None if jobs is None else int(jobs)
+
+    if len(sys.argv) < 2:
+        defaults = '\n'.join(' ' * 24 + baseline.describe(name)
+                             for name in baseline.METHODS)
+        print(usage.format(os.path.basename(sys.argv[0]),
+                           ', '.join(baseline.METHODS), defaults))
+        sys.exit(0)
+    try:
+        baseline.method_params(method, params)
+    except ValueError as e:
+        print("Error: {0}".format(e))
+        sys.exit(1)
+
+    jobs_list = [(fpath, method, params, write_baseline, incremental,
+                  tuple(stages))
+                 for fpath in pipeline.existing_files(sys.argv[1:])]
+    for (job, fpath_new) in zip(jobs_list, pipeline.parallel_map(
+            process, jobs_list, jobs=jobs)):
+        if fpath_new is None:
+            print("Up to date: %s" % job[0])
+        else:
+            print("Saving %s" % fpath_new)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Processing of spectra larger than memory. Text files are converted to
+# memory-mapped .npy storage first, then every operation reads and writes
+# it by chunks, so that memory use does not depend on the spectrum length.
+
+import sys
+import os
+
+import pipeline
+import chunked
+
+
+usage = """usage: {0} [--chunk N] [--float32] convert file.txt file.npy
+       {0} [--chunk N] text file.npy file.txt
+       {0} [--chunk N] savgol window_size poly_order in.npy out.npy
+       {0} [--chunk N] add|sub|mul|div reffile_or_number in.npy out.npy
+       {0} [--chunk N] xfilter xleft xright in.npy out.npy
+       {0} [--chunk N] area in.npy [xleft xright]
+--chunk N sets the number of points processed at once, {1} by default;
+--float32 stores Y of the converted file as float32, X stays float64,
+results keep the type of their input;
+xleft or xright can be omitted by passing underscore '_'"""
+
+METHODS = {'add': '__add__', 'sub': '__sub__', 'mul': '__mul__',
+           'div': '__truediv__'}
+NARGS = {'convert': 2, 'text': 2, 'savgol': 4, 'xfilter': 4, 'area': 1}
+
+
+def parse_bound(text):
+    """Returns float of the bound or None for '_'"""
+    return None if text == '_' else float(text)
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+chunk_size = int(float(pipeline.pop_option(sys.argv, '--chunk',
+                                           chunked.CHUNK_POINTS)))
+command = sys.argv[1] if len(sys.argv) > 1 else None
+args = sys.argv[2:]
+nargs = 3 if command in METHODS else NARGS.get(command)
+if nargs is None or len(args) not in (nargs, nargs + 2 * (command == 'area')):
+    print(usage.format(os.path.basename(sys.argv[0]), chunked.CHUNK_POINTS))
+    sys.exit(0)
+
+try:
+    if command == 'convert':
+        spdata = chunked.convert_text(args[0], args[1], chunk_size)
+        print("{0}: {1} points".format(args[1], len(spdata)))
+    elif command == 'area':
+        spdata = chunked.ChunkedSpectrum(args[0], chunk_size)
+        xl, xr = (None, None) if len(args) == 1 else map(parse_bound, args[1:])
+        print(("%.6f" % spdata.area(xl, xr)).rjust(15), "  ", args[0])
+    else:
+        spdata = chunked.ChunkedSpectrum(args[-2], chunk_size)
+        if command == 'text':
+            spdata.write_text(args[1])
+        elif command == 'savgol':
+            spdata.savgol(args[-1], int(args[0]), int(args[1]))
+        elif command == 'xfilter':
+            spdata.xfilter(args[-1], parse_bound(args[0]), parse_bound(args[1]))
+        else:
+            spdata.arithmetic(args[-1], pipeline.get_ref_data(args[0]),
+                              METHODS[command])
+        print("Saving {0}".format(args[-1]))
+except (IOError, ValueError) as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# This program processes spatial maps of spectra (PL or Raman maps) as one
+# spectral cube: every operation is made for all pixels at once, and maps of
+# the integrated intensity and of the peak position are written. The Y
+# columns of a multi-column file are processed the same way, in one read
+# and one write.
+
+import sys
+import os
+
+import pipeline
+import cube
+
+
+usage = """usage: {0} [options] pixelfile1 [pixelfile2 ...]
+       {0} [options] --matrix cubefile
+       {0} [options] --columns datafile
+options:
+  --select C1,C2,...       take only these Y columns of --columns datafile,
+                           by names or numbers from 1
+  --shape RxC              map shape of pixel files taken in the given order,
+                           found from x..y.. coordinates in file names if all
+                           of them have ones
+  --sub ref                subtract reference file or number from all pixels
+  --savgol W,O             smooth with Savitzky-Golay window W and order O
+  --xrange xleft:xright    cut X range, '_' for no bound
+  --area file              write the map of integrated intensities
+  --peak file              write the map of peak positions
+  --height file            write the map of peak heights
+  --write file             write the processed cube as a matrix file, or as
+                           a multi-column file for --columns datafile
+  --image                  draw every map into a PNG image next to its file
+  --jobs N                 worker processes reading pixel files
+  --ev|--nm [--jacobian], --despike, --baseline ...
+                           pipeline stages applied to every pixel spectrum"""
+
+
+def parse_range(text):
+    """Returns (low, high) tuple from 'low:high' string, '_' is no bound"""
+    low, high = text.split(':', 1)
+    return (None if low == '_' else float(low),
+            None if high == '_' else float(high))
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+matrix_path = pipeline.pop_option(sys.argv, '--matrix')
+columns_path = pipeline.pop_option(sys.argv, '--columns')
+selection = pipeline.pop_option(sys.argv, '--select')
+shape = pipeline.pop_option(sys.argv, '--shape')
+ref = pipeline.pop_option(sys.argv, '--sub')
+savgol = pipeline.pop_option(sys.argv, '--savgol')
+xl, xr = parse_range(pipeline.pop_option(sys.argv, '--xrange', '_:_'))
+area_path = pipeline.pop_option(sys.argv, '--area')
+peak_path = pipeline.pop_option(sys.argv, '--peak')
+height_path = pipeline.pop_option(sys.argv, '--height')
+cube_path = pipeline.pop_option(sys.argv, '--write')
+image = pipeline.pop_flag(sys.argv, '--image')
+jobs = pipeline.pop_option(sys.argv, '--jobs')
+jobs = None if jobs is None else int(jobs)
+
+if matrix_path is None and columns_path is None and len(sys.argv) < 2:
+    print(usage.format(os.path.basename(sys.argv[0])))
+    sys.exit(0)
+if shape is not None:
+    shape = tuple(int(n) for n in shape.lower().split('x'))
+
+try:
+    if matrix_path is not None:
+        spcube = cube.cube_from_matrix(matrix_path).apply_stages(stages)
+    elif columns_path is not None:
+        spcube = cube.cube_from_columns(columns_path,
+                                        selection).apply_stages(stages)
+    else:
+        spcube = cube.cube_from_files(pipeline.existing_files(sys.argv[1:]),
+                                      shape, stages, jobs)
+    if ref is not None:
+        spcube = spcube - pipeline.get_ref_data(ref, stages)
+    if savgol is not None:
+        window_size, poly_order = (int(n) for n in savgol.split(','))
+        spcube = spcube.savgol(window_size, poly_order)
+    spcube = spcube.xfilter(xl, xr)
+except ValueError as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
+print("{0} pixels, map shape {1}, {2} points from {3:g} to {4:g}".format(
+    len(spcube), 'x'.join(str(n) for n in spcube.shape), len(spcube.x),
+    spcube.x[0], spcube.x[-1]))
+
+maps = []
+if area_path is not None:
+    maps.append((area_path, 'area', spcube.area()))
+if peak_path is not None or height_path is not None:
+    positions, heights = spcube.peak_position()
+    if peak_path is not None:
+        maps.append((peak_path, 'peak position', positions))
+    if height_path is not None:
+        maps.append((height_path, 'peak height', heights))
+
+extent = None
+if spcube.coords is not None:
+    extent = [spcube.coords[:, 0].min(), spcube.coords[:, 0].max(),
+              spcube.coords[:, 1].min(), spcube.coords[:, 1].max()]
+for (path, label, values) in maps:
+    cube.write_map(values, path)
+    print("Saving {0}".format(path))
+    if image:
+        import render
+        render.render_map(values, path + '.png', label, extent)
+        print("Saving {0}".format(path + '.png'))
+
+if cube_path is not None:
+    if columns_path is not None:
+        spcube.write_columns(cube_path)
+    else:
+        spcube.write(cube_path)
+    print("Saving {0}".format(cube_path))
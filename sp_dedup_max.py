@@ -4,22 +4,25 @@
 import sys
 import os
 
-import spectrum as sp
+import pipeline
 
 
 newfmt = "{0}__dedup"
-usagefmt = "usage: {0} file1 file2 [file3 ... ]"
+usagefmt = "usage: {0} [--io N] file1 file2 [file3 ... ]"
 
-_, refdata, data = sp.get_data_list(sys.argv, usagefmt=usagefmt, minfiles=1)
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+_, refdata, data = pipeline.get_data_list(sys.argv, usagefmt=usagefmt,
+                                          minfiles=1)
 data = [refdata] + data
 
-for spdata in data:
-    sp.check_and_exit(spdata)
-    spdata.deduplicate(comparator=max)
+with pipeline.AsyncWriter() as writer:
+    for spdata in data:
+        pipeline.check_and_exit(spdata)
+        spdata.deduplicate(comparator=max)
 
-    fname = os.path.basename(spdata.headers['filepath'])
-    fdir  = os.path.dirname( spdata.headers['filepath'])
-    new_path = os.path.join(fdir, newfmt.format(fname))
-    
-    with open(new_path, 'w') as new_file:
-        new_file.write(str(spdata))
+        fname = os.path.basename(spdata.headers['filepath'])
+        fdir  = os.path.dirname( spdata.headers['filepath'])
+        new_path = os.path.join(fdir, newfmt.format(fname))
+
+        writer.write(new_path, spdata)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# This program removes cosmic ray spikes from spectra. Every file is cleaned
+# by rolling median of its points, or, with --frames, the files are taken as
+# repeated acquisitions of one spectrum which are compared with each other
+# and averaged.
+
+import sys
+import os
+
+import numpy as np
+
+import spectrum as sp
+import despike
+import pipeline
+
+
+newfmt = "{0}__despiked"
+meanfmt = "{0}__despiked_mean{1}"
+usage = """usage: {0} [options] datafile1 [datafile2 ...]
+options:
+  --window N       odd number of points of the rolling window, {1} by default
+  --threshold T    spike height in robust standard deviations, {2} by default
+  --frames         files are repeated acquisitions, write their clean mean
+  --ev|--nm [--jacobian] convert X before despiking"""
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+window = int(pipeline.pop_option(sys.argv, '--window', despike.SPIKE_WINDOW))
+threshold = float(pipeline.pop_option(sys.argv, '--threshold',
+                                      despike.SPIKE_THRESHOLD))
+frames_mode = pipeline.pop_flag(sys.argv, '--frames')
+
+if len(sys.argv) < 2:
+    print(usage.format(os.path.basename(sys.argv[0]), despike.SPIKE_WINDOW,
+                       despike.SPIKE_THRESHOLD))
+    sys.exit(0)
+
+paths = pipeline.existing_files(sys.argv[1:])
+try:
+    if frames_mode:
+        data = pipeline.load_spectra(paths, stages)
+        if len(data) < 2:
+            print("Error: need at least two frames")
+            sys.exit(1)
+        first = data[0]
+        # Frames on other X are interpolated to X of the first one
+        frames = [spdata.y if np.array_equal(spdata.x, first.x)
+                  else np.interp(first.x, spdata.x, spdata.y)
+                  for spdata in data]
+        clean, mask = despike.despike_frames(frames, threshold)
+        for (spdata, spikes) in zip(data, mask):
+            print("%6d spikes  %s" % (np.count_nonzero(spikes),
+                                       spdata.headers['filepath']))
+        headers = first.headers.copy()
+        headers['averaged'] = ', '.join(s.headers['filepath'] for s in data)
+        provenance = first.provenance + (
+            ('despiked', '%d points of %d frames' % (np.count_nonzero(mask),
+                                                     len(data))),)
+        mean = sp.Spectrum(first.x, clean.mean(axis=0), headers, copy=False,
+                           presorted=True, provenance=provenance)
+        fpath_new = meanfmt.format(first.headers['filepath'], len(data))
+        pipeline.write_spectrum(fpath_new, mean)
+        print("Saving %s" % fpath_new)
+    else:
+        with pipeline.AsyncWriter() as writer:
+            for spdata in pipeline.ReadAhead(paths, stages):
+                clean = spdata.despike(window, threshold)
+                fpath_new = newfmt.format(spdata.headers['filepath'])
+                writer.write(fpath_new, clean)
+                print("%6d spikes  %s" % (np.count_nonzero(clean.y != spdata.y),
+                                           spdata.headers['filepath']))
+except ValueError as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# This program fits spectra with sums of Gaussian, Lorentzian or Voigt peaks
+# and writes the table of fitted parameters. Files are fitted in the order
+# given, each one starting from the solution for the previous file.
+
+import sys
+import os
+
+import numpy as np
+
+import spectrum as sp
+import pipeline
+import fitting
+
+
+usage = """usage: {0} [options] datafile1 [datafile2 ...]
+options:
+  --shapes gaussian,voigt   line shapes of the peaks, one gaussian by default
+  --background B            none, constant (default) or linear
+  --share p1_sigma=p0_sigma parameters following other ones, comma separated
+  --bound p0_center=1.2:1.4 parameter bounds, comma separated, '_' for none
+  --p0 p0_center=1.3        initial parameters, guessed if missing
+  --xrange xleft:xright     X range to fit, '_' for no bound
+  --table file              parameters table, stdout by default
+  --write                   write fitted model curves next to data files
+  --cold                    do not warm-start fits from previous solutions
+  --jobs N                  worker processes, one per CPU by default"""
+
+
+def parse_pairs(text, convert):
+    """Returns dict from 'name=value,name=value' string"""
+    pairs = {}
+    if text:
+        for item in text.split(','):
+            name, value = item.split('=', 1)
+            pairs[name.strip()] = convert(value.strip())
+    return pairs
+
+
+def parse_range(text):
+    """Returns (low, high) tuple from 'low:high' string, '_' is no bound"""
+    low, high = text.split(':', 1)
+    return (None if low == '_' else float(low),
+            None if high == '_' else float(high))
+
+
+def parse_bound(text):
+    """Returns (low, high) bound with infinite ends for '_'"""
+    low, high = parse_range(text)
+    return (-np.inf if low is None else low, np.inf if high is None else high)
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+shapes = pipeline.pop_option(sys.argv, '--shapes', 'gaussian').split(',')
+background = pipeline.pop_option(sys.argv, '--background', 'constant')
+shared = parse_pairs(pipeline.pop_option(sys.argv, '--share'), str)
+bounds = parse_pairs(pipeline.pop_option(sys.argv, '--bound'), parse_bound)
+p0 = parse_pairs(pipeline.pop_option(sys.argv, '--p0'), float)
+xl, xr = parse_range(pipeline.pop_option(sys.argv, '--xrange', '_:_'))
+table_path = pipeline.pop_option(sys.argv, '--table')
+write_models = pipeline.pop_flag(sys.argv, '--write')
+warm_start = not pipeline.pop_flag(sys.argv, '--cold')
+jobs = pipeline.pop_option(sys.argv, '--jobs')
+jobs = None if jobs is None else int(jobs)
+
+if len(sys.argv) < 2:
+    print(usage.format(os.path.basename(sys.argv[0])))
+    sys.exit(0)
+
+try:
+    model = fitting.PeakModel(shapes, background, shared)
+except ValueError as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
+
+paths = pipeline.existing_files(sys.argv[1:])
+results = fitting.fit_batch(paths, model, p0, bounds, xl, xr, warm_start,
+                            jobs, stages)
+if write_models:
+    results = list(results)
+    for result in results:
+        spdata = pipeline.apply_stages(
+            sp.spectrum_from_file(result.filepath), stages)
+        fitted = result.spectrum(spdata.x)
+        with open(fitted.headers['filepath'], 'w') as new_file:
+            new_file.write(str(fitted))
+
+if table_path is None:
+    fitting.write_table(results, sys.stdout)
+else:
+    with open(table_path, 'w') as table:
+        fitting.write_table(results, table)
@@ -15,6 +15,7 @@ import numpy as np
 from scipy.odr import odrpack as odr
 
 import spectrum as sp
+import pipeline
 
 
 CONST_BOLZMANN = 8.6173324e-5  # eV / K
@@ -57,6 +58,8 @@ def fitfunc(t0, func):
     return lambda p, t: func(t0, p, t)
 
 
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
 if len(sys.argv) < 2:
     print("usage: {0} datafile1 [datafile2... ]".format(
         os.path.basename(sys.argv[0])))
@@ -14,6 +14,8 @@ import numpy as np
 from scipy.optimize import curve_fit
 
 import spectrum as sp
+import pipeline
+import tcspc
 
 
 TIME_PERIOD = 13.158  # nanoseconds
@@ -46,9 +48,26 @@ def strexp_loop_func(t_period, num):
                                                       ampl, tau, beta)
 
 
+usage = """usage: {0} [options] datafile1 [datafile2... ]
+options:
+  --tcspc          datafiles are raw binary photon timestamps, histogrammed
+                   modulo the laser period before the fitting
+  --bin ns         histogram bin width, {1} ns by default
+  --tick ns        time-tagger clock tick, {2} ns by default
+  --dtype type     timestamp type as numpy dtype, {3} by default
+  --header bytes   bytes to skip at the start of the raw files"""
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+raw_mode = pipeline.pop_flag(sys.argv, '--tcspc')
+bin_width = float(pipeline.pop_option(sys.argv, '--bin', tcspc.BIN_WIDTH))
+tick = float(pipeline.pop_option(sys.argv, '--tick', tcspc.TICK))
+dtype = pipeline.pop_option(sys.argv, '--dtype', tcspc.DTYPE)
+header = int(pipeline.pop_option(sys.argv, '--header', 0))
 if len(sys.argv) < 2:
-    print("usage: {0} datafile1 [datafile2... ]".format(
-        os.path.basename(sys.argv[0])))
+    print(usage.format(os.path.basename(sys.argv[0]), tcspc.BIN_WIDTH,
+                       tcspc.TICK, tcspc.DTYPE))
     sys.exit(0)
 
 data = []
@@ -56,7 +75,15 @@ for arg in sys.argv[1:]:
     if not (os.path.exists(arg) and os.path.isfile(arg)):
         print("Warning! Cannot open file <" + arg + ">. Skipping.")
         continue
-    data.append(sp.spectrum_from_file(arg))
+    if raw_mode:
+        try:
+            data.append(tcspc.histogram(arg, TIME_PERIOD, bin_width, tick,
+                                        dtype, header))
+        except (ValueError, TypeError) as e:
+            print("Error: {0}".format(e))
+            sys.exit(1)
+    else:
+        data.append(sp.spectrum_from_file(arg))
 
 pl.figure()
 legend = []
@@ -67,8 +94,8 @@ beta = 1
 
 for spec in data:
     # Initial parameters
-    y0 = np.float(spec.y[0])
-    ampl = np.float(np.max(spec.y))
+    y0 = float(spec.y[0])
+    ampl = float(np.max(spec.y))
 
     initial_params = [y0, ampl, tau, beta]
 
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# Metadata index of spectrum files: headers, X range, number of points and
+# checksums are kept in a SQLite database so that spectra can be looked up
+# without reading the data files.
+
+import sys
+import os
+import re
+import sqlite3
+
+import spectrum as sp
+import manifest
+import pipeline
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spectra (
+    path     TEXT PRIMARY KEY,
+    checksum TEXT,
+    mtime    REAL,
+    size     INTEGER,
+    npoints  INTEGER,
+    xmin     REAL,
+    xmax     REAL
+);
+CREATE TABLE IF NOT EXISTS headers (
+    path   TEXT,
+    key    TEXT,
+    value  TEXT,
+    number REAL
+);
+CREATE TABLE IF NOT EXISTS others (
+    path  TEXT PRIMARY KEY,
+    mtime REAL,
+    size  INTEGER
+);
+CREATE INDEX IF NOT EXISTS spectra_x ON spectra (xmin, xmax);
+CREATE INDEX IF NOT EXISTS headers_path ON headers (path);
+CREATE INDEX IF NOT EXISTS headers_key ON headers (key, number);
+"""
+
+# Query condition on a header, e.g. T<50 or sample=A12
+CONDITION = re.compile(r'^\s*([^<>=!]+?)\s*(<=|>=|!=|<|>|=)\s*(.+?)\s*$')
+
+
+def open_index(dbpath):
+    """Returns connection to the index database creating tables if needed"""
+    db = sqlite3.connect(dbpath)
+    db.executescript(SCHEMA)
+    return db
+
+
+def index_file(db, path):
+    """Adds the file to the index or updates its record.
+
+    Files which are not spectra are recorded in others table with their
+    modification time and size, so that they are not read again until they
+    change. Returns False if the file is not a spectrum, True otherwise."""
+    stat = os.stat(path)
+    try:
+        spdata = sp.spectrum_from_file(path)
+    except (UnicodeDecodeError, ValueError):
+        spdata = None
+    db.execute("DELETE FROM headers WHERE path = ?", (path,))
+    if spdata is None or len(spdata) == 0:
+        db.execute("DELETE FROM spectra WHERE path = ?", (path,))
+        db.execute("INSERT OR REPLACE INTO others VALUES (?, ?, ?)",
+                   (path, stat.st_mtime, stat.st_size))
+        return False
+
+    db.execute("DELETE FROM others WHERE path = ?", (path,))
+    db.execute("INSERT OR REPLACE INTO spectra VALUES (?, ?, ?, ?, ?, ?, ?)",
+               (path, manifest.file_checksum(path), stat.st_mtime,
+                stat.st_size, len(spdata), float(spdata.x[0]),
+                float(spdata.x[-1])))
+    db.executemany("INSERT INTO headers VALUES (?, ?, ?, ?)",
+                   [(path, key.lower(), str(value), sp.parse_number(value))
+                    for (key, value) in spdata.headers.items()
+                    if key != 'filepath'])
+    return True
+
+
+def scan(db, topdir):
+    """Indexes all spectrum files under the directory tree.
+
+    Files, spectra or not, whose size and modification time did not change
+    since the last scan are not read again. Records of deleted files are
+    dropped. Returns the number of (re)indexed files."""
+    known = dict((row[0], row[1:]) for row in
+                 db.execute("SELECT path, mtime, size FROM spectra UNION ALL "
+                            "SELECT path, mtime, size FROM others"))
+    seen = set()
+    cnt = 0
+    for fdir, _, fnames in os.walk(topdir):
+        for fname in fnames:
+            path = os.path.join(fdir, fname)
+            seen.add(path)
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+            if index_file(db, path):
+                cnt += 1
+    prefix = os.path.join(topdir, '')
+    for path in known:
+        if path.startswith(prefix) and path not in seen:
+            db.execute("DELETE FROM spectra WHERE path = ?", (path,))
+            db.execute("DELETE FROM headers WHERE path = ?", (path,))
+            db.execute("DELETE FROM others WHERE path = ?", (path,))
+    db.commit()
+    return cnt
+
+
+def query(db, xl=None, xr=None, conditions=()):
+    """Returns paths of the spectra overlapping X range [xl, xr] and
+    satisfying header conditions like 'T<50' or 'sample=A12'.
+
+    Header keys are compared case-insensitively. Numeric values are compared
+    by the first number in the header value, other ones as strings."""
+    sql = "SELECT path FROM spectra WHERE 1"
+    params = []
+    if xl is not None:
+        sql += " AND xmax >= ?"
+        params.append(xl)
+    if xr is not None:
+        sql += " AND xmin <= ?"
+        params.append(xr)
+    for condition in conditions:
+        match = CONDITION.match(condition)
+        if match is None:
+            raise ValueError("Invalid condition: '" + condition + "'")
+        key, op, value = match.groups()
+        number = sp.parse_number(value)
+        column = 'value' if number is None else 'number'
+        sql += (" AND path IN (SELECT path FROM headers"
+                " WHERE key = ? AND {0} {1} ?)".format(column, op))
+        params += [key.lower(), value if number is None else number]
+    sql += " ORDER BY path"
+    return [row[0] for row in db.execute(sql, params)]
+
+
+if __name__ == '__main__':
+    usage = ("usage: {0} index.sqlite scan dir1 [dir2 ...]\n"
+             "       {0} index.sqlite query [--x xleft xright] [key<value ...]\n"
+             "xleft or xright can be omitted by passing underscore '_'")
+    pipeline.setup_profiling(sys.argv)
+    pipeline.setup_io(sys.argv)
+    if len(sys.argv) < 3 or sys.argv[2] not in ('scan', 'query'):
+        print(usage.format(os.path.basename(sys.argv[0])))
+        sys.exit(0)
+
+    db = open_index(sys.argv[1])
+    if sys.argv[2] == 'scan':
+        for topdir in sys.argv[3:]:
+            cnt = scan(db, topdir)
+            print("{0}: {1} files indexed".format(topdir, cnt))
+        sys.exit(0)
+
+    args = sys.argv[3:]
+    xl, xr = None, None
+    if '--x' in args:
+        i = args.index('--x')
+        xl_str, xr_str = args[i + 1:i + 3]
+        xl = None if xl_str == '_' else float(xl_str)
+        xr = None if xr_str == '_' else float(xr_str)
+        del args[i:i + 3]
+    try:
+        paths = query(db, xl, xr, args)
+    except ValueError as e:
+        print("Error: {0}".format(e))
+        sys.exit(1)
+    print('\n'.join(paths))
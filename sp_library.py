@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# This program identifies spectra by a library of references. References
+# are resampled to the common grid and stored in an index directory once,
+# then every query is matched against all of them at once.
+
+import sys
+import os
+
+import pipeline
+import align
+import library
+
+
+usage = """usage: {0} [options] add index_dir reffile1 [reffile2 ...]
+       {0} [options] search index_dir datafile1 [datafile2 ...]
+       {0} info index_dir
+add creates the index on the grid of reffile1 if there is none and indexes
+new and modified reference files; search prints the best matches.
+options:
+  --points N       points of the grid of a new index, as in reffile1 by default
+  --range xl,xr    X range of the grid of a new index
+  --top N          number of matches printed, {1} by default
+  --metric M       {2}; cosine by default
+  --ev|--nm [--jacobian] convert X of references and queries"""
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+npoints = pipeline.pop_option(sys.argv, '--points')
+npoints = None if npoints is None else int(npoints)
+xrange = pipeline.pop_option(sys.argv, '--range')
+top = int(pipeline.pop_option(sys.argv, '--top', library.TOP_K))
+metric = pipeline.pop_option(sys.argv, '--metric', 'cosine')
+command = sys.argv[1] if len(sys.argv) > 1 else None
+args = sys.argv[2:]
+if command not in ('add', 'search', 'info') or \
+        len(args) < (1 if command == 'info' else 2):
+    print(usage.format(os.path.basename(sys.argv[0]), library.TOP_K,
+                       '|'.join(library.METRICS)))
+    sys.exit(0)
+
+index_dir = args[0]
+paths = pipeline.existing_files(args[1:])
+try:
+    if command == 'add' and not os.path.exists(
+            os.path.join(index_dir, library.INDEX_FILE)):
+        if not paths:
+            sys.exit(1)
+        first = pipeline.get_ref_data(paths[0], stages)
+        pipeline.check_and_exit(first)
+        if xrange is not None:
+            xl, xr = map(float, xrange.split(','))
+            first = first.xfilter(xl, xr)
+        lib = library.create(index_dir, align.reference_grid(first, npoints))
+        print("Created {0} of {1} points".format(index_dir, len(lib.grid)))
+    else:
+        lib = library.Library(index_dir)
+
+    if command == 'add':
+        paths = lib.stale(paths)
+        added = lib.add(pipeline.ReadAhead(paths, stages))
+        print("Indexed {0} files, {1} in {2}".format(added, len(lib), index_dir))
+    elif command == 'info':
+        print("{0}: {1} references on {2} points from {3} to {4}".format(
+            index_dir, len(lib), len(lib.grid), lib.grid[0], lib.grid[-1]))
+    else:
+        for spdata in pipeline.ReadAhead(paths, stages):
+            print(spdata.headers['filepath'])
+            for (rank, (path, score)) in enumerate(
+                    lib.search(spdata, top, metric), 1):
+                print("%4d  %12.6f  %s" % (rank, score, path))
+except ValueError as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
@@ -4,14 +4,17 @@ import sys
 import os
 import re
 
-import spectrum as sp
+import pipeline
 
 
 usagefmt = "usage: {0} file1 file2 [file3 ... ]"
 newfmt = 'merged_{0}'
 
-_, merged, data = sp.get_data_list(sys.argv, usagefmt=usagefmt, minfiles=2)
-sp.check_and_exit(merged)
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+_, merged, data = pipeline.get_data_list(sys.argv, usagefmt=usagefmt,
+                                         minfiles=2)
+pipeline.check_and_exit(merged)
 
 # Controllers
 l = len(data) + 1
@@ -20,7 +23,7 @@ enough = l*(l-1)/2
 
 while data:
     spec = data.pop(0)
-    sp.check_and_exit(spec)
+    pipeline.check_and_exit(spec)
     try:
         merged.merge(spec)
     except ValueError:
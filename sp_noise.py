@@ -3,7 +3,10 @@
 import sys
 import os
 import spectrum as sp
+import pipeline
 
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
 if len(sys.argv) == 1:
     print("usage: {0} datafile1 [datafile2 ...]".format(
         os.path.basename(sys.argv[0])))
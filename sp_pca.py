@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# This program decomposes a series of spectra (e.g. by temperature or
+# position) into dominant components by PCA or NMF. It writes the model,
+# the component spectra and the scores of every file, and optionally the
+# spectra reconstructed from the components.
+
+import sys
+import os
+
+import pipeline
+import aggregate
+import decomposition
+
+
+newfmt = "{0}__pca"
+denoisedfmt = "{0}__denoised{1}"
+usage = """usage: {0} [options] datafile1 datafile2 [datafile3 ...]
+options:
+  --components N   number of components, {1} by default
+  --method M       {2}; randomized by default
+  --iterations N   NMF iterations, {3} by default
+  --out prefix     prefix of the outputs, {4} by default:
+                   prefix.npz (model for --denoise model.npz[:N] of other
+                   scripts), prefix_components, prefix_scores
+  --reconstruct    also write every spectrum reconstructed from the components
+  --ev|--nm [--jacobian] convert X before the decomposition"""
+COMPONENTS = 3
+
+
+def write_scores(filepath, paths, names, scores):
+    """Write the table of scores, a row per file"""
+    with open(filepath, 'w') as table:
+        table.write('\t'.join(['filepath'] + names) + '\n')
+        for (path, row) in zip(paths, scores):
+            table.write('\t'.join([path] + ['%g' % v for v in row]) + '\n')
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+ncomponents = int(pipeline.pop_option(sys.argv, '--components', COMPONENTS))
+method = pipeline.pop_option(sys.argv, '--method', 'randomized')
+iterations = int(pipeline.pop_option(sys.argv, '--iterations',
+                                     decomposition.NMF_ITERATIONS))
+prefix = pipeline.pop_option(sys.argv, '--out')
+reconstruct = pipeline.pop_flag(sys.argv, '--reconstruct')
+
+if len(sys.argv) < 3:
+    print(usage.format(os.path.basename(sys.argv[0]), COMPONENTS,
+                       '|'.join(decomposition.METHODS),
+                       decomposition.NMF_ITERATIONS, newfmt.format('datafile1')))
+    sys.exit(0)
+
+paths = pipeline.existing_files(sys.argv[1:])
+if not paths:
+    sys.exit(1)
+options = {'iterations': iterations} if method == 'nmf' else {}
+try:
+    model, scores, spool = decomposition.decompose(
+        pipeline.ReadAhead(paths, stages), ncomponents, method, **options)
+except ValueError as e:
+    print("Error: {0}".format(e))
+    sys.exit(1)
+
+if prefix is None:
+    prefix = newfmt.format(paths[0])
+names = model.component_names()
+model.save(prefix + '.npz')
+headers = dict(spool.headers.items())
+headers['decomposed'] = '%s of %d spectra' % (method, len(spool))
+headers['explained'] = ', '.join('%.6g' % v for v in model.explained)
+columns = [('mean', model.mean)] if method != 'nmf' else []
+aggregate.write_columns(prefix + '_components', model.x,
+                        columns + list(zip(names, model.components)),
+                        headers, spool.provenance)
+write_scores(prefix + '_scores', spool.paths, names, scores)
+for (name, fraction) in zip(names, model.explained):
+    print("%6s  %8.4f%%" % (name, 100 * fraction))
+print("Saving {0}.npz, {0}_components, {0}_scores".format(prefix))
+
+if reconstruct:
+    with pipeline.AsyncWriter() as writer:
+        for spdata in pipeline.ReadAhead(spool.paths, stages):
+            fpath_new = denoisedfmt.format(spdata.headers['filepath'],
+                                           len(model))
+            writer.write(fpath_new, model.denoise(spdata, filepath=prefix +
+                                                  '.npz'))
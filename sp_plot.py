@@ -5,22 +5,29 @@
 import sys
 import os
 import re
-import matplotlib.pyplot as pl
-import spectrum as sp
+import pipeline
 
 MAX_LEGEND_ENTRY_LEN = 30
 
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+render_options = pipeline.pop_render_options(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
 if len(sys.argv) == 1:
-    print("usage: {0} datafile1 [datafile2 ...]".format(
+    print("usage: {0} [--ev|--nm [--jacobian]] [--render dir [--format png,svg,pdf]"
+          " [--group N] [--dpi N] [--jobs N]] datafile1 [datafile2 ...]".format(
         os.path.basename(sys.argv[0])))
     sys.exit(0)
 
-data = []
-for arg in sys.argv[1:]:
-    if not (os.path.exists(arg) and os.path.isfile(arg)):
-        print("Warning! Cannot open file <" + arg + ">. Skipping.")
-        continue
-    data.append(sp.spectrum_from_file(arg))
+if render_options is not None:
+    # Headless mode: images are written to files, nothing is shown
+    import render
+    render.render_from_argv(sys.argv, 'plot', stages, render_options)
+    sys.exit(0)
+
+import matplotlib.pyplot as pl
+
+data = pipeline.load_spectra(sys.argv[1:], stages)
 
 pl.figure()
 legend = []
@@ -35,7 +42,9 @@ for spdata in data:
         legend.append(legend_item[0:MAX_LEGEND_ENTRY_LEN-3] + "...")
     else:
         legend.append(legend_item)
-    pl.plot(spdata.x, spdata.y, label=legend_item)
+    # Only the level of detail visible on the screen is drawn
+    x, y = spdata.lod()
+    pl.plot(x, y, label=legend_item)
 pl.grid()
 pl.legend(legend)
 pl.show()
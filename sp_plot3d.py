@@ -3,7 +3,7 @@
 import sys
 import os
 import re
-import spectrum as sp
+import pipeline
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.collections import PolyCollection
 from matplotlib.colors import colorConverter
@@ -12,36 +12,37 @@ import numpy as np
 
 
 # Collect data from files
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
 if len(sys.argv) == 1:
-    print("usage: {0} datafile1 [datafile2 ...]".format(
+    print("usage: {0} [--ev|--nm [--jacobian]] datafile1 [datafile2 ...]".format(
         os.path.basename(sys.argv[0])))
     sys.exit(0)
 
-data = []
-for arg in sys.argv[1:]:
-    if not (os.path.exists(arg) and os.path.isfile(arg)):
-        print("Warning! Cannot open file <" + arg + ">. Skipping.")
-        continue
-    data.append(sp.spectrum_from_file(arg))
+data = pipeline.load_spectra(sys.argv[1:], stages)
 
 zs = []
 verts = []
 counter = 1
 for spctr in data:
     fname = spctr.headers['filepath']
-    try:
-        print(fname)
-        radius = re.search(
-            'R(\d+(\.\d+)?)', os.path.basename(fname)).groups()[0]
+    print(fname)
+    # Radius is taken from headers and from the file name if there is none
+    radius = spctr.header_number('R', 'radius')
+    if radius is None:
+        found = re.search('R(\d+(\.\d+)?)', os.path.basename(fname))
+        radius = float(found.groups()[0]) if found else None
         # print(float(re.findall('_R\d\d_', fname)[0].replace('_','').replace('R','')))
         # zs.append(float(re.findall('_R\d\d_', fname)[0].replace('_','').replace('R','')))
+    if radius is None:
+        zs.append(counter)
+    else:
         print(radius)
         zs.append(radius)
-    except IndexError:
-        zs.append(counter)
     print(zs)
     counter += 1
-    verts.append(list(zip(spctr.x, spctr.y)))
+    verts.append(np.column_stack(spctr.lod()))
 
 cc = lambda arg: colorConverter.to_rgba(arg, alpha=0.3)
 poly = PolyCollection(verts, facecolors=[cc('r'), cc('g'), cc('b'), cc('y')])
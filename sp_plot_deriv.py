@@ -5,20 +5,19 @@ import sys
 import os
 import matplotlib.pyplot as pl
 import spectrum as sp
+import pipeline
 import numpy as np
 
 
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
 if len(sys.argv) == 1:
-    print("usage: {0} datafile1 [datafile2 ...]".format(
+    print("usage: {0} [--ev|--nm [--jacobian]] datafile1 [datafile2 ...]".format(
         os.path.basename(sys.argv[0])))
     sys.exit(0)
 
-data = []
-for arg in sys.argv[1:]:
-    if not (os.path.exists(arg) and os.path.isfile(arg)):
-        print("Warning! Cannot open file <" + arg + ">. Skipping.")
-        continue
-    data.append(sp.spectrum_from_file(arg))
+data = pipeline.load_spectra(sys.argv[1:], stages)
 
 pl.figure()
 # TODO show grid
@@ -6,23 +6,29 @@ import sys
 import os
 
 import numpy as np
-import matplotlib.pyplot as pl
 
-import spectrum as sp
+import pipeline
 
 MAX_LEGEND_ENTRY_LEN = 30
 
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+render_options = pipeline.pop_render_options(sys.argv)
 if len(sys.argv) == 1:
-    print("usage: {0} datafile1 [datafile2 ...]".format(
+    print("usage: {0} [--render dir [--format png,svg,pdf] [--group N] [--dpi N]"
+          " [--jobs N]] datafile1 [datafile2 ...]".format(
         os.path.basename(sys.argv[0])))
     sys.exit(0)
 
-data = []
-for arg in sys.argv[1:]:
-    if not (os.path.exists(arg) and os.path.isfile(arg)):
-        print("Warning! Cannot open file <" + arg + ">. Skipping.")
-        continue
-    data.append(sp.spectrum_from_file(arg))
+if render_options is not None:
+    # Headless mode: images are written to files, nothing is shown
+    import render
+    render.render_from_argv(sys.argv, 'polar', (), render_options)
+    sys.exit(0)
+
+import matplotlib.pyplot as pl
+
+data = pipeline.load_spectra(sys.argv[1:])
 
 pl.figure()
 legend = []
@@ -4,84 +4,117 @@ import sys
 import os
 import re
 
-import spectrum as sp
-
+import numpy as np
 
-def te_or_tm(matchobj):
-    """Returns 'te' for 'tm' and vice versa.
-
-    Used in re.sub for polarization type substitution"""
-    if matchobj.group(0) == 'te':
-        return 'tm'
-    elif matchobj.group(0) == 'tm':
-        return 'te'
-    else:
-        raise ValueError("Invalid polarization: '" + matchobj.group(0) + "'")
-
-
-usagefmt = "usage: {0} TEfile1 TMfile1 [TEfile2 TMfile2 ... ]"
-
-_, first, datalist = sp.get_data_list(sys.argv, usagefmt=usagefmt, minfiles=2)
-if first.__class__ is sp.Spectrum:
-    datalist = [first] + datalist
-
-# Pattern for polarization search in a path
-tetm = re.compile(".*\\" + os.path.sep + '.*(te|tm).*')
-polchooser = lambda m: m.groups(0)[0].lower() == 'te' and 'tm' or 'te'
-
-
-def extract_pair(datalist):
-    """Returns spectrum instances for two corresponding TE and TM polarizations
-    searched by their filenames"""
-    str_te, str_tm = 'te', 'tm'
-    te, tm = None, None
-
-    data1 = datalist.pop()
-    path1 = data1.headers['filepath']
-    fdir, fname1 = os.path.split(path1)
-    fname2 = re.sub('(TE|TM)', polchooser, fname1, flags=re.IGNORECASE)
-    if fname1 == fname2:
-        raise Exception("Cannot determine polarization from name {0}".format(fname1))
-    path2 = os.path.join(fdir, fname2)
-    data2 = [d for d in datalist if d.headers['filepath'].lower() == path2.lower()]
-    
-    # print('Got', data1.headers['filepath'])
-    # print('Looking for', path2)
-    l = len(data2) 
-    if l == 1:
-        data2 = data2[0]
-        # print('Found', data2.headers['filepath'])
-        datalist.remove(data2)
-    elif l == 0:
-        raise Exception('{0} not found'.format(path2))
-    else:
-        raise Exception('Found {0} corresponding files for {1}:\n{2}'.format( 
-                l, path1, '\t\n'.join([d.headers['filepath'] for d in data2])))
-
-    if str_te in fname1.lower():
-        te, tm = data1, data2
-    elif str_tm in fname1.lower():
-        te, tm = data2, data1
-    return te, tm
-
-cnt = 1
-while datalist:
-    # Debug
-    # print('\n'.join([str(s.headers) for s in datalist]))
-    try:  # Stupid pattern?
-        te, tm = extract_pair(datalist)
-    except Exception as e:
-        print("Error: {0}".format(e))
-        continue
-
-    poldeg = (tm - te) / (tm + te)
-    # print(poldeg.headers)
-
-    fdir, fname_te = os.path.split(te.headers['filepath'])
+import spectrum as sp
+import pipeline
+
+
+# Pattern for polarization search in a file name
+POLARIZATION = re.compile('(te|tm)', flags=re.IGNORECASE)
+POLARIZATION_SWAP = {'te': 'tm', 'tm': 'te'}
+
+
+def polarization_key(path):
+    """Returns the key of the file path with polarizations stripped and the
+    tuple of polarizations found in the file name, lowercased.
+
+    Paths of TE and TM files of the same measurement share the key."""
+    fdir, fname = os.path.split(path)
+    pols = tuple(p.lower() for p in POLARIZATION.findall(fname))
+    key = os.path.join(fdir, POLARIZATION.sub('{}', fname)).lower()
+    return key, pols
+
+
+def pair_paths(paths):
+    """Returns the list of (te_path, tm_path) pairs matched by file names,
+    the list of paths without a pair and the list of (path, found_paths) of
+    paths with several corresponding files, e.g. differing in case only.
+
+    Only file names are looked at, the files are not read."""
+    groups = {}
+    for path in paths:
+        key, pols = polarization_key(path)
+        groups.setdefault(key, {}).setdefault(pols, []).append(path)
+
+    pairs, lonely, ambiguous = [], [], []
+    for key, group in groups.items():
+        for pols, group_paths in group.items():
+            if not pols:
+                lonely.extend(group_paths)
+                continue
+            found = group.get(tuple(POLARIZATION_SWAP[p] for p in pols))
+            if found is None:
+                lonely.extend(group_paths)
+            elif len(found) > 1:
+                ambiguous.extend((path, found) for path in group_paths)
+            elif len(group_paths) == 1 and pols[0] == 'te':
+                pairs.append((group_paths[0], found[0]))
+    return pairs, lonely, ambiguous
+
+
+def polarization_degree(te, tm):
+    """Returns the spectrum of polarization degree (TM - TE) / (TM + TE).
+
+    Arrays are combined directly when X grids coincide, spectra arithmetic
+    with interpolation is used otherwise."""
+    if len(te) != len(tm) or not np.array_equal(te.x, tm.x):
+        return (tm - te) / (tm + te)
+    provenance = tm.provenance + (('subtracted', te.headers['filepath']),
+                                  ('divided_by', '(TM + TE)'))
+    return sp.Spectrum(tm.x, (tm.y - te.y) / (tm.y + te.y), tm.headers.copy(),
+                       copy=False, presorted=True, provenance=provenance)
+
+
+def process_pair(pair):
+    """Reads TE and TM files, writes their polarization degree file and
+    returns (new path, None), or (None, error) if the pair fails so that
+    the other pairs go on"""
+    te_path, tm_path = pair
+    fdir, fname_te = os.path.split(te_path)
     fname = re.sub('TE', 'TM-TE', fname_te, flags=re.IGNORECASE)
     newpath = os.path.join(fdir, fname)
-    print("{0}  Saving {1}".format(str(cnt).rjust(3), newpath))
-    cnt += 1
-    # try-catch on writing?
-    with open(newpath, 'w') as newfile:
-        newfile.write(str(poldeg))
+    try:
+        poldeg = polarization_degree(sp.spectrum_from_file(te_path),
+                                     sp.spectrum_from_file(tm_path))
+        with open(newpath, 'w') as newfile:
+            newfile.write(str(poldeg))
+    except (ValueError, IOError) as e:
+        return None, "{0} and {1}: {2}".format(te_path, tm_path, e)
+    return newpath, None
+
+
+if __name__ == '__main__':
+    usagefmt = "usage: {0} [--jobs N] TEfile1 TMfile1 [TEfile2 TMfile2 ... ]"
+
+    pipeline.setup_profiling(sys.argv)
+    pipeline.setup_io(sys.argv)
+    jobs = pipeline.pop_option(sys.argv, '--jobs')
+    if len(sys.argv) < 3:
+        print(usagefmt.format(os.path.basename(sys.argv[0])))
+        sys.exit(1)
+    if jobs is not None:
+        jobs = int(jobs)
+
+    paths = []
+    for fname in sys.argv[1:]:
+        if not (os.path.exists(fname) and os.path.isfile(fname)):
+            print("Cannot open file <" + fname + ">. Skipping.")
+            continue
+        paths.append(fname)
+
+    pairs, lonely, ambiguous = pair_paths(paths)
+    for path in lonely:
+        print("Error: no corresponding polarization file for {0}".format(path))
+    for (path, found) in ambiguous:
+        print("Error: Found {0} corresponding files for {1}:\n{2}".format(
+            len(found), path, '\t\n'.join(found)))
+
+    cnt = 1
+    for (newpath, error) in pipeline.parallel_map(process_pair, pairs,
+                                                  jobs=jobs):
+        if error is not None:
+            print("Error: {0}".format(error))
+            continue
+        print("{0}  Saving {1}".format(str(cnt).rjust(3), newpath))
+        cnt += 1
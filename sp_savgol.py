@@ -3,39 +3,89 @@
 # import argparse
 import sys
 import os
+from functools import partial
 import scipy.signal as sig
 import spectrum as sp
+import manifest
+import pipeline
 
 
 newfmt = "%s__savgol_%d_%d"
 
-if len(sys.argv) == 1:
-    print("usage: {0} window_size poly_order datafile1 [datafile2 ...]"
-          .format(os.path.basename(sys.argv[0])))
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+incremental = pipeline.pop_flag(sys.argv, '--incremental')
+watchdir = pipeline.pop_option(sys.argv, '--watch')
+# Manifests of the first pass keep the watch from smoothing the files again
+incremental = incremental or watchdir is not None
+
+if len(sys.argv) < (3 if watchdir else 4):
+    print("usage: {0} [--ev|--nm [--jacobian]] [--incremental] [--watch dir] "
+          "[--io N] window_size poly_order datafile1 [datafile2 ...]\n"
+          "Outputs are written next to the inputs as "
+          "datafile__savgol_<window_size>_<poly_order>; --watch implies "
+          "--incremental.".format(os.path.basename(sys.argv[0])))
     sys.exit(0)
 
-# refdata = sp.get_ref_data(sys.argv[1])
-window_size = float(sys.argv[1])
-poly_order = float(sys.argv[2])
+# refdata = pipeline.get_ref_data(sys.argv[1])
+window_size = int(sys.argv[1])
+poly_order = int(sys.argv[2])
+params = {'filter': 'savgol', 'window_size': window_size,
+          'poly_order': poly_order, 'stages': pipeline.describe_stages(stages)}
+
 
-data = []
-for arg in sys.argv[3:]:
-    if not (os.path.exists(arg) and os.path.isfile(arg)):
-        print("Warning! Cannot open file <" + arg + ">. Skipping.")
-        continue
-    data.append(sp.spectrum_from_file(arg))
+def output_path(fpath):
+    """Returns the path of the smoothed file"""
+    fname = newfmt % (os.path.basename(fpath), window_size, poly_order)
+    fdir = os.path.dirname(fpath)
+    return os.path.join(fdir, fname)
 
-for spdata in data:
+
+def smooth(spdata, writer, incremental):
+    """Queues writing of the smoothed spectrum. In incremental mode the
+    manifest is written after the file. Returns the new path."""
+    fpath = spdata.headers['filepath']
+    fpath_new = output_path(fpath)
     sm_headers = spdata.headers
     sm_headers["filter"] = "savgol, %d, %d" % (window_size, poly_order)
-    fname = newfmt % (
-        os.path.basename(spdata.headers['filepath']), window_size, poly_order)
-    sm_headers['filepath'] = fname
+    sm_headers['filepath'] = os.path.basename(fpath_new)
     sm_data = sp.Spectrum(spdata.x,
                           sig.savgol_filter(spdata.y, window_size,
-                                            poly_order), sm_headers)
-    fdir = os.path.dirname(spdata.headers['filepath'])
-    fpath_new = os.path.join(fdir, fname)
-    # fpath_new = os.path.join(fdir, newfmt % (fname, window_size, poly_order))
-    with open(fpath_new, 'w') as new_file:
-        new_file.write(str(sm_data))
+                                            poly_order), sm_headers,
+                          provenance=spdata.provenance)
+    then = None
+    if incremental:
+        then = partial(manifest.write_manifest, fpath_new, [fpath], params)
+    writer.write(fpath_new, sm_data, then)
+    return fpath_new
+
+
+paths = []
+for fpath in pipeline.existing_files(sys.argv[3:]):
+    if incremental and manifest.output_is_current(output_path(fpath),
+                                                  [fpath], params):
+        print("Up to date: %s" % fpath)
+    else:
+        paths.append(fpath)
+
+# Next files are read and previous results written while one is smoothed
+with pipeline.AsyncWriter() as writer:
+    for spdata in pipeline.ReadAhead(paths, stages):
+        smooth(spdata, writer, incremental)
+
+if watchdir:
+    # New files are processed as they appear, the outputs are not inputs
+    print("Watching %s" % watchdir)
+    with pipeline.AsyncWriter() as writer:
+        for fpath in manifest.watch_directory(watchdir, ignore=['__savgol_']):
+            if manifest.output_is_current(output_path(fpath), [fpath], params):
+                continue
+            try:
+                spdata = pipeline.apply_stages(sp.spectrum_from_file(fpath),
+                                               stages)
+                smooth(spdata, writer, True)
+            except (UnicodeDecodeError, ValueError):
+                print("Cannot read %s. Skipping." % fpath)
+                continue
+            print("Smoothed: %s" % fpath)
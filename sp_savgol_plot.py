@@ -6,10 +6,14 @@ import os
 import matplotlib.pyplot as pl
 import scipy.signal as sig
 import spectrum as sp
+import pipeline
 
 
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
 if len(sys.argv) < 4:
-    print("usage: {0} window_size poly_order datafile".format(
+    print("usage: {0} [--ev|--nm [--jacobian]] window_size poly_order datafile".format(
         os.path.basename(sys.argv[0])))
     sys.exit(0)
 
@@ -20,7 +24,7 @@ poly_order = float(sys.argv[2])
 datafile = sys.argv[3]
 if not (os.path.exists(datafile) and os.path.isfile(datafile)):
     exit(1)
-spec = sp.spectrum_from_file(datafile)
+spec = pipeline.apply_stages(sp.spectrum_from_file(datafile), stages)
 
 pl.figure()
 legend = []
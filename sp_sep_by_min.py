@@ -7,12 +7,30 @@ __date__ = '2015-02-11'
 import sys
 import os
 
-import spectrum as sp
+import pipeline
+
+
+def write_spectrum(spdata):
+    """Writes the spectrum to its filepath"""
+    with open(spdata.headers['filepath'], 'w') as new_file:
+        new_file.write(str(spdata))
+
+
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+split_all = pipeline.pop_flag(sys.argv, '--all')
+prominence = pipeline.pop_option(sys.argv, '--prominence')
+width = pipeline.pop_option(sys.argv, '--width')
+smooth = pipeline.pop_option(sys.argv, '--smooth')
+jobs = int(pipeline.pop_option(sys.argv, '--jobs', 4))
 
 if len(sys.argv) < 4:
-    print("usage: {0} xleft xright [datafile ...]".format(
+    print("usage: {0} [--all [--prominence P] [--width N] [--smooth N]]"
+          " [--jobs N] xleft xright [datafile ...]".format(
         os.path.basename(sys.argv[0])))
     print("xleft or xright can be omitted by passing underscore '_'")
+    print("--all splits at every minimum found in the range instead of the"
+          " lowest one")
     sys.exit(0)
 
 
@@ -30,16 +48,15 @@ if xright_str == "_":
 else:
     xright = float(xright_str)
 
-if xleft is None and xright is None:
+if xleft is None and xright is None and not split_all:
     sys.exit(0)
 
+prominence = None if prominence is None else float(prominence)
+width = None if width is None else float(width)
+smooth = None if smooth is None else int(smooth)
+
 # Collecting data
-data = []
-for arg in sys.argv[3:]:
-    if not (os.path.exists(arg) and os.path.isfile(arg)):
-        print("Warning! Cannot open file <" + arg + ">. Skipping.")
-        continue
-    data.append(sp.spectrum_from_file(arg))
+data = pipeline.load_spectra(sys.argv[3:])
 
 dl = len(data)
 lenstr = str(len(data))
@@ -52,22 +69,32 @@ for spdata in data:
         print("Splitting %s" % spdata.headers['filepath'])
     cnt += 1
 
-    xmin, ymin, minpos = spdata.min(xleft, xright)
-    print("".rjust(ident) + "  minpos = %d   xmin = %f   ymin = %f" % (minpos, xmin, ymin))
-
-    l = len(spdata)
-    if minpos > 0:
-        spleft = sp.Spectrum(spdata.x[0:minpos], spdata.y[0:minpos], spdata.headers.copy())
-        spleft.headers['filepath'] += "__left(to_%s)" % str(xmin)
-        with open(spleft.headers['filepath'], 'w') as new_file:
-            new_file.write(str(spleft))
+    # Parts are views of the spectrum arrays, so nothing is copied
+    if not split_all:
+        xmin, ymin, minpos = spdata.min(xleft, xright)
+        print("".rjust(ident) + "  minpos = %d   xmin = %f   ymin = %f" % (minpos, xmin, ymin))
+        parts = []
+        if minpos > 0:
+            spleft = spdata.split([minpos])[0]
+            spleft.headers['filepath'] += "__left(to_%s)" % str(xmin)
+            parts.append(spleft)
+        else:
+            print("".rjust(ident) + "  Left-side spectrum is empty, omitting.")
+        if minpos < len(spdata) - 1:
+            spright = spdata.split([minpos])[-1]
+            spright.headers['filepath'] += "__right(from_%s)" % str(xmin)
+            parts.append(spright)
+        else:
+            print("".rjust(ident) + "  Right-side spectrum is empty, omitting.")
     else:
-        print("".rjust(ident) + "  Left-side spectrum is empty, omitting.")
+        minpos = spdata.valleys(prominence, width, smooth, xleft, xright)
+        print("".rjust(ident) + "  %d minima found" % len(minpos))
+        parts = spdata.split(minpos)
+        xbounds = ['_'] + [str(spdata.x[i]) for i in minpos] + ['_']
+        for i, part in enumerate(parts):
+            part.headers['filepath'] += "__part%d(from_%s_to_%s)" % (
+                i + 1, xbounds[i], xbounds[i + 1])
 
-    if minpos < l - 1:
-        spright = sp.Spectrum(spdata.x[minpos:l], spdata.y[minpos:l], spdata.headers.copy())
-        spright.headers['filepath'] += "__right(from_%s)" % str(xmin)
-        with open(spright.headers['filepath'], 'w') as new_file:
-            new_file.write(str(spright))
-    else:
-        print("".rjust(ident) + "  Right-side spectrum is empty, omitting.")
+    for _ in pipeline.parallel_map(write_spectrum, parts, jobs=jobs,
+                                   threads=True):
+        pass
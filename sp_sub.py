@@ -3,26 +3,103 @@
 # import argparse
 import sys
 import os
+from functools import partial
 
 import spectrum as sp
+import manifest
+import pipeline
 
 newfmt = "{0}__sub__{1}"
-usagefmt = "usage: {0} file_or_num file1 [file2 ... ]"
+usagefmt = ("usage: {0} [--ev|--nm [--jacobian]] [--incremental] [--watch dir]"
+            " [--io N] file_or_num file1 [file2 ... ]\n"
+            "Outputs are written next to the inputs as file1__sub__<reference>;"
+            " --watch implies --incremental.")
 
-ref_fname, refdata, data = sp.get_data_list(sys.argv, usagefmt=usagefmt, minfiles=2)
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
+stages = pipeline.stages_from_argv(sys.argv)
+incremental = pipeline.pop_flag(sys.argv, '--incremental')
+watchdir = pipeline.pop_option(sys.argv, '--watch')
+# Manifests of the first pass keep the watch from subtracting again
+incremental = incremental or watchdir is not None
+minfiles = 1 if watchdir else 2
 
-l = len(data)
-ll = str(len(data))
+if not minfiles < len(sys.argv):
+    print(usagefmt.format(os.path.basename(sys.argv[0])))
+    sys.exit(1)
+
+refdata = pipeline.get_ref_data(sys.argv[1], stages)
+ref_fname = str(refdata)
+inputs_ref = []
+if refdata.__class__ is sp.Spectrum:
+    ref_fname = os.path.basename(refdata.headers['filepath'])
+    inputs_ref = [refdata.headers['filepath']]
+params = {'operation': '__sub__', 'ref': ref_fname,
+          'stages': pipeline.describe_stages(stages)}
+
+
+def output_path(fpath):
+    """Returns the path of the file with the reference subtracted"""
+    fname = os.path.basename(fpath)
+    fdir = os.path.dirname(fpath)
+    return os.path.join(fdir, newfmt.format(fname, ref_fname))
+
+
+def is_current(fpath):
+    """Returns whether the output of the file is up to date"""
+    return manifest.output_is_current(output_path(fpath),
+                                      [fpath] + inputs_ref, params)
+
+
+def subtract(spdata, writer, incremental):
+    """Queues writing of the spectrum with the reference subtracted. In
+    incremental mode the manifest is written after the file. Returns the
+    new path."""
+    fpath = spdata.headers['filepath']
+    fpath_new = output_path(fpath)
+    then = None
+    if incremental:
+        then = partial(manifest.write_manifest, fpath_new,
+                       [fpath] + inputs_ref, params)
+    writer.write(fpath_new, spdata - refdata, then)
+    return fpath_new
+
+
+paths = []
+for fpath in pipeline.existing_files(sys.argv[2:]):
+    if incremental and is_current(fpath):
+        print("Up to date: %s" % fpath)
+    else:
+        paths.append(fpath)
+l = len(paths)
+ll = str(len(paths))
 ident = 2 * len(ll) + 1
 cnt = 1
 
-for spdata in data:
-    if l > 1:
-        print(("%s/%s" % (str(cnt), ll)).rjust(ident), "  ", end='')
-    cnt += 1
-    new_spec = spdata - refdata
-    fname = os.path.basename(spdata.headers['filepath'])
-    fdir = os.path.dirname(spdata.headers['filepath'])
-    fpath_new = os.path.join(fdir, newfmt.format(fname, ref_fname))
-    with open(fpath_new, 'w') as new_file:
-        new_file.write(str(new_spec))
+# Next files are read and previous results written while one is computed
+with pipeline.AsyncWriter() as writer:
+    for spdata in pipeline.ReadAhead(paths, stages):
+        if l > 1:
+            print(("%s/%s" % (str(cnt), ll)).rjust(ident), "  ", end='')
+            print(spdata.headers['filepath'])
+        cnt += 1
+        subtract(spdata, writer, incremental)
+
+if watchdir:
+    # New files are processed as they appear, the reference and the outputs
+    # are not inputs
+    print("Watching %s" % watchdir)
+    with pipeline.AsyncWriter() as writer:
+        for fpath in manifest.watch_directory(watchdir, ignore=['__sub__']):
+            if os.path.abspath(fpath) in map(os.path.abspath, inputs_ref):
+                continue
+            if is_current(fpath):
+                continue
+            try:
+                spdata = pipeline.apply_stages(sp.spectrum_from_file(fpath),
+                                               stages)
+                subtract(spdata, writer, True)
+            except (UnicodeDecodeError, ValueError):
+                print("Cannot read %s. Skipping." % fpath)
+                continue
+            print("Subtracted: %s" % fpath)
@@ -6,10 +6,12 @@ __date__ = '2015-02-11'
 import sys
 import os
 
-import spectrum as sp
+import pipeline
 
+pipeline.setup_profiling(sys.argv)
+pipeline.setup_io(sys.argv)
 if len(sys.argv) < 4:
-    print("usage: {0} xleft xright [datafile ...]".format(
+    print("usage: {0} [--io N] xleft xright [datafile ...]".format(
         os.path.basename(sys.argv[0])))
     print("xleft or xright can be omitted by passing underscore '_'")
     sys.exit(0)
@@ -45,17 +47,12 @@ else:
     fmt += "[%s,%s]"
     suffix = fmt % (xleft_str, xright_str)
 
-# Reading the data files
-data = []
-for arg in sys.argv[3:]:
-    if not (os.path.exists(arg) and os.path.isfile(arg)):
-        print("Warning! Cannot open file <" + arg + ">. Skipping.")
-        continue
-    data.append(sp.spectrum_from_file(arg))
+# Reading the data files while the previous ones are processed
+data = pipeline.ReadAhead(pipeline.existing_files(sys.argv[3:]))
 
 # Processing
-for spdata in data:
-    new = spdata.xfilter(xleft, xright)
-    fname = new.headers['filepath'] + suffix
-    with open(fname, 'w') as new_file:
-        new_file.write(str(new))
+with pipeline.AsyncWriter() as writer:
+    for spdata in data:
+        new = spdata.xfilter(xleft, xright)
+        fname = new.headers['filepath'] + suffix
+        writer.write(fname, new)
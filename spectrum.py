@@ -1,16 +1,34 @@
 #!/usr/bin/env python3
 # ~*~encoding: utf-8~*~
 
+import builtins
 import os
-import sys
+import re
+from collections.abc import Mapping, MutableMapping
 
 import numpy as np
 from scipy import interpolate
+from scipy import signal
 
+from despike import SPIKE_THRESHOLD, SPIKE_WINDOW, spike_mask
+from grid import (grid_array, grid_index, grid_searchsorted, grid_tolerance,
+                  uniform_grid)
+from lod import LOD_FACTOR, LOD_POINTS, lttb_decimate, minmax_decimate
+from profiling import PROFILER, timed
+
+
+__version__ = '0.2'
 
 EVNM_CONST = 1239.84193  # (1 eV) * (1 nm) = EVNM_CONST
 EVNM_BORDER = 100  # eV < 100 <= nm
 SPLINE_ORDER = 5  # Default order of spline interpolation
+NUMBER_PATTERN = re.compile(r'[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?')
+COLUMN_ENV = 'SPECTOOL_COLUMN'  # Y column taken of multi-column files
+DTYPE_ENV = 'SPECTOOL_DTYPE'  # Y storage type, one of DTYPES
+DTYPES = ('float64', 'float32')
+# Y values are stored as DTYPE, sums over them are taken in float64
+DTYPE = np.dtype(os.environ.get(DTYPE_ENV) if os.environ.get(DTYPE_ENV)
+                 in DTYPES else DTYPES[0])
 
 
 def convert_nmev(x_array):
@@ -18,51 +36,23 @@ def convert_nmev(x_array):
     Convert array of nanometers to electron-volts and in reverse
     x -> 1239.84193 / x
     """
-    return np.array([EVNM_CONST / x for x in x_array])
+    return EVNM_CONST / np.asarray(x_array, dtype=float)
 
 
-def check_and_exit(data):
+def set_dtype(name):
     """
-    Check whether the argument is Spectrum instance and exit otherwise
+    Set the type of Y values of spectra, cubes and chunked storage made
+    from now on, DTYPE, to one of DTYPES. float32 halves the memory and the
+    traffic of arithmetic and filters, while areas, means and fits are
+    still summed in float64. It is passed to worker processes as
+    SPECTOOL_DTYPE environment variable.
     """
-    if not data.__class__ is Spectrum:
-        print("Not XY data: {0}".format(data))
-        sys.exit(1)
-
-
-def get_ref_data(file_or_number):
-    """
-    Get reference data for a calculation via detecting whether the input is
-    a number or a file path. Returns either float or Spectrum instance with
-    the content of the file.
-    """
-    if os.path.exists(file_or_number) and os.path.isfile(file_or_number):
-        refdata = spectrum_from_file(file_or_number)
-    else:
-        refdata = float(file_or_number)
-    return refdata
-
-
-def get_data_list(filelist, usagefmt='usage: {0} reffile datafile1 [datafile2 ...]',
-                  minfiles=1, maxfiles=1024):
-    """Returns a list of spectrum instances"""
-    if not minfiles < len(filelist) < maxfiles:
-        print(usagefmt.format(os.path.basename(filelist[0])))
-        sys.exit(1)  # Maybe throwing an exception would be better here
-
-    refdata = get_ref_data(filelist[1])
-    datalist = []
-    for fname in filelist[2:]:
-        if not (os.path.exists(fname) and os.path.isfile(fname)):
-            print("Cannot open file <" + fname + ">. Skipping.")
-            continue
-        datalist.append(spectrum_from_file(fname))
-
-    ref_fname = str(refdata)
-    if refdata.__class__ is Spectrum:
-        ref_fname = os.path.basename(refdata.headers['filepath'])
-
-    return ref_fname, refdata, datalist
+    global DTYPE
+    if name not in DTYPES:
+        raise ValueError("Unknown Y type {0}, not one of {1}".format(
+            name, ', '.join(DTYPES)))
+    DTYPE = np.dtype(name)
+    os.environ[DTYPE_ENV] = name
 
 
 def point_deriv(x, y, i):
@@ -92,36 +82,153 @@ def ary_deriv(x, y):
     return dx, dy
 
 
+def nearest_index(x, xv):
+    """
+    Returns the index of the point of sorted array x nearest to xv found by
+    binary search
+    """
+    i = np.searchsorted(x, xv)
+    if i == len(x) or (i > 0 and xv - x[i - 1] <= x[i] - xv):
+        return i - 1
+    return i
+
+
+def xrange_indices(x, xl=None, xr=None):
+    """
+    Returns index range [lpos, rpos) of sorted array x for the interval from
+    xl to xr, the bounds being the nearest points. None means no bound.
+    """
+    lpos, rpos = 0, len(x)
+    if xl is not None and xl > x[0]:
+        lpos = nearest_index(x, xl)
+    if xr is not None and xr < x[-1]:
+        rpos = nearest_index(x, xr)
+    return lpos, rpos
+
+
+@timed('load')
 def spectrum_from_file(filepath):
     """
-    Returns Spectrum object with the data taken from passed file
+    Returns Spectrum object with the data taken from passed file, read by
+    the reader of its format (see readers). Of files of several Y columns
+    the one set by pipeline.setup_io is taken and named in 'column' header,
+    the first one by default with headers left as they are. Lines of text
+    files which cannot be parsed as X and Y go to headers as "key: value",
+    "key = value" or "key value" pairs.
+    """
+    import readers
+    x, ys, headers = readers.read(filepath)
+    column = os.environ.get(COLUMN_ENV)
+    if column is not None:
+        names = readers.column_names(headers, len(ys))
+        ys, names = readers.select_columns(ys, names, column)
+        headers['column'] = names[0]
+        # The spectrum has only one of the columns named
+        headers.pop('columns', None)
+    PROFILER.count('files loaded')
+    PROFILER.count('points loaded', len(x))
+    # A view of one of several columns would keep all of them in memory
+    return Spectrum(x, ys[0], headers, copy=len(ys) > 1)
+
+
+def parse_number(text):
     """
-    x = np.array([])
-    y = np.array([])
-    headers = {'filepath': filepath}
-
-    with open(filepath, 'r') as datafile:
-        textdata = datafile.read().splitlines()
-
-    for line in textdata:
-        # Empty strings
-        if line.strip() == '':
-            continue
-        try:
-            xy = line.replace(",", ".")
-            xy = xy.split()
-            x = np.append(x, [float(xy[0])])  # FIXME Expecxted Union[ndarray, iterable], got float
-            y = np.append(y, [float(xy[1])])  # FIXME Expecxted Union[ndarray, iterable], got float
-        except ValueError:
-             # If floats cannot be parsed the data is written to headers
-            seps = [':', '=', None]
-            for sep in seps:
-                info = line.split(sep, 1)
-                if len(info) == 2:
-                    headers[info[0]] = info[1]
-                    break
-    headers = {'filepath': filepath}
-    return Spectrum(x, y, headers)
+    Returns the first number found in the text, e.g. 10.0 for '10K',
+    or None if there is no number
+    """
+    match = NUMBER_PATTERN.search(str(text))
+    if match is None:
+        return None
+    return float(match.group(0))
+
+
+def provenance_headers(provenance):
+    """
+    Returns the provenance tuple of (operation, operand) pairs as a list of
+    (operation, operands) header pairs, operands of the same operation being
+    joined with commas
+    """
+    merged = {}
+    for (op, operand) in provenance:
+        merged.setdefault(op, []).append(str(operand))
+    return [(op, ', '.join(operands)) for (op, operands) in merged.items()]
+
+
+def format_headers(headers, provenance=(), **updates):
+    """
+    Returns header lines written before the data, "key:\tvalue" with keys
+    aligned to the right, of the headers mapping and the provenance merged
+    into it. Headers of updates are set after that, None removing one.
+    Empty string if there are no headers.
+    """
+    headers = dict(headers.items())
+    for (op, operands) in provenance_headers(provenance):
+        headers[op] = headers[op] + ', ' + operands if op in headers else operands
+    for (k, v) in updates.items():
+        if v is None:
+            headers.pop(k, None)
+        else:
+            headers[k] = v
+    if not headers:
+        return ''
+    max_header_len = max(len(k) for k in headers)
+    return '\n'.join(k.rjust(max_header_len) + ":\t" + str(v)
+                     for (k, v) in headers.items())
+
+
+class Headers(MutableMapping):
+    """
+    Spectrum headers map. Copies share the underlying dict until one of
+    them is changed, so spectra derived from one file do not copy headers.
+    """
+    __slots__ = ('_data', '_shared')
+
+    def __init__(self, data=None):
+        self._data = dict(data or {})
+        self._shared = False
+
+    @classmethod
+    def wrap(cls, data):
+        """Returns headers using the dict as is until the first change"""
+        headers = cls.__new__(cls)
+        headers._data = data
+        headers._shared = True
+        return headers
+
+    def copy(self):
+        self._shared = True
+        return Headers.wrap(self._data)
+
+    def _own(self):
+        if self._shared:
+            self._data = dict(self._data)
+            self._shared = False
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._own()
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self._own()
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return 'Headers(%r)' % (self._data,)
+
+    def __reduce__(self):
+        return (Headers, (self._data,))
 
 
 # TODO rename Spectrum class to XYData, because it has nothing to do with
@@ -129,7 +236,19 @@ def spectrum_from_file(filepath):
 class Spectrum(object):
     """
     Class for manipulation of two-column (X,Y) data with meta support
+
+    Operations made on the data are recorded in provenance, the tuple of
+    (operation, operand) pairs, and written along with headers.
+
+    X on a uniform grid, given as grid=(start, step) with x=None or found
+    in X passed unsorted (presorted=False), is kept as (start, step, count)
+    rather than an array, see grid.GRID_ULPS. The array is made when X is
+    first accessed, while index lookups, X cuts and arithmetic with spectra
+    on the same grid only use the grid.
+
+    Y is stored as DTYPE (see set_dtype) and X always as float64.
     """
+    __slots__ = ('_x', '_grid', 'y', 'headers', 'provenance', '_lod_cache')
     __op_headers = {'__add__':     'added_to',
                     '__sub__':     'subtracted',
                     '__mul__':     'multiplied_by',
@@ -137,19 +256,101 @@ class Spectrum(object):
                     '__truediv__': 'divided_by',
                     '__pow__':     'exponentiated_by'}
 
-    def __init__(self, x, y, headers=dict()):
-        if len(x) != len(y):
-            raise ValueError("X and Y must be of the same length")
-        # if len(x) == 0:
-        #     raise ValueError("Spectrum data must be non-zero")
-        # Ensure X is sorted in ascending order
-        if len(x) > 0:
-            x, y = zip(*sorted(list(zip(x, y))))
-        self.x = np.array(x, dtype=float)
-        self.y = np.array(y, dtype=float)
-        if headers.__class__ is not dict and headers is not None:
+    @timed('construct')
+    def __init__(self, x, y, headers=None, copy=True, presorted=False,
+                 provenance=(), grid=None):
+        # Without copying the arrays passed are used as is when possible
+        asarray = np.array if copy else np.asarray
+        y = asarray(y, dtype=DTYPE)
+        if grid is not None:
+            # The grid of another spectrum of the same length is shared
+            if len(grid) != 3 or grid[2] != len(y):
+                start, step = float(grid[0]), float(grid[1])
+                if not step > 0:
+                    raise ValueError("Grid step must be positive")
+                grid = (start, step, len(y))
+            x = None
+        else:
+            if len(x) != len(y):
+                raise ValueError("X and Y must be of the same length")
+            # if len(x) == 0:
+            #     raise ValueError("Spectrum data must be non-zero")
+            x = np.asarray(x, dtype=float)
+            # Ensure X is sorted in ascending order unless the caller knows
+            # it is. Descending X is just reversed, and only unordered one is
+            # sorted.
+            if len(x) > 1 and not presorted:
+                dx = np.diff(x)
+                if (dx < 0).any():
+                    if (dx <= 0).all():
+                        x, y = x[::-1], y[::-1]
+                    else:
+                        order = np.argsort(x, kind='mergesort')
+                        x, y = x[order], y[order]
+                grid = uniform_grid(x)
+            # X on the grid is not kept, so it is copied only if it is not
+            x = None if grid is not None else asarray(x, dtype=float)
+        self._x = x
+        self._grid = grid
+        self.y = y
+        if headers is None:
+            headers = Headers()
+        elif headers.__class__ is dict:
+            headers = Headers.wrap(headers)
+        elif not isinstance(headers, Headers):
             raise ValueError("headers must be a dict")
         self.headers = headers
+        self.provenance = tuple(provenance)
+
+    @property
+    def x(self):
+        """X array, made of the uniform grid when first accessed"""
+        if self._x is None:
+            self._x = grid_array(self._grid)
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._x = value
+        self._grid = None
+
+    @property
+    def grid(self):
+        """(start, step, count) of uniform X or None"""
+        return self._grid
+
+    def _x_at(self, i):
+        """Returns X of the i-th point"""
+        if self._grid is not None:
+            return self._grid[0] + self._grid[1] * i
+        return self._x[i]
+
+    def _with_y(self, y, headers, provenance):
+        """Returns spectrum of Y on X of this one, the arrays not copied"""
+        if self._grid is not None:
+            return Spectrum(None, y, headers, copy=False, grid=self._grid,
+                            provenance=provenance)
+        return Spectrum(self._x, y, headers, copy=False, presorted=True,
+                        provenance=provenance)
+
+    def _grid_offset(self, other):
+        """
+        Returns the index in this spectrum of the first point of the other
+        one if both are on the same uniform grid, otherwise None
+        """
+        if self._grid is None or other._grid is None:
+            return None
+        start, step, count = self._grid
+        other_start, other_step, other_count = other._grid
+        # Points must coincide within round-off along both spectra
+        tolerance = max(grid_tolerance(*self._grid),
+                        grid_tolerance(*other._grid))
+        if abs(other_step - step) * max(count, other_count) > tolerance:
+            return None
+        offset = round((other_start - start) / step)
+        if abs(start + step * offset - other_start) > tolerance:
+            return None
+        return int(offset)
 
     def __add__(self, other):
         return self.__arithmetic(other, '__add__')
@@ -169,6 +370,7 @@ class Spectrum(object):
     def __pow__(self, other):
         return self.__arithmetic(other, '__pow__')
 
+    @timed('arithmetic')
     def __arithmetic(self, other, method, verbose=False, spline_order=SPLINE_ORDER):
         """
         Arithmetic operation of the spectrum with a reference spectrum,
@@ -223,20 +425,34 @@ class Spectrum(object):
         # The second argument can be a number
         op_header = self.__op_headers[method]
         if isinstance(other, int) or isinstance(other, float):
-            if op_header in self.headers:
-                headers_new[op_header] += ", " + str(other)
-            else:
-                headers_new[op_header] = str(other)  # A number is here
-                if verbose:
-                    print(opfmt % (self.headers['filepath'], str(other)))
-            return Spectrum(self.x,
-                            getattr(self.y, method)(other), headers_new)
+            if verbose:
+                print(opfmt % (self.headers['filepath'], str(other)))
+            return self._with_y(getattr(self.y, method)(other), headers_new,
+                                self.provenance + ((op_header, str(other)),))
 
         # Make the operation
         # If the second operand is not a number it must be a Spectrum instance
         if not other.__class__ == Spectrum:
             raise TypeError("Not Spectrum instance or a number")
 
+        provenance = self.provenance
+        if 'filepath' in other.headers:
+            provenance += ((op_header, other.headers['filepath']),)
+
+        offset = self._grid_offset(other)
+        if offset is not None:
+            # The same grid, points of the overlap correspond by index
+            lpos, rpos = max(offset, 0), min(len(self), offset + len(other))
+            if rpos <= lpos:
+                raise ValueError("X ranges do not overlap")
+            if verbose:
+                print(opfmt % (self.headers['filepath'], other.headers['filepath']))
+            y_new = getattr(self.y[lpos:rpos], method)(
+                other.y[lpos - offset:rpos - offset])
+            return Spectrum(None, y_new, headers_new, copy=False,
+                            grid=(self._x_at(lpos), self._grid[1]),
+                            provenance=provenance)
+
         x_min, x_max, shift, length = self.overlap(other)
         shift1, shift2 = 0, 0
         if shift > 0:
@@ -257,16 +473,151 @@ class Spectrum(object):
                 y_new[i] = getattr(self.y[i + shift1], method)( other.y[i + shift2] )
                 continue
             if using_interpolation is False:
-                f = interpolate.interp1d(other.x, other.y, spline_order)
+                with PROFILER.timer('interpolation'):
+                    f = interpolate.interp1d(other.x, other.y, spline_order)
                 using_interpolation = True
             y_new[i] = getattr(self.y[i + shift1], method)( f( x_new[i] ))
 
-        if 'filepath' in other.headers:
-            headers_new[op_header] = other.headers['filepath']
         if verbose:
             print(opfmt % (self.headers['filepath'], other.headers['filepath']))
 
-        return Spectrum(x_new, y_new, headers_new)
+        return Spectrum(x_new, y_new, headers_new, copy=False,
+                        presorted=True, provenance=provenance)
+
+    def decimate(self, npoints=LOD_POINTS, method='minmax'):
+        """
+        Returns new spectrum of about npoints for drawing. Methods are
+        'minmax' which keeps extremes of npoints/2 equal X intervals and
+        'lttb' (largest triangle three buckets) which keeps the shape.
+
+        decimate(self, npoints=LOD_POINTS, method='minmax')
+        """
+        x, y = self.lod(npoints, method)
+        return Spectrum(x, y, self.headers.copy(), copy=False,
+                        provenance=self.provenance)
+
+    def lod(self, npoints=LOD_POINTS, method='minmax'):
+        """
+        Returns x and y arrays of about npoints (the level of detail) for
+        drawing, see decimate.
+
+        Min/max levels, each LOD_FACTOR times smaller than the previous one,
+        are built once and cached, so a request costs as much as the level
+        just above npoints. The cache is dropped when X or Y arrays are
+        replaced.
+        """
+        if method not in ('minmax', 'lttb'):
+            raise ValueError("Unsupported decimation method: '" + method + "'")
+        cache = getattr(self, '_lod_cache', None)
+        if cache is None or cache[0][0] is not self.x or cache[0][1] is not self.y:
+            cache = [(self.x, self.y)]
+            self._lod_cache = cache
+        # Extend the pyramid down to the level closest above npoints
+        while len(cache[-1][0]) > LOD_FACTOR * npoints:
+            x, y = cache[-1]
+            cache.append(minmax_decimate(x, y, len(x) // (2 * LOD_FACTOR)))
+        level = cache[0]
+        for level in reversed(cache):
+            if len(level[0]) > npoints:
+                break
+        if method == 'lttb':
+            return lttb_decimate(level[0], level[1], npoints)
+        return minmax_decimate(level[0], level[1], npoints // 2)
+
+    def header_number(self, *keys):
+        """
+        Returns the number from the first header found among keys, compared
+        case-insensitively, or None if there is none.
+
+        header_number(self, *keys)
+        """
+        lowered = dict((k.lower(), v) for (k, v) in self.headers.items())
+        for key in keys:
+            if key.lower() in lowered:
+                return parse_number(lowered[key.lower()])
+        return None
+
+    def convert_nmev(self, jacobian=False, inplace=False):
+        """
+        Convert X from nanometers to electron-volts and in reverse
+        x -> 1239.84193 / x
+
+        Conversion reverses X order, so the arrays are flipped rather than
+        sorted. With jacobian=True Y is taken as a spectral density and
+        multiplied by |dx/dx_new| = x**2 / 1239.84193, which keeps the area.
+        Returns new spectrum or this spectrum converted in place if
+        inplace=True. Y is copied either way, as it may be shared with other
+        spectra, e.g. pixels of a cube.
+
+        convert_nmev(self, jacobian=False, inplace=False)
+        """
+        provenance = self.provenance + (
+            ('converted', 'nm<->eV' + (', jacobian' if jacobian else '')),)
+        x_reversed = self.x[::-1]
+        if jacobian:
+            y_new = self.y[::-1] * x_reversed ** 2 / EVNM_CONST
+        else:
+            y_new = self.y[::-1].copy()
+        if inplace:
+            self.provenance = provenance
+            self.x = convert_nmev(x_reversed)
+            self.y = y_new
+            return self
+        return Spectrum(convert_nmev(x_reversed), y_new, self.headers.copy(),
+                        copy=False, presorted=True, provenance=provenance)
+
+    def despike(self, window=SPIKE_WINDOW, threshold=SPIKE_THRESHOLD,
+                inplace=False):
+        """
+        Replace spikes (see spike_mask) with the rolling median of the window.
+        Returns new spectrum or this one changed in place if inplace=True.
+        Y with spikes is copied in place too, as it may be shared with other
+        spectra, e.g. parts of split or pixels of a cube.
+
+        despike(self, window=SPIKE_WINDOW, threshold=SPIKE_THRESHOLD,
+                inplace=False)
+        """
+        mask, median = spike_mask(self.y, window, threshold)
+        provenance = self.provenance
+        if mask.any():
+            provenance += (('despiked', '%d points' % np.count_nonzero(mask)),)
+        y_new = self.y
+        if mask.any() or not inplace:
+            y_new = y_new.copy()
+            y_new[mask] = median[mask]
+        if inplace:
+            self.y = y_new
+            self.provenance = provenance
+            return self
+        return self._with_y(y_new, self.headers.copy(), provenance)
+
+    def shift_x(self, dx, scale=1.0, inplace=False):
+        """
+        Shift and scale X: x -> x * scale + dx, e.g. to correct a drift of
+        the spectrometer. Returns new spectrum sharing Y with this one or
+        this spectrum changed in place if inplace=True.
+
+        shift_x(self, dx, scale=1.0, inplace=False)
+        """
+        operand = '%g' % dx if scale == 1 else '%g * x + %g' % (scale, dx)
+        provenance = self.provenance + (('x_shifted', operand),)
+        if self._grid is not None and scale > 0:
+            start, step, count = self._grid
+            if inplace:
+                self._x = None
+                self._grid = (start * scale + dx, step * scale, count)
+                self.provenance = provenance
+                return self
+            return Spectrum(None, self.y, self.headers.copy(), copy=False,
+                            grid=(start * scale + dx, step * scale),
+                            provenance=provenance)
+        x_new = self.x * scale + dx
+        if inplace:
+            self.x = x_new
+            self.provenance = provenance
+            return self
+        return Spectrum(x_new, self.y, self.headers.copy(), copy=False,
+                        presorted=scale > 0, provenance=provenance)
 
     def overlap(self, other):
         """
@@ -276,15 +627,15 @@ class Spectrum(object):
         """
         if other.__class__ is not Spectrum:
             raise ValueError("Need a Spectrum in merge")
-        min1, max1 = self.x[0], self.x[-1]
-        min2, max2 = other.x[0], other.x[-1]
+        if len(self) == 0 or len(other) == 0:
+            raise ValueError("X ranges do not overlap")
+        min1, max1 = self._x_at(0), self._x_at(len(self) - 1)
+        min2, max2 = other._x_at(0), other._x_at(len(other) - 1)
         x_min = np.maximum(min1, min2)  # Min is max of mins
         x_max = np.minimum(max1, max2)  # Max is min of maxes
         if x_max < x_min:
             raise ValueError("X ranges do not overlap")
-        i1 = np.where(self.x >= x_min)[0][0]
-        i2 = np.where(other.x >= x_min)[0][0]
-        shift = i1 - i2
+        shift = self._first_at(x_min) - other._first_at(x_min)
         length = 0
         if shift > 0:
             length = np.minimum(len(self) - shift, len(other))
@@ -292,10 +643,18 @@ class Spectrum(object):
             length = np.minimum(len(other) + shift, len(self))
         return x_min, x_max, shift, length
 
+    def _first_at(self, xv):
+        """Returns the index of the first point with X not below xv"""
+        if self._grid is not None:
+            return grid_searchsorted(self._grid, xv)
+        return int(np.searchsorted(self._x, xv))
+
     def merge(self, other):
         """
         Merge this spectrum with the other one.
-        The overlap is linearly weighted.
+        The overlap is linearly weighted. Y is copied before blending, as it
+        may be shared with other spectra, e.g. parts of split or pixels of a
+        cube.
         """
         xmin, xmax, shift, length = self.overlap(other)
         if shift == 0:
@@ -306,10 +665,14 @@ class Spectrum(object):
         else:
             shift2 = -shift
 
-        for i in range(length):
-            c2 = (i + 1) / (length + 1)
-            c1 = 1 - c2
-            self.y[shift1 + i] = c1 * self.y[shift1 + i] + c2 * other.y[shift2 + i]
+        # Weights are taken in float64 whatever DTYPE is
+        c2 = np.arange(1, length + 1) / (length + 1)
+        c1 = 1 - c2
+        y_new = np.array(self.y, dtype=DTYPE)
+        y_new[shift1:shift1 + length] = (
+            c1 * self.y[shift1:shift1 + length] +
+            c2 * other.y[shift2:shift2 + length])
+        self.y = y_new
 
         if shift > 0:
             self.x = np.append(self.x, other.x[shift2 + length:])
@@ -324,18 +687,24 @@ class Spectrum(object):
             self.y = temp_y
             # TODO headers stuff
 
+    def provenance_headers(self):
+        """
+        Returns provenance as a list of (operation, operands) header pairs,
+        operands of the same operation being joined with commas
+        """
+        return provenance_headers(self.provenance)
+
+    @timed('serialize')
     def __str__(self):
         """
         String representation
         """
-        output = ""
-        if self.headers:
-            max_header_len = np.max([len(s) for s in self.headers.keys()])
-            output = '\n'.join(k.rjust(max_header_len) + ":\t" + str(v)
-                                   for (k, v) in self.headers.items())
+        output = format_headers(self.headers, self.provenance)
+        if output:
             output += "\n\n"
+        # float64 items are Python floats, formatted faster than float32 ones
         data_txt = '\n'.join("%f\t%f" % (k, v) for (k, v)
-                             in zip(self.x, self.y))
+                             in zip(self.x, np.asarray(self.y, dtype=float)))
         output += data_txt
         return output
 
@@ -346,6 +715,8 @@ class Spectrum(object):
         Technically it is length of X and Y.  If len(self.x) and len(self.y)
         are do not coincise ValeError raises.
         """
+        if self._x is None:
+            return len(self.y)
         if len(self.x) == len(self.y):
             return len(self.x)
         raise ValueError("X and Y are not of the same length")
@@ -361,9 +732,9 @@ class Spectrum(object):
         assumed to be constant and to take the majority of the signal length.
         """
         counts = dict()
-        y_min = np.min(np.abs(y))
-        y_max = np.max(np.abs(y))
-        round_order = np.int( np.ceil( np.log10( y_max / y_min )))
+        y_min = np.min(np.abs(self.y))
+        y_max = np.max(np.abs(self.y))
+        round_order = int( np.ceil( np.log10( y_max / y_min )))
         # Populate statistics
         for el in self.y:
             el = int(round(el, round_order))
@@ -377,30 +748,53 @@ class Spectrum(object):
 
     def area(self):
         """
-        Area under the Y curve
+        Area under the Y curve, summed in float64 whatever DTYPE is
+        """
+        y = self.y
+        if len(y) < 2:
+            return 0.0
+        if self._grid is not None:
+            ends = 0.5 * (float(y[0]) + float(y[-1]))
+            return float(self._grid[1] * (y.sum(dtype=float) - ends))
+        y = np.asarray(y, dtype=float)
+        return float(0.5 * np.dot(y[1:] + y[:-1], np.diff(self.x)))
+
+    def index_of(self, xv):
         """
-        s = 0
-        for i in range(len(self.x) - 1):
-            s += 0.5 * (self.y[i] + self.y[i + 1]) * (self.x[i + 1] - self.x[i])
-        return s
+        Returns the index of X point nearest to xv found by binary search,
+        or computed for the uniform grid
+        """
+        if self._grid is not None:
+            return grid_index(self._grid, xv)
+        return nearest_index(self.x, xv)
 
+    def _xrange(self, xl=None, xr=None):
+        """
+        Returns index range [lpos, rpos) of X interval from xl to xr, the
+        bounds being the nearest points. None means no bound.
+        """
+        if self._grid is not None:
+            lpos, rpos = 0, len(self)
+            if xl is not None and xl > self._x_at(0):
+                lpos = grid_index(self._grid, xl)
+            if xr is not None and xr < self._x_at(rpos - 1):
+                rpos = grid_index(self._grid, xr)
+            return lpos, rpos
+        return xrange_indices(self.x, xl, xr)
+
+    @timed('filter')
     def xfilter(self, xl=None, xr=None):
         """
         Cut X interval from xl to xr
         """
-        lpos = 0
-        rpos = len(self.x) - 1
-        xmin = self.x[0]
-        xmax = self.x[rpos]
-        need_new = False
-        if xl is not None and xl > xmin:
-            lpos = np.argmin(np.abs(self.x - xl))
-            need_new = True
-        if xr is not None and xr < xmax:
-            rpos = np.argmin(np.abs(self.x - xr))
-            need_new = True
-        if need_new:
-            return Spectrum(self.x[lpos:rpos], self.y[lpos:rpos], self.headers)
+        lpos, rpos = self._xrange(xl, xr)
+        if lpos > 0 or rpos < len(self):
+            if self._grid is not None and rpos > lpos:
+                return Spectrum(None, self.y[lpos:rpos], self.headers,
+                                grid=(self._x_at(lpos), self._grid[1]),
+                                provenance=self.provenance)
+            return Spectrum(self.x[lpos:rpos], self.y[lpos:rpos], self.headers,
+                            provenance=self.provenance)
         return self
 
     def min(self, xl=None, xr=None):
@@ -410,23 +804,9 @@ class Spectrum(object):
 
         min(self, xl=None, xr=None)
         """
-        need_new = True
-        posshift = 0
-        if xl is None and xr is None:
-            need_new = False
-        if xl is None:
-            xl = self.x[0]
-        if xr is None:
-            xr = self.x[len(self.x) - 1]
-        spcut = self
-        shift = 0
-        if need_new:
-            spcut = self.xfilter(xl, xr)
-            if xl != self.x[0]:
-                shift = np.argmin( np.abs(self.x - xl) )
-        min_pos_local = np.argmin( spcut.y )
-        min_pos = min_pos_local + shift
-        return spcut.x[min_pos_local], spcut.y[min_pos_local], min_pos
+        lpos, rpos = self._xrange(xl, xr)
+        min_pos = lpos + np.argmin(self.y[lpos:rpos])
+        return self._x_at(min_pos), self.y[min_pos], min_pos
 
     def max(self, xl=None, xr=None):
         """
@@ -435,11 +815,52 @@ class Spectrum(object):
 
         max(self, xl=None, xr=None)
         """
-        spcut = self.xfilter(xl, xr)
-        max_pos = np.argmax(spcut.y)
-        return spcut.x[max_pos], spcut.y[max_pos], max_pos
+        lpos, rpos = self._xrange(xl, xr)
+        max_pos = lpos + np.argmax(self.y[lpos:rpos])
+        return self._x_at(max_pos), self.y[max_pos], max_pos
 
-    def deduplicate(self, comparator=max):
+    def peaks(self, prominence=None, width=None, smooth=None, xl=None,
+              xr=None):
+        """
+        Returns the array of indices of Y maxima in the range [xl, xr] found
+        in one pass with scipy.signal.find_peaks.
+
+        prominence  minimum height of a peak over its surroundings
+        width       minimum peak width in points
+        smooth      Savitzky-Golay window in points to smooth Y before search
+
+        peaks(self, prominence=None, width=None, smooth=None, xl=None, xr=None)
+        """
+        lpos, rpos = self._xrange(xl, xr)
+        y = self.y[lpos:rpos]
+        if smooth:
+            y = signal.savgol_filter(y, smooth, 2)
+        found, _ = signal.find_peaks(y, prominence=prominence, width=width)
+        return found + lpos
+
+    def valleys(self, prominence=None, width=None, smooth=None, xl=None,
+                xr=None):
+        """
+        Returns the array of indices of Y minima in the range [xl, xr], see
+        peaks for the options.
+
+        valleys(self, prominence=None, width=None, smooth=None, xl=None, xr=None)
+        """
+        negated = self._with_y(-self.y, self.headers, ())
+        return negated.peaks(prominence, width, smooth, xl, xr)
+
+    def split(self, indices):
+        """
+        Split the spectrum at the indices, each split point starting the next
+        part. Returns the list of spectra sharing arrays with this one.
+        """
+        bounds = [0] + sorted(int(i) for i in indices) + [len(self)]
+        return [Spectrum(self.x[a:b], self.y[a:b], self.headers.copy(),
+                         copy=False, presorted=True,
+                         provenance=self.provenance)
+                for (a, b) in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    def deduplicate(self, comparator=builtins.max):
         """
         Chooses one value between Y1 and Y2 at similar X.
 
@@ -457,8 +878,7 @@ class Spectrum(object):
             new_x.append(x)
             new_y.append(y)
         self.x = np.array(new_x, dtype=float)
-        self.y = np.array(new_y, dtype=float)
-
+        self.y = np.array(new_y, dtype=DTYPE)
 
 
 if __name__ == '__main__':
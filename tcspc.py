@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# ~*~encoding: utf-8~*~
+"""
+Histograms of raw TCSPC (time-correlated single photon counting) data.
+
+Raw files are binary arrays of photon arrival timestamps in ticks of the
+time-tagger clock. They are memory-mapped and read by chunks, the arrival
+times being folded modulo the laser period and counted into bins with
+numpy.bincount, so memory does not depend on the file size. The result is
+a decay curve Spectrum of counts over the delay in nanoseconds.
+"""
+
+from fractions import Fraction
+
+import numpy as np
+
+import spectrum as sp
+import profiling
+
+
+TICK = 0.001  # Time-tagger clock tick, nanoseconds
+BIN_WIDTH = 0.016  # nanoseconds
+DTYPE = '<u8'  # Little-endian unsigned 64-bit timestamps
+CHUNK_RECORDS = 1 << 22  # Timestamps read at once
+
+
+def open_timestamps(filepath, dtype=DTYPE, header=0):
+    """Returns read-only memory map of the timestamps after header bytes"""
+    return np.memmap(filepath, dtype=np.dtype(dtype), mode='r', offset=header)
+
+
+def in_ticks(value, tick=TICK):
+    """Returns time value in ticks, rounded off float noise of the units so
+    that whole numbers of ticks stay exact"""
+    return round(value / tick, 9)
+
+
+def fold(timestamps, period):
+    """
+    Returns delays of the timestamps after the last laser pulse, i.e. their
+    times modulo the period, both in ticks.
+
+    Timestamps are taken relative to the first one, whose phase is found in
+    exact rational arithmetic, so that float precision is not lost on
+    large tick counts.
+    """
+    if len(timestamps) == 0:
+        return np.zeros(0)
+    base = int(timestamps[0])
+    phase = float(Fraction(base) % Fraction(period))
+    relative = (timestamps - timestamps.dtype.type(base)).astype(np.int64)
+    return np.mod(phase + relative, period)
+
+
+@profiling.timed('histogram')
+def histogram(filepath, period, bin_width=BIN_WIDTH, tick=TICK, dtype=DTYPE,
+              header=0, chunk=CHUNK_RECORDS):
+    """
+    Returns decay curve Spectrum of photon counts over the delay after the
+    laser pulse, bins of bin_width covering the period. X are bin centers,
+    period, bin_width and tick are in nanoseconds. The file is read by
+    chunks of timestamps, so memory does not depend on its size.
+
+    If the period is not a multiple of bin_width, the last bin is the
+    remainder of the period: its counts are scaled to the full bin width
+    and its X is the center of the remainder, so the decay tail keeps its
+    shape.
+    """
+    period_ticks, bin_ticks = in_ticks(period, tick), in_ticks(bin_width, tick)
+    nbins = int(np.ceil(period_ticks / bin_ticks))
+    counts = np.zeros(nbins, dtype=np.int64)
+    timestamps = open_timestamps(filepath, dtype, header)
+    for start in range(0, len(timestamps), chunk):
+        block = np.array(timestamps[start:start + chunk])
+        bins = (fold(block, period_ticks) // bin_ticks).astype(np.int64)
+        # Delays rounded up to the period go to the last bin
+        np.minimum(bins, nbins - 1, out=bins)
+        counts += np.bincount(bins, minlength=nbins)
+        profiling.PROFILER.count('photons', len(block))
+    del timestamps
+
+    x = (np.arange(nbins) + 0.5) * bin_width
+    y = counts.astype(float)
+    last_ticks = period_ticks - (nbins - 1) * bin_ticks
+    if last_ticks < bin_ticks:
+        x[-1] = 0.5 * ((nbins - 1) * bin_width + period)
+        y[-1] *= bin_ticks / last_ticks
+    headers = {'filepath': filepath,
+               'period': '%g ns' % period,
+               'bin width': '%g ns' % bin_width,
+               'tick': '%g ns' % tick,
+               'photons': str(int(counts.sum()))}
+    return sp.Spectrum(x, y, headers, copy=False, presorted=True)
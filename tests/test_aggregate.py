@@ -0,0 +1,58 @@
+# Regression tests of the aggregate module, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import aggregate
+
+
+def repeats(count=7, npoints=300):
+    rng = np.random.RandomState(3)
+    x = np.linspace(400, 700, npoints)
+    return [sp.Spectrum(x, 100 + rng.standard_normal(npoints))
+            for _ in range(count)]
+
+
+def test_running_stats_match_numpy():
+    spectra = repeats()
+    ys = np.array([spdata.y for spdata in spectra])
+    stats = aggregate.running_stats(spectra)
+    assert np.allclose(stats.mean_array(), ys.mean(axis=0))
+    assert np.allclose(stats.std_array(), ys.std(axis=0, ddof=1))
+
+
+def test_median_spooled_in_one_pass():
+    spectra = repeats()
+    reads = []
+
+    def read_once():
+        for spdata in spectra:
+            reads.append(spdata)
+            yield spdata
+
+    spool = aggregate.MedianSpool(len(spectra))
+    try:
+        aggregate.running_stats(read_once(), spool=spool)
+        median = spool.median_array()
+    finally:
+        spool.close()
+    assert len(reads) == len(spectra)
+    assert np.allclose(median, np.median([s.y for s in spectra], axis=0))
+
+
+def test_median_skips_points_not_covered():
+    x = np.linspace(0, 10, 11)
+    spectra = [sp.Spectrum(x, np.full(11, 1.0)),
+               sp.Spectrum(x, np.full(11, 2.0)),
+               sp.Spectrum(x[:6], np.full(6, 9.0))]
+    spool = aggregate.MedianSpool(len(spectra))
+    aggregate.running_stats(spectra, spool=spool)
+    median = spool.median_array()
+    spool.close()
+    assert np.allclose(median[:6], 2.0)
+    assert np.allclose(median[6:], 1.5)
@@ -0,0 +1,53 @@
+# Regression tests of the align module, run with pytest from the repository
+# root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import align
+
+
+X = np.linspace(400, 700, 3001)
+PEAKS = [(1.0, 450, 3), (0.6, 520, 5), (0.8, 600, 2), (0.4, 650, 4)]
+
+
+def peaks(x):
+    return sum(a * np.exp(-(x - c) ** 2 / (2 * w ** 2)) for (a, c, w) in PEAKS)
+
+
+def drifted(shift, scale=1.0):
+    """Returns the reference peaks as measured with the drift"""
+    return sp.Spectrum(X, peaks(X / scale - shift))
+
+
+@pytest.mark.parametrize('shift', [1.234, -0.47, 0.0])
+def test_pure_shift_is_recovered(shift):
+    found, scale = align.estimate_shift(drifted(shift), sp.Spectrum(X, peaks(X)))
+    assert abs(found - shift) < 0.02
+    assert scale == 1
+
+
+@pytest.mark.parametrize('shift, scale', [
+    (0.7, 1.01),
+    (1.234, 1.0),
+    (0.0, 1.005),
+    (-2.0, 0.995),
+])
+def test_shift_and_scale_are_recovered(shift, scale):
+    found_shift, found_scale = align.estimate_shift(
+        drifted(shift, scale), sp.Spectrum(X, peaks(X)), scale=True)
+    assert abs(found_scale - scale) < 1e-5
+    assert abs(found_shift - shift) < 0.02
+
+
+def test_aligned_spectra_match_reference():
+    ref = sp.Spectrum(X, peaks(X))
+    spectra = [drifted(0.7, 1.01), drifted(-1.5)]
+    for spdata in align.align(spectra, ref, scale=True):
+        y = np.interp(X[500:-500], spdata.x, spdata.y)
+        assert np.abs(y - ref.y[500:-500]).max() < 0.01
@@ -0,0 +1,68 @@
+# Behavior tests of the baseline estimation methods, run with pytest from
+# the repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import baseline
+
+
+X = np.linspace(0, 100, 2001)
+BASE = 100 + 30 * X / 100 - 20 * (X / 100) ** 2 + 5 * np.sin(0.03 * X)
+PEAKS = [(200, 20, 0.5), (80, 45, 1.0), (300, 70, 0.8), (50, 85, 0.3)]
+
+
+def spectrum():
+    """Returns narrow peaks with noise of 0.5 over the smooth BASE"""
+    rng = np.random.RandomState(0)
+    y = BASE + rng.normal(0, 0.5, len(X))
+    for (height, center, width) in PEAKS:
+        y += height * np.exp(-(X - center) ** 2 / (2 * width ** 2))
+    return sp.Spectrum(X, y, {'filepath': 'peaks'})
+
+
+@pytest.mark.parametrize('method, params', [
+    ('als', {'lam': 1e6, 'p': 0.001, 'niter': 30}),
+    ('poly', {}),
+    ('rollingball', {'radius': 60}),
+    ('snip', {'iterations': 60}),
+])
+def test_methods_recover_smooth_baseline(method, params):
+    spdata = spectrum()
+    found = baseline.estimate(spdata, method, params)
+    error = np.abs(found - BASE)
+    assert error.mean() < 2 and error.max() < 8
+    corrected = baseline.subtract(spdata, method, params)
+    for (height, center, _) in PEAKS:
+        assert abs(corrected.y[corrected.index_of(center)] - height) < 8
+
+
+def test_als_solves_the_penalized_system():
+    rng = np.random.RandomState(1)
+    x, y = np.arange(50.0), rng.rand(50)
+    z = baseline.als(x, y, lam=10.0, p=0.5, niter=1)
+    d = np.diff(np.eye(50), 2, axis=0)
+    expected = np.linalg.solve(np.eye(50) + 10.0 * d.T.dot(d), y)
+    assert np.allclose(z, expected)
+
+
+def test_estimates_are_cached_per_data_and_params():
+    spdata = spectrum()
+    first = baseline.estimate(spdata, 'snip')
+    assert baseline.estimate(spectrum(), 'snip') is first
+    assert baseline.estimate(spdata, 'snip', {'iterations': 10}) is not first
+    assert not first.flags.writeable
+
+
+def test_params_are_checked():
+    assert baseline.parse_params('lam=1e4,p=0.1') == {'lam': 1e4, 'p': 0.1}
+    assert baseline.parse_params('lls=False')['lls'] is False
+    with pytest.raises(ValueError):
+        baseline.method_params('als', {'radius': 5})
+    with pytest.raises(ValueError):
+        baseline.method_params('spline')
@@ -0,0 +1,81 @@
+# Behavior tests of chunked out-of-core processing, run with pytest from the
+# repository root. Chunks are made small so that every operation crosses
+# many chunk borders.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import chunked
+
+
+def spectrum(n=1003):
+    rng = np.random.RandomState(0)
+    x = np.sort(rng.uniform(400, 800, n))
+    return sp.Spectrum(x, np.sin(x / 9) + rng.normal(0, 0.1, n),
+                       {'filepath': 'noisy'})
+
+
+@pytest.fixture
+def stored(tmp_path):
+    return chunked.from_spectrum(spectrum(), str(tmp_path / 'a.npy'),
+                                 chunk_size=50)
+
+
+@pytest.mark.parametrize('xl, xr', [(None, None), (433.3, 702.1),
+                                    (None, 500), (799.9, None)])
+def test_area_matches_spectrum(stored, xl, xr):
+    assert np.isclose(stored.area(xl, xr), spectrum().xfilter(xl, xr).area(),
+                      rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('window', [5, 21, 49])
+def test_savgol_matches_whole_array(stored, tmp_path, window):
+    smoothed = stored.savgol(str(tmp_path / 'sg.npy'), window, 3)
+    assert np.array_equal(smoothed.x, spectrum().x)
+    assert np.allclose(smoothed.y,
+                       signal.savgol_filter(spectrum().y, window, 3))
+    with pytest.raises(ValueError):
+        stored.savgol(str(tmp_path / 'big.npy'), 51, 3)
+
+
+def test_xfilter_matches_spectrum(stored, tmp_path):
+    cut = stored.xfilter(str(tmp_path / 'cut.npy'), 433.3, 702.1)
+    expected = spectrum().xfilter(433.3, 702.1)
+    assert np.array_equal(cut.x, expected.x)
+    assert np.array_equal(cut.y, expected.y)
+    assert cut.headers['filepath'] == 'noisy'
+
+
+def test_arithmetic_interpolates_reference(stored, tmp_path):
+    reference = sp.Spectrum(np.linspace(450, 750, 77), np.linspace(1, 2, 77),
+                            {'filepath': 'ref'})
+    result = stored.arithmetic(str(tmp_path / 'sub.npy'), reference,
+                               '__sub__')
+    x, y = spectrum().x, spectrum().y
+    inside = (x >= 450) & (x <= 750)
+    assert np.array_equal(result.x, x[inside])
+    assert np.allclose(result.y, y[inside] - (1 + (x[inside] - 450) / 300))
+    assert result.provenance == (('subtracted', 'ref'),)
+
+
+def test_text_round_trip_of_descending_x(tmp_path):
+    spdata = spectrum()
+    txtpath = str(tmp_path / 'a.txt')
+    with open(txtpath, 'w') as text_file:
+        text_file.write('T: 10 K\n\n')
+        for xv, yv in zip(spdata.x[::-1], spdata.y[::-1]):
+            text_file.write('%f\t%f\n' % (xv, yv))
+    converted = chunked.convert_text(txtpath, str(tmp_path / 'a.npy'),
+                                     chunk_size=64)
+    assert np.allclose(converted.x, spdata.x, atol=1e-6)
+    assert np.allclose(converted.y, spdata.y, atol=1e-6)
+    assert converted.headers['T'] == '10 K'
+    outpath = str(tmp_path / 'out.txt')
+    converted.write_text(outpath)
+    assert np.allclose(sp.spectrum_from_file(outpath).y, spdata.y, atol=1e-6)
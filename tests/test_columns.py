@@ -0,0 +1,77 @@
+# Behavior tests of multi-column files read as spectra and cubes, run with
+# pytest from the repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import pipeline
+import cube
+
+
+X = np.linspace(1.2, 1.8, 61)
+COLUMNS = [('te', np.sin(X)), ('tm', np.cos(X)), ('repeat', X ** 2)]
+
+
+@pytest.fixture
+def column_env():
+    """Restores the column selection after the test"""
+    column = os.environ.get(sp.COLUMN_ENV)
+    yield
+    if column is None:
+        os.environ.pop(sp.COLUMN_ENV, None)
+    else:
+        os.environ[sp.COLUMN_ENV] = column
+
+
+@pytest.fixture
+def columns_file(tmp_path):
+    path = str(tmp_path / 'channels.txt')
+    spcube = cube.SpectralCube(X, [y for (_, y) in COLUMNS], {'T': '10 K'},
+                               names=[name for (name, _) in COLUMNS])
+    spcube.write_columns(path)
+    return path
+
+
+def test_first_column_is_read_by_default(columns_file, column_env):
+    os.environ.pop(sp.COLUMN_ENV, None)
+    spdata = sp.spectrum_from_file(columns_file)
+    assert np.allclose(spdata.y, np.sin(X), atol=1e-6)
+    assert spdata.headers['columns'] == 'x, te, tm, repeat'
+    assert 'column' not in spdata.headers
+
+
+@pytest.mark.parametrize('selection', ['tm', '2'])
+def test_column_option_selects_the_column(columns_file, column_env,
+                                          selection):
+    argv = ['sp_plot.py', '--column', selection, columns_file]
+    pipeline.setup_io(argv)
+    assert argv == ['sp_plot.py', columns_file]
+    spdata = sp.spectrum_from_file(columns_file)
+    assert np.allclose(spdata.y, np.cos(X), atol=1e-6)
+    assert spdata.headers['column'] == 'tm'
+    assert spdata.headers['T'] == '10 K'
+    assert 'columns' not in spdata.headers
+    os.environ[sp.COLUMN_ENV] = 'missing'
+    with pytest.raises(ValueError):
+        sp.spectrum_from_file(columns_file)
+
+
+def test_columns_cube_arithmetic_and_round_trip(columns_file, tmp_path):
+    spcube = cube.cube_from_columns(columns_file, 'repeat,te')
+    assert spcube.names == ['repeat', 'te']
+    assert np.allclose(spcube.data, [X ** 2, np.sin(X)], atol=1e-6)
+    result = spcube - sp.Spectrum(X, np.sin(X), {'filepath': 'sine'})
+    assert np.allclose(result.data, [X ** 2 - np.sin(X), 0 * X], atol=1e-6)
+    assert result[0].headers['column'] == 'repeat'
+
+    path = str(tmp_path / 'result.txt')
+    result.write_columns(path)
+    loaded = cube.cube_from_columns(path)
+    assert loaded.names == ['repeat', 'te']
+    assert np.allclose(loaded.data, result.data, atol=1e-6)
+    assert loaded.headers['subtracted'] == 'sine'
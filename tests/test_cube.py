@@ -0,0 +1,78 @@
+# Behavior tests of spectral cubes, run with pytest from the repository
+# root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+from scipy import interpolate
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import cube
+
+
+X = np.linspace(1.0, 2.0, 201)
+CENTERS = np.array([[1.3, 1.4, 1.5], [1.6, 1.7, 1.8]])
+
+
+def pixel_y(center):
+    return 1 + np.exp(-(X - center) ** 2 / 0.005)
+
+
+def write_pixels(tmpdir):
+    """Writes pixel files named by coordinates in scrambled order"""
+    paths = []
+    for (row, col) in [(1, 2), (0, 0), (1, 0), (0, 2), (0, 1), (1, 1)]:
+        path = os.path.join(str(tmpdir), 'map_x%d_y%d.txt' % (col, row))
+        with open(path, 'w') as pixfile:
+            pixfile.write(str(sp.Spectrum(X, pixel_y(CENTERS[row, col]))))
+        paths.append(path)
+    return paths
+
+
+def test_pixels_are_arranged_by_coordinates(tmp_path):
+    spcube = cube.cube_from_files(write_pixels(tmp_path), jobs=1)
+    assert spcube.shape == (2, 3)
+    xpeak, ypeak = spcube.peak_position()
+    assert np.allclose(xpeak, CENTERS, atol=1e-3)
+    assert np.allclose(ypeak, 2.0, atol=1e-3)
+
+
+def test_cube_operations_match_pixel_spectra():
+    rng = np.random.RandomState(0)
+    spcube = cube.SpectralCube(X, rng.rand(6, len(X)), shape=(2, 3))
+    background = sp.Spectrum(np.linspace(0.9, 2.1, 157), rng.rand(157),
+                             {'filepath': 'bg'})
+    difference = spcube - background
+    expected = interpolate.interp1d(background.x, background.y,
+                                    sp.SPLINE_ORDER)(X)
+    assert np.array_equal(difference.x, X)
+    assert np.allclose(difference.data, spcube.data - expected)
+    assert np.allclose((spcube - spcube[2]).data[2], 0)
+    cut = spcube - sp.Spectrum(X[10:150] + 1e-4, rng.rand(140))
+    assert cut.x[0] >= X[10] + 1e-4 and cut.x[-1] <= X[149] + 1e-4
+    assert difference.provenance == (('subtracted', 'bg'),)
+
+    areas = spcube.area(1.2, 1.6)
+    assert areas.shape == (2, 3)
+    for i in range(len(spcube)):
+        assert np.isclose(areas.flat[i], spcube[i].xfilter(1.2, 1.6).area())
+    assert np.allclose(spcube.savgol(11, 3).data,
+                       signal.savgol_filter(spcube.data, 11, 3, axis=1))
+    assert np.allclose(spcube.mean().y, spcube.data.mean(axis=0))
+    with pytest.raises(ValueError):
+        spcube + cube.SpectralCube(X, np.ones((5, len(X))))
+
+
+def test_matrix_file_round_trip(tmp_path):
+    spcube = cube.cube_from_files(write_pixels(tmp_path), jobs=1)
+    path = str(tmp_path / 'cube.txt')
+    spcube.write(path)
+    loaded = cube.cube_from_matrix(path)
+    assert loaded.shape == spcube.shape
+    assert np.allclose(loaded.x, spcube.x)
+    assert np.allclose(loaded.data, spcube.data, atol=1e-6)
+    assert np.array_equal(loaded.coords, spcube.coords)
@@ -0,0 +1,91 @@
+# Behavior tests of PCA and NMF decomposition, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import decomposition
+
+
+X = np.linspace(500, 700, 200)
+
+
+def sources():
+    """Returns three non-negative component spectra"""
+    return np.array([np.exp(-(X - c) ** 2 / (2 * w ** 2))
+                     for (c, w) in ((550, 10), (600, 20), (640, 8))])
+
+
+def spectra(count=600, noise=0.01, seed=0):
+    rng = np.random.RandomState(seed)
+    weights = rng.uniform(0, 1, (count, 3))
+    ys = weights.dot(sources()) + rng.normal(0, noise, (count, len(X)))
+    return [sp.Spectrum(X, y, {'filepath': 's%03d' % i})
+            for (i, y) in enumerate(ys)], ys
+
+
+@pytest.mark.parametrize('method', ['randomized', 'incremental'])
+def test_pca_matches_svd(method):
+    items, ys = spectra()
+    model, scores, spool = decomposition.decompose(items, 5, method)
+    mean = ys.mean(axis=0)
+    u, s, vt = np.linalg.svd(ys - mean, full_matrices=False)
+    total = ((ys - mean) ** 2).sum()
+    assert np.allclose(model.mean, mean)
+    exact = s[:5] ** 2 / total
+    assert np.allclose(model.explained[:3], exact[:3], rtol=1e-6)
+    assert model.explained[:3].sum() > 0.99
+    # Noise components are approximated from below
+    assert np.all(model.explained[3:] <= exact[3:] * (1 + 1e-9))
+    assert np.all(model.explained[3:] > 0.8 * exact[3:])
+    # Leading components are defined up to the sign
+    for i in range(3):
+        assert np.isclose(abs(np.dot(model.components[i], vt[i])), 1,
+                          atol=1e-6)
+    assert np.allclose(np.abs(scores[:, :3]), np.abs(u[:, :3] * s[:3]),
+                       atol=1e-4)
+    assert spool.paths == ['s%03d' % i for i in range(600)]
+    assert not os.path.exists(spool._path)
+
+
+def test_pca_blocks_do_not_change_results(monkeypatch):
+    items, _ = spectra(count=100)
+    whole, _, _ = decomposition.decompose(items, 3, 'incremental')
+    monkeypatch.setattr(decomposition, 'BLOCK_ROWS', 7)
+    blocked, _, _ = decomposition.decompose(items, 3, 'incremental')
+    assert np.allclose(blocked.explained, whole.explained)
+    assert np.allclose(blocked.components, whole.components, atol=1e-8)
+
+
+def test_nmf_finds_non_negative_sources():
+    items, ys = spectra(noise=0.0)
+    model, scores, _ = decomposition.decompose(items, 3, 'nmf')
+    assert (model.components >= 0).all() and (scores >= 0).all()
+    assert np.allclose(model.components.max(axis=1), 1)
+    residuals = scores.dot(model.components) - ys
+    assert np.sqrt((residuals ** 2).mean()) < 5e-3
+    for source in sources():
+        cosines = model.components.dot(source) / (
+            np.linalg.norm(model.components, axis=1) * np.linalg.norm(source))
+        assert cosines.max() > 0.99
+
+
+def test_denoise_with_saved_model(tmp_path):
+    items, _ = spectra()
+    model, _, _ = decomposition.decompose(items, 3)
+    path = str(tmp_path / 'model.npz')
+    model.save(path)
+    rng = np.random.RandomState(5)
+    clean = np.array([0.2, 0.7, 0.4]).dot(sources())
+    noisy = sp.Spectrum(X, clean + rng.normal(0, 0.05, len(X)))
+    denoised = decomposition.denoise_stage(noisy, path)
+    assert np.abs(denoised.y - clean).std() < 0.3 * np.abs(noisy.y - clean).std()
+    with pytest.raises(ValueError):
+        decomposition.decompose(items, 3, 'ica')
+    with pytest.raises(ValueError):
+        decomposition.load(str(tmp_path / 'missing.npz'))
@@ -0,0 +1,61 @@
+# Behavior tests of cosmic ray spike removal, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import despike
+
+
+SPIKES = [37, 500, 501, 1998]
+
+
+def noisy(seed=0, n=2000):
+    rng = np.random.RandomState(seed)
+    x = np.linspace(400, 800, n)
+    return x, 100 * np.exp(-(x - 600) ** 2 / 200) + rng.normal(0, 1, n)
+
+
+def test_rolling_median_matches_windows(monkeypatch):
+    monkeypatch.setattr(despike, 'WINDOW_BLOCK', 7)
+    y = np.random.RandomState(0).rand(50)
+    median, mad = despike.rolling_median(y, 5)
+    padded = np.pad(y, 2, mode='reflect')
+    for i in range(len(y)):
+        window = padded[i:i + 5]
+        assert median[i] == np.median(window)
+        assert mad[i] == np.median(np.abs(window - np.median(window)))
+
+
+def test_spikes_are_found_and_replaced():
+    x, y = noisy()
+    spiky = y.copy()
+    spiky[SPIKES] += 50
+    mask, _ = despike.spike_mask(spiky)
+    assert list(np.flatnonzero(mask)) == SPIKES
+    cleaned = sp.Spectrum(x, spiky).despike()
+    assert np.abs(cleaned.y - y).max() < 5
+    assert cleaned.provenance == (('despiked', '4 points'),)
+    # The peak, wider than the window, is kept
+    assert not despike.spike_mask(y)[0].any()
+    with pytest.raises(ValueError):
+        despike.spike_mask(y, window=10)
+
+
+def test_frames_spikes_are_replaced():
+    frames = np.array([noisy(seed)[1] for seed in range(5)])
+    spiky = frames.copy()
+    spiky[1, 100] += 30
+    spiky[3, 1500] += 30
+    cleaned, mask = despike.despike_frames(spiky)
+    assert sorted(zip(*np.nonzero(mask))) == [(1, 100), (3, 1500)]
+    assert np.array_equal(np.delete(cleaned, [100, 1500], axis=1),
+                          np.delete(frames, [100, 1500], axis=1))
+    two, mask = despike.despike_frames(spiky[:2])
+    assert list(zip(*np.nonzero(mask))) == [(1, 100)]
+    assert two[1, 100] == spiky[0, 100]
@@ -0,0 +1,80 @@
+# Behavior tests of the peak fitting module, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import fitting
+
+
+X = np.linspace(0, 10, 501)
+
+
+@pytest.mark.parametrize('shapes, params', [
+    (['gaussian'], [2.0, 4.3, 0.7, 0.1, 0.02]),
+    (['lorentzian'], [2.0, 4.3, 0.4, 0.1, 0.02]),
+    (['voigt'], [2.0, 4.3, 0.5, 0.3, 0.1, 0.02]),
+    (['gaussian', 'voigt'], [1.0, 3.0, 0.5, 2.0, 6.0, 0.4, 0.2, 0.1, 0.02]),
+])
+def test_jacobian_matches_finite_differences(shapes, params):
+    model = fitting.PeakModel(shapes, background='linear')
+    params = np.array(params)
+    _, jac = model.evaluate(X, params, jacobian=True)
+    for i in range(len(params)):
+        h = 1e-6 * max(abs(params[i]), 1)
+        dp = np.zeros(len(params))
+        dp[i] = h
+        numeric = (model.evaluate(X, params + dp) -
+                   model.evaluate(X, params - dp)) / (2 * h)
+        assert np.allclose(jac[:, i], numeric, rtol=1e-5, atol=1e-6), \
+            model.names[i]
+
+
+def test_line_shapes_have_the_area():
+    x = np.linspace(-200, 200, 400001)
+    for shape, widths in (('gaussian', (0.7,)), ('lorentzian', (0.4,)),
+                          ('voigt', (0.5, 0.3))):
+        y, _ = fitting.LINE_SHAPES[shape][0](x, 2.0, 0.3, *widths)
+        assert np.isclose(sp.Spectrum(x, y).area(), 2.0, rtol=3e-3), shape
+
+
+def test_fit_recovers_known_peaks():
+    model = fitting.PeakModel(['gaussian', 'lorentzian'],
+                              shared=None, background='constant')
+    true = dict(zip(model.names, [3.0, 3.5, 0.4, 1.5, 6.5, 0.3, 0.2]))
+    rng = np.random.RandomState(0)
+    y = model.evaluate(X, [true[name] for name in model.names])
+    spdata = sp.Spectrum(X, y + rng.normal(0, 0.005, len(X)), {'filepath': 'a'})
+    result = fitting.fit(spdata, model)
+    assert result.success
+    for name in model.names:
+        assert abs(result.params[name] - true[name]) < max(
+            5 * result.errors[name], 1e-3), name
+
+
+def test_shared_parameters_follow_their_source():
+    model = fitting.PeakModel(['gaussian', 'gaussian'],
+                              shared={'p1_sigma': 'p0_sigma'})
+    y = model.evaluate(X, [1.0, 3.0, 0.5, 2.0, 7.0, 0.5, 0.0])
+    result = fitting.fit(sp.Spectrum(X, y), model)
+    assert result.params['p1_sigma'] == result.params['p0_sigma']
+    assert np.isclose(result.params['p0_sigma'], 0.5, rtol=1e-4)
+    assert np.allclose(sorted([result.params['p0_center'],
+                               result.params['p1_center']]), [3.0, 7.0])
+    with pytest.raises(ValueError):
+        fitting.PeakModel(['gaussian'], shared={'p0_sigma': 'p1_sigma'})
+
+
+def test_batch_keeps_order():
+    model = fitting.PeakModel(['gaussian'])
+    centers = [3.0, 4.0, 5.0, 6.0, 7.0]
+    spectra = [sp.Spectrum(X, model.evaluate(X, [1.0, c, 0.5, 0.1]),
+                           {'filepath': str(c)}) for c in centers]
+    results = list(fitting.fit_batch(spectra, model, jobs=1))
+    assert [r.filepath for r in results] == [str(c) for c in centers]
+    assert np.allclose([r.params['p0_center'] for r in results], centers)
@@ -0,0 +1,78 @@
+# Regression tests of the float32 storage mode, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import despike
+import chunked
+
+
+# Wavelengths off a uniform grid needing more digits than float32 keeps,
+# written to text files as they are
+X = np.round(800.123456 + 0.001 * np.arange(1000)
+             + 1e-5 * np.sin(np.arange(1000)), 6)
+
+
+@pytest.fixture
+def float32():
+    """Switches to float32 Y for the test and restores the type after it"""
+    dtype, env = sp.DTYPE, os.environ.get(sp.DTYPE_ENV)
+    sp.set_dtype('float32')
+    yield
+    sp.DTYPE = dtype
+    if env is None:
+        os.environ.pop(sp.DTYPE_ENV, None)
+    else:
+        os.environ[sp.DTYPE_ENV] = env
+
+
+def spectrum():
+    return sp.Spectrum(X, np.sin(X), {'filepath': 'sine'})
+
+
+def test_spectrum_keeps_x(float32):
+    spdata = spectrum()
+    assert spdata.y.dtype == np.float32
+    assert spdata.x.dtype == np.float64
+    assert np.array_equal(spdata.x, X)
+
+
+def test_chunked_keeps_x(float32, tmp_path):
+    stored = chunked.from_spectrum(spectrum(), str(tmp_path / 'sine.npy'),
+                                   chunk_size=100)
+    assert stored.data.dtype == np.dtype([('x', '<f8'), ('y', '<f4')])
+    assert np.array_equal(stored.x, X)
+
+    txtpath = str(tmp_path / 'sine.txt')
+    with open(txtpath, 'w') as text_file:
+        text_file.write(str(spectrum()))
+    converted = chunked.convert_text(txtpath, str(tmp_path / 'text.npy'),
+                                     chunk_size=100)
+    assert np.array_equal(converted.x, X)
+
+
+def test_chunked_arithmetic_matches_spectrum(float32, tmp_path):
+    spdata = spectrum()
+    reference = sp.Spectrum(X, np.cos(X))
+    stored = chunked.from_spectrum(spdata, str(tmp_path / 'sine.npy'),
+                                   chunk_size=100)
+    result = stored.arithmetic(str(tmp_path / 'sub.npy'), reference,
+                               '__sub__')
+    expected = spdata - reference
+    assert np.array_equal(result.x, X)
+    assert np.array_equal(result.y, expected.y)
+
+
+def test_cube_keeps_x(float32):
+    import cube
+    spcube = cube.SpectralCube(X, np.vstack([np.sin(X), np.cos(X)]))
+    staged = spcube.apply_stages([despike.despike_stage])
+    for result in (spcube, staged):
+        assert result.data.dtype == np.float32
+        assert np.array_equal(result.x, X)
@@ -0,0 +1,51 @@
+# Behavior tests of header preservation and the metadata index of sp_index,
+# run with pytest from the repository root.
+
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import sp_index
+
+
+def write_spectrum(path, xl, xr, **headers):
+    headers['filepath'] = str(path)
+    spdata = sp.Spectrum(np.linspace(xl, xr, 31), np.arange(31.0), headers)
+    with open(str(path), 'w') as spfile:
+        spfile.write(str(spdata))
+    return str(path)
+
+
+def test_headers_are_kept(tmp_path):
+    path = write_spectrum(tmp_path / 'a.txt', 1.2, 1.8, T='10 K', sample='A12')
+    spdata = sp.spectrum_from_file(path)
+    assert spdata.headers['T'] == '10 K'
+    assert spdata.headers['sample'] == 'A12'
+    assert spdata.header_number('t') == 10.0
+
+
+def test_query_by_x_range_and_headers(tmp_path):
+    data = tmp_path / 'data'
+    (data / 'sub').mkdir(parents=True)
+    cold = write_spectrum(data / 'cold.txt', 1.0, 1.5, T='10 K', sample='A12')
+    warm = write_spectrum(data / 'warm.txt', 1.3, 2.0, T='300 K', sample='A12')
+    other = write_spectrum(data / 'sub' / 'b.txt', 1.9, 2.2, T='4 K',
+                           sample='B1')
+    with open(str(data / 'notes.txt'), 'w') as notes:
+        notes.write('not a spectrum\n')
+
+    db = sp_index.open_index(str(tmp_path / 'index.sqlite'))
+    assert sp_index.scan(db, str(data)) == 3
+    assert sp_index.scan(db, str(data)) == 0
+    assert sp_index.query(db) == sorted([cold, warm, other])
+    assert sp_index.query(db, 1.2, 1.8, ['T<50']) == [cold]
+    assert sp_index.query(db, 1.55, None) == sorted([warm, other])
+    assert sp_index.query(db, conditions=['sample=A12', 'T>=10']) == sorted(
+        [cold, warm])
+
+    os.remove(warm)
+    sp_index.scan(db, str(data))
+    assert sp_index.query(db, conditions=['sample=A12']) == [cold]
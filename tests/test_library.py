@@ -0,0 +1,79 @@
+# Behavior tests of the spectral library index, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import library
+
+
+GRID = np.linspace(500, 700, 401)
+
+
+def references(count=30, seed=0):
+    """Returns reference spectra of two random peaks each on a wider grid"""
+    rng = np.random.RandomState(seed)
+    x = np.linspace(480, 720, 961)
+    spectra = []
+    for i in range(count):
+        centers, widths = rng.uniform(510, 690, 2), rng.uniform(3, 15, 2)
+        y = 10 + sum(np.exp(-(x - c) ** 2 / (2 * w ** 2))
+                     for (c, w) in zip(centers, widths))
+        spectra.append(sp.Spectrum(x, y, {'filepath': 'ref%02d' % i}))
+    return spectra
+
+
+def brute_force(reference, query, valid, metric):
+    r = np.interp(GRID[valid], reference.x, reference.y)
+    q = np.interp(GRID[valid], query.x, query.y)
+    if metric == 'cosine':
+        return np.dot(r, q) / np.sqrt(np.dot(r, r) * np.dot(q, q))
+    if metric == 'correlation':
+        return np.corrcoef(r, q)[0, 1]
+    scale = np.dot(r, q) / np.dot(r, r)
+    return np.sqrt(np.mean((q - scale * r) ** 2))
+
+
+@pytest.fixture
+def lib(tmp_path):
+    lib = library.create(str(tmp_path / 'lib'), GRID)
+    assert lib.add(references()) == 30
+    return library.Library(str(tmp_path / 'lib'))
+
+
+@pytest.mark.parametrize('metric', library.METRICS)
+@pytest.mark.parametrize('xl, xr', [(450, 750), (550, 650)])
+def test_scores_match_brute_force(lib, metric, xl, xr):
+    query = references(seed=1)[0].xfilter(xl, xr)
+    valid = (GRID >= query.x[0]) & (GRID <= query.x[-1])
+    expected = [brute_force(r, query, valid, metric) for r in references()]
+    assert np.allclose(lib.scores(query, metric), expected)
+
+
+@pytest.mark.parametrize('metric', library.METRICS)
+def test_search_finds_the_reference(lib, metric):
+    rng = np.random.RandomState(2)
+    target = references()[17]
+    query = sp.Spectrum(target.x, 3 * target.y + rng.normal(0, 0.01,
+                                                            len(target)))
+    found = lib.search(query, k=3, metric=metric)
+    assert len(found) == 3
+    assert found[0][0] == 'ref17'
+
+
+def test_added_files_replace_their_rows(lib, tmp_path):
+    flat = sp.Spectrum(GRID, np.ones(len(GRID)), {'filepath': 'ref05'})
+    assert lib.add([flat]) == 1
+    reopened = library.Library(str(tmp_path / 'lib'))
+    assert len(reopened) == 30
+    assert reopened.scale[5] == 0
+    assert not reopened.rows()[5].any()
+    found = reopened.search(references()[5], k=30, metric='correlation')
+    assert found[-1][0] == 'ref05' and np.isnan(found[-1][1])
+    with pytest.raises(ValueError):
+        library.create(str(tmp_path / 'lib'), GRID)
@@ -0,0 +1,53 @@
+# Behavior tests of decimation for drawing, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import lod
+
+
+def noisy(n=100003):
+    rng = np.random.RandomState(0)
+    x = np.sort(rng.uniform(400, 800, n))
+    return x, np.sin(x / 7) + rng.normal(0, 0.1, n)
+
+
+def test_minmax_keeps_bucket_extremes():
+    x, y = noisy()
+    nbuckets = 500
+    xd, yd = lod.minmax_decimate(x, y, nbuckets)
+    assert len(xd) <= 2 * nbuckets + 2
+    assert (xd[0], xd[-1]) == (x[0], x[-1])
+    assert set(xd) <= set(x)
+    bucket = np.minimum(((x - x[0]) / (x[-1] - x[0]) * nbuckets).astype(int),
+                        nbuckets - 1)
+    bucket_d = np.searchsorted(x, xd)
+    for i in (0, 17, 250, nbuckets - 1):
+        assert y[bucket == i].max() == yd[bucket[bucket_d] == i].max()
+        assert y[bucket == i].min() == yd[bucket[bucket_d] == i].min()
+
+
+def test_lttb_keeps_ends_and_spike():
+    x, y = noisy()
+    y[54321] = 100.0
+    xd, yd = lod.lttb_decimate(x, y, 1000)
+    assert len(xd) == 1000
+    assert (xd[0], xd[-1]) == (x[0], x[-1])
+    assert np.all(np.diff(xd) > 0)
+    assert yd.max() == 100.0
+
+
+def test_lod_matches_direct_decimation_and_follows_y():
+    x, y = noisy()
+    spdata = sp.Spectrum(x, y)
+    xd, yd = spdata.lod(1000)
+    assert len(xd) <= 1002
+    assert yd.max() == y.max() and yd.min() == y.min()
+    assert len(spdata.decimate(300, 'lttb')) == 300
+    spdata.y = -spdata.y
+    assert spdata.lod(1000)[1].max() == -y.min()
@@ -0,0 +1,48 @@
+# Behavior tests of incremental processing manifests and directory watching,
+# run with pytest from the repository root.
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import manifest
+
+
+def write(path, text):
+    with open(str(path), 'w') as textfile:
+        textfile.write(text)
+    return str(path)
+
+
+def test_output_is_current_until_inputs_or_params_change(tmp_path):
+    source = write(tmp_path / 'a.txt', '1\t2\n')
+    output = write(tmp_path / 'a_sub.txt', '1\t1\n')
+    params = {'reference': 'ref.txt', 'window': 5}
+    assert not manifest.output_is_current(output, [source], params)
+
+    manifest.write_manifest(output, [source], params)
+    assert manifest.output_is_current(output, [source], params)
+    assert manifest.output_is_current(
+        output, [os.path.relpath(source)], dict(params))
+    assert not manifest.output_is_current(output, [source],
+                                          {'reference': 'ref.txt'})
+    other = write(tmp_path / 'b.txt', '1\t2\n')
+    assert not manifest.output_is_current(output, [source, other], params)
+
+    write(source, '1\t3\n')
+    assert not manifest.output_is_current(output, [source], params)
+    manifest.write_manifest(output, [source], params)
+    os.remove(output)
+    assert not manifest.output_is_current(output, [source], params)
+
+
+def test_watch_yields_files_once_written(tmp_path):
+    write(tmp_path / 'a.txt', '1\t2\n')
+    write(tmp_path / ('a.txt' + manifest.MANIFEST_SUFFIX), '{}')
+    write(tmp_path / 'skip_sub.txt', '1\t2\n')
+    write(tmp_path / 'b.dat', '1\t2\n')
+    watch = manifest.watch_directory(str(tmp_path), interval=0.01,
+                                     pattern='*.txt', ignore=['_sub'])
+    assert next(watch) == str(tmp_path / 'a.txt')
+    write(tmp_path / 'c.txt', '1\t2\n')
+    assert next(watch) == str(tmp_path / 'c.txt')
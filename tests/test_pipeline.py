@@ -0,0 +1,60 @@
+# Behavior tests of the batch infrastructure of the scripts, run with pytest
+# from the repository root.
+
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import pipeline
+
+
+def write_files(tmpdir, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(str(tmpdir), '%03d.txt' % i)
+        pipeline.write_spectrum(path, sp.Spectrum([400.0, 500.0, 600.0],
+                                                  [i, i, i]))
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_read_ahead_keeps_order(tmp_path, concurrency):
+    paths = write_files(tmp_path, 20)
+    stages = [lambda s: pipeline.nmev_stage(s, 'ev')]
+    spectra = list(pipeline.ReadAhead(paths, stages, concurrency))
+    assert [s.headers['filepath'] for s in spectra] == paths
+    assert [s.y[0] for s in spectra] == list(range(20))
+    assert all(s.x[-1] < sp.EVNM_BORDER for s in spectra)
+
+
+def test_read_ahead_raises_read_errors(tmp_path):
+    paths = write_files(tmp_path, 5)
+    paths[3] = str(tmp_path / 'missing.txt')
+    spectra = iter(pipeline.ReadAhead(paths, concurrency=2))
+    assert len([next(spectra) for _ in range(3)]) == 3
+    with pytest.raises(IOError):
+        next(spectra)
+
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_async_writer_writes_all(tmp_path, concurrency):
+    written = []
+    with pipeline.AsyncWriter(concurrency) as writer:
+        for i in range(20):
+            path = str(tmp_path / ('%03d.txt' % i))
+            writer.write(path, sp.Spectrum([1.0, 2.0], [i, i]),
+                         then=lambda path=path: written.append(path))
+    assert sorted(written) == sorted(str(p) for p in tmp_path.iterdir())
+    assert len(written) == 20
+    assert sp.spectrum_from_file(str(tmp_path / '007.txt')).y[0] == 7
+
+
+def test_async_writer_raises_write_errors(tmp_path):
+    with pytest.raises(IOError):
+        with pipeline.AsyncWriter(2) as writer:
+            writer.write(str(tmp_path / 'no' / 'dir.txt'),
+                         sp.Spectrum([1.0, 2.0], [1.0, 1.0]))
@@ -0,0 +1,34 @@
+# Behavior tests of TE/TM pairing and polarization degree of sp_polardeg,
+# run with pytest from the repository root.
+
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import sp_polardeg
+
+
+def test_pairs_are_matched_by_name():
+    paths = [os.path.join('d', name) for name in (
+        'r1_TM_10K.txt', 'r1_TE_10K.txt', 'r2_te.txt', 'r2_tm.txt',
+        'r3_TE.txt', 'r4.txt', 'r5_TE.txt', 'r5_TM.txt', 'r5_tm.txt')]
+    pairs, lonely, ambiguous = sp_polardeg.pair_paths(paths)
+    assert sorted(pairs) == [
+        (os.path.join('d', 'r1_TE_10K.txt'), os.path.join('d', 'r1_TM_10K.txt')),
+        (os.path.join('d', 'r2_te.txt'), os.path.join('d', 'r2_tm.txt'))]
+    assert sorted(lonely) == [os.path.join('d', 'r3_TE.txt'),
+                              os.path.join('d', 'r4.txt')]
+    assert [path for path, found in ambiguous] == [
+        os.path.join('d', 'r5_TE.txt')]
+
+
+def test_polarization_degree():
+    x = np.linspace(1.2, 1.8, 61)
+    te = sp.Spectrum(x, np.full(61, 1.0), {'filepath': 'te'})
+    tm = sp.Spectrum(x, np.full(61, 3.0), {'filepath': 'tm'})
+    assert np.allclose(sp_polardeg.polarization_degree(te, tm).y, 0.5)
+    shifted = sp.Spectrum(x[5:50] + 1e-4, np.full(45, 3.0), {'filepath': 'tm'})
+    assert np.allclose(sp_polardeg.polarization_degree(te, shifted).y, 0.5)
@@ -0,0 +1,52 @@
+# Behavior tests of the profiling timers and counters, run with pytest from
+# the repository root.
+
+import sys
+import os
+import json
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import profiling
+
+
+@pytest.fixture
+def profiler():
+    """Replaces the global profiler with an enabled tracing one for the
+    test and restores it after"""
+    saved = profiling.PROFILER.__dict__.copy()
+    profiling.PROFILER.__init__()
+    profiling.PROFILER.enable(trace=True)
+    yield profiling.PROFILER
+    profiling.PROFILER.__dict__.clear()
+    profiling.PROFILER.__dict__.update(saved)
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = profiling.Profiler()
+    with profiler.timer('stage'):
+        pass
+    profiler.count('items', 3)
+    assert profiler.timers == {} and profiler.counters == {}
+
+
+def test_loading_is_timed_and_counted(profiler, tmp_path):
+    path = str(tmp_path / 'a.txt')
+    with open(path, 'w') as spfile:
+        spfile.write(str(sp.Spectrum(np.linspace(1, 2, 101), np.ones(101))))
+    sp.spectrum_from_file(path)
+    sp.spectrum_from_file(path)
+    assert profiler.timers['load'][0] == 2
+    assert profiler.counters['files loaded'] == 2
+    assert profiler.counters['points loaded'] == 202
+    assert 'load' in profiler.summary()
+
+    trace = str(tmp_path / 'trace.json')
+    profiler.write_trace(trace)
+    with open(trace) as trace_file:
+        events = json.load(trace_file)['traceEvents']
+    assert [e['name'] for e in events].count('load') == 2
+    assert all(e['dur'] >= 0 for e in events)
@@ -0,0 +1,125 @@
+# Behavior tests of the readers of spectrum file formats, run with pytest
+# from the repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import readers
+
+
+def write(path, content):
+    mode = 'wb' if isinstance(content, bytes) else 'w'
+    with open(str(path), mode) as datafile:
+        datafile.write(content)
+    return str(path)
+
+
+def test_text_with_headers_and_decimal_commas(tmp_path):
+    path = write(tmp_path / 'a.txt', 'T: 10 K\nslit = 50 um\ngrating 1200\n\n'
+                 '1,5\t2,25\n2,5\t3,5\n\n3,5\t4,75\n')
+    x, ys, headers = readers.read(path)
+    assert np.array_equal(x, [1.5, 2.5, 3.5])
+    assert np.array_equal(ys, [[2.25, 3.5, 4.75]])
+    assert headers == {'T': '10 K', 'slit': '50 um', 'grating': '1200',
+                       'filepath': path}
+
+
+def test_ragged_text_rows_are_padded(tmp_path):
+    path = write(tmp_path / 'a.txt', '1 2 3\n2 4\n3 6 9\nend of data\n')
+    x, ys, headers = readers.read(path)
+    assert np.array_equal(x, [1, 2, 3])
+    assert np.array_equal(ys[0], [2, 4, 6])
+    assert np.isnan(ys[1, 1]) and ys[1, 2] == 9
+    assert headers['end'] == 'of data'
+
+
+@pytest.mark.parametrize('name, content', [
+    ('a.csv', 'sample: A12\n"nm","te","tm"\n400,1.5,2\n500,2.5,3\n'),
+    ('a.csv', 'sample: A12\nnm;te;tm\n400;1,5;2\n500;2,5;3\n'),
+    ('a.dat', 'sample: A12\nnm,te,tm\n400,1.5,2\n500,2.5,3\n'),
+])
+def test_csv_columns_are_named(tmp_path, name, content):
+    path = write(tmp_path / name, content)
+    assert readers.reader_for(path)[0] == 'csv'
+    x, ys, headers = readers.read(path)
+    assert np.array_equal(x, [400, 500])
+    assert np.array_equal(ys, [[1.5, 2.5], [2, 3]])
+    assert headers['sample'] == 'A12'
+    assert readers.column_names(headers, 2) == ['te', 'tm']
+    assert readers.select_columns(ys, ['te', 'tm'], 'tm,1')[1] == ['tm', 'te']
+    with pytest.raises(ValueError):
+        readers.select_columns(ys, ['te', 'tm'], '3')
+
+
+def spe_bytes(frames, strips, data, coeffs=None, datatype=3):
+    """Returns WinSpec SPE file content of the data"""
+    head = bytearray(readers.SPE_HEADER)
+    pixels = data.shape[-1]
+    np.frombuffer(head, '<f4', 1, 10)[:] = 0.5
+    head[20:30] = b'01Jan2020\0'
+    np.frombuffer(head, '<u2', 1, 42)[:] = pixels
+    np.frombuffer(head, '<i2', 1, 108)[:] = datatype
+    np.frombuffer(head, '<u2', 1, 656)[:] = strips
+    np.frombuffer(head, '<i4', 1, 1446)[:] = frames
+    if coeffs is not None:
+        head[3101] = len(coeffs) - 1
+        np.frombuffer(head, '<f8', len(coeffs), 3263)[:] = coeffs
+    return bytes(head) + data.astype(readers.SPE_DTYPES[datatype]).tobytes()
+
+
+def test_spe_frames_and_strips_are_columns(tmp_path):
+    data = np.arange(2 * 3 * 10).reshape(2, 3, 10)
+    path = write(tmp_path / 'a.spe', spe_bytes(2, 3, data, [500.0, 0.5, 1e-3]))
+    x, ys, headers = readers.read(path)
+    pixels = np.arange(1, 11)
+    assert np.allclose(x, 500 + 0.5 * pixels + 1e-3 * pixels ** 2)
+    assert np.array_equal(ys, data.reshape(6, 10))
+    assert headers['frames'] == '2' and headers['strips'] == '3'
+    assert headers['exposure'] == '0.5' and headers['date'] == '01Jan2020'
+    truncated = write(tmp_path / 'b.spe', spe_bytes(2, 3, data)[:-2])
+    with pytest.raises(ValueError):
+        readers.read(truncated)
+
+
+@pytest.mark.parametrize('data', [
+    # AFFN
+    ['1 20 24 30 30', '5 30 22 26'],
+    # SQZ, DIF and DUP with the Y check of the next line
+    ['1 B0MO%Tq', '7 B2M'],
+])
+def test_jcamp_xydata(tmp_path, data):
+    content = '\n'.join(['##TITLE= test', '##JCAMP-DX= 4.24', '##FIRSTX= 1',
+                         '##LASTX= 7', '##YFACTOR= 0.5', '##NPOINTS= 7',
+                         '##XYDATA= (X++(Y..Y))'] + data + ['##END='])
+    path = write(tmp_path / 'a.txt', content)
+    assert readers.reader_for(path)[0] == 'jcamp'
+    x, ys, headers = readers.read(path)
+    assert np.array_equal(x, np.arange(1, 8))
+    assert np.array_equal(ys, [[10, 12, 15, 15, 15, 11, 13]])
+    assert headers['TITLE'] == 'test'
+
+
+def test_jcamp_xypoints(tmp_path):
+    path = write(tmp_path / 'a.jdx', '##TITLE= points\n##XFACTOR= 2\n'
+                 '##XYPOINTS= (XY..XY)\n1, 5; 2, 6\n3, 7\n##END=\n')
+    x, ys, _ = readers.read(path)
+    assert np.array_equal(x, [2, 4, 6])
+    assert np.array_equal(ys, [[5, 6, 7]])
+
+
+def test_registered_reader_is_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(readers, '_readers', list(readers._readers))
+
+    @readers.register('twice', ('.two',), lambda head: head[:3] == b'TWO')
+    def read_twice(filepath):
+        x, ys, headers = readers.read_text(filepath)
+        return x, 2 * ys, headers
+
+    for name in ('a.two', 'a.txt'):
+        path = write(tmp_path / name, 'TWO\n1 2\n2 3\n')
+        assert np.array_equal(sp.spectrum_from_file(path).y, [4, 6])
@@ -0,0 +1,45 @@
+# Behavior tests of headless rendering, run with pytest from the repository
+# root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import pipeline
+import render
+
+
+def test_render_options_are_popped():
+    argv = ['sp_plot.py', '--format', 'svg', '--dpi', '50', 'a.txt']
+    assert pipeline.pop_render_options(argv) is None
+    assert argv == ['sp_plot.py', 'a.txt']
+    argv = ['sp_plot.py', '--render', 'out', '--group', '2', 'a.txt']
+    assert pipeline.pop_render_options(argv) == {
+        'outdir': 'out', 'formats': ['png'], 'group': 2, 'dpi': None,
+        'jobs': None}
+    assert argv == ['sp_plot.py', 'a.txt']
+
+
+def test_render_files_in_groups(tmp_path):
+    paths = []
+    for i in range(3):
+        x = np.linspace(400, 800, 100000)
+        spdata = sp.Spectrum(x, np.sin(x / (10 + i)))
+        paths.append(str(tmp_path / ('s%d.txt' % i)))
+        with open(paths[-1], 'w') as spfile:
+            spfile.write(str(spdata))
+    outdir = str(tmp_path / 'out')
+    written = list(render.render_files(paths, outdir, formats=('png', 'svg'),
+                                       group=2, dpi=20, jobs=1))
+    assert written == [
+        [os.path.join(outdir, 's0.txt__and_1_more.png'),
+         os.path.join(outdir, 's0.txt__and_1_more.svg')],
+        [os.path.join(outdir, 's2.txt.png'), os.path.join(outdir, 's2.txt.svg')]]
+    for path in sum(written, []):
+        assert os.path.getsize(path) > 0
+    with pytest.raises(ValueError):
+        render.render_files(paths, outdir, formats=('bmp',))
@@ -0,0 +1,149 @@
+# Regression tests of the spectrum module, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spectrum as sp
+import despike
+import pipeline
+
+
+def written_x(spdata):
+    """Returns X as written to a file"""
+    lines = str(spdata).split('\n\n', 1)[-1].split('\n')
+    return [line.split('\t')[0] for line in lines]
+
+
+@pytest.mark.parametrize('x', [
+    [0, 0.5, 1.00004, 1.5, 2.0],
+    400 + 0.05 * np.arange(1000) + np.r_[np.zeros(500), 1e-9, np.zeros(499)],
+    np.linspace(1, 2, 11) + np.r_[np.zeros(10), 5e-7],
+])
+def test_grid_detection_keeps_nearly_uniform_x(x):
+    x = np.asarray(x, dtype=float)
+    spdata = sp.Spectrum(x, np.arange(len(x)))
+    assert spdata.grid is None
+    assert np.array_equal(spdata.x, x)
+    assert written_x(spdata) == ['%f' % v for v in x]
+
+
+@pytest.mark.parametrize('x', [
+    np.linspace(400, 500, 1001),
+    400 + 0.05 * np.arange(50000),
+    -3 + 1e-3 * np.arange(7),
+])
+def test_grid_detection_keeps_uniform_x(x):
+    spdata = sp.Spectrum(x, np.arange(len(x)), presorted=False)
+    assert spdata.grid is not None
+    assert np.allclose(spdata.x, x, rtol=0, atol=4 * np.spacing(np.abs(x).max()))
+    assert written_x(spdata) == ['%f' % v for v in x]
+
+
+def test_grid_arithmetic_matches_array_arithmetic():
+    x = np.linspace(400, 500, 1001)
+    rng = np.random.RandomState(0)
+    a = sp.Spectrum(x, rng.rand(1001))
+    b = sp.Spectrum(x[100:700] + 0.0, rng.rand(600))
+    result = a - b
+    assert np.array_equal(result.x, x[100:700])
+    assert np.array_equal(result.y, a.y[100:700] - b.y)
+
+
+def spiky_spectrum():
+    x = np.linspace(400, 800, 200)
+    y = np.ones(200)
+    y[50] = 100.0
+    return sp.Spectrum(x, y, {'filepath': 'spiky'})
+
+
+@pytest.mark.parametrize('change', [
+    lambda s: s.convert_nmev(inplace=True, jacobian=True),
+    lambda s: s.convert_nmev(inplace=True),
+    lambda s: pipeline.nmev_stage(s, 'ev', jacobian=True),
+    lambda s: s.despike(inplace=True),
+    lambda s: despike.despike_stage(s),
+    lambda s: s.merge(s.shift_x(10 * (s.x[1] - s.x[0]))),
+])
+def test_inplace_changes_keep_source(change):
+    import cube
+    source = spiky_spectrum()
+    y = source.y.copy()
+    derived = [source.shift_x(1.0), source.xfilter(450, 700)]
+    derived += source.split([100])
+    for spdata in derived:
+        change(spdata)
+    change(source.convert_nmev())
+    assert np.array_equal(source.y, y)
+    pixels = cube.SpectralCube(source.x, np.tile(y, (2, 1)))
+    data = pixels.data.copy()
+    change(pixels[0])
+    assert np.array_equal(pixels.data, data)
+
+
+def test_nmev_conversion_reverses_and_keeps_area():
+    x = np.linspace(400, 800, 4001)
+    y = np.exp(-((x - 600) / 20) ** 2)
+    nm = sp.Spectrum(x, y)
+    ev = nm.convert_nmev(jacobian=True)
+    assert np.all(np.diff(ev.x) > 0)
+    assert np.allclose(ev.x, sp.EVNM_CONST / x[::-1])
+    assert np.isclose(ev.area(), nm.area(), rtol=1e-4)
+    back = ev.convert_nmev(jacobian=True)
+    assert np.allclose(back.x, x)
+    assert np.allclose(back.y, y)
+    assert np.array_equal(nm.convert_nmev().y, y[::-1])
+
+
+def test_nmev_stage_converts_once():
+    spdata = sp.Spectrum(np.linspace(400, 800, 11), np.arange(11))
+    pipeline.nmev_stage(spdata, 'ev')
+    x = spdata.x.copy()
+    pipeline.nmev_stage(spdata, 'ev')
+    assert np.array_equal(spdata.x, x)
+    assert x[-1] < sp.EVNM_BORDER
+    pipeline.nmev_stage(spdata, 'nm')
+    assert np.allclose(spdata.x, np.linspace(400, 800, 11))
+
+
+def test_peaks_valleys_and_split():
+    x = np.linspace(0, 10, 1001)
+    y = (np.exp(-(x - 2) ** 2 / 0.1) + 2 * np.exp(-(x - 5) ** 2 / 0.1)
+         + np.exp(-(x - 8) ** 2 / 0.1))
+    spdata = sp.Spectrum(x, y)
+    assert list(spdata.peaks(prominence=0.5)) == [200, 500, 800]
+    assert list(spdata.peaks(prominence=0.5, xl=4, xr=9)) == [500, 800]
+    valleys = spdata.valleys(prominence=0.5)
+    assert np.allclose(x[valleys], [3.5, 6.5], atol=0.05)
+
+    parts = spdata.split(valleys)
+    assert [len(part) for part in parts] == [valleys[0], valleys[1] - valleys[0],
+                                             1001 - valleys[1]]
+    assert np.array_equal(np.concatenate([part.y for part in parts]), y)
+    assert all(np.shares_memory(part.y, spdata.y) for part in parts)
+
+
+def test_headers_copy_on_write():
+    source = sp.Spectrum([1.0, 2.0], [3.0, 4.0], {'filepath': 'a', 'T': '10 K'})
+    derived = source.shift_x(1.0)
+    derived.headers['T'] = '20 K'
+    del derived.headers['filepath']
+    assert dict(source.headers) == {'filepath': 'a', 'T': '10 K'}
+    assert dict(derived.headers) == {'T': '20 K'}
+    assert not hasattr(source, '__dict__')
+
+
+def test_provenance_is_written_to_headers():
+    a = sp.Spectrum([1.0, 2.0, 3.0], [3.0, 4.0, 5.0], {'filepath': 'a'})
+    b = sp.Spectrum([1.0, 2.0, 3.0], [1.0, 1.0, 1.0], {'filepath': 'b'})
+    c = sp.Spectrum([1.0, 2.0, 3.0], [2.0, 2.0, 2.0], {'filepath': 'c'})
+    result = (a - b) - c
+    assert result.provenance == (('subtracted', 'b'), ('subtracted', 'c'))
+    assert a.provenance == ()
+    header_lines = str(result).split('\n\n')[0].split('\n')
+    assert [line.strip() for line in header_lines] == [
+        'filepath:\ta', 'subtracted:\tb, c']
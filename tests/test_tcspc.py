@@ -0,0 +1,65 @@
+# Behavior tests of TCSPC timestamp histograms, run with pytest from the
+# repository root.
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tcspc
+
+
+def write_timestamps(path, ticks, header=b''):
+    with open(str(path), 'wb') as raw_file:
+        raw_file.write(header)
+        raw_file.write(np.asarray(ticks, dtype=tcspc.DTYPE).tobytes())
+    return str(path)
+
+
+def photons(period_ticks, count=20000, seed=0):
+    """Returns sorted timestamps of exponential decays after laser pulses,
+    late in the clock so that float64 would lose ticks, and their delays"""
+    start = period_ticks * 2 ** 40
+    rng = np.random.RandomState(seed)
+    pulses = np.sort(rng.randint(0, 10 ** 6, count)).astype(np.int64)
+    delays = np.minimum(rng.exponential(2000, count), period_ticks - 1).astype(
+        np.int64)
+    return (np.uint64(start) + np.uint64(period_ticks) * pulses.astype(np.uint64)
+            + delays.astype(np.uint64)), delays
+
+
+@pytest.mark.parametrize('chunk', [tcspc.CHUNK_RECORDS, 777])
+def test_counts_match_histogram_of_delays(tmp_path, chunk):
+    period, bin_width = 12.5, 0.05  # 12500 ticks, 250 bins
+    ticks, delays = photons(12500)
+    path = write_timestamps(tmp_path / 'raw.bin', ticks, b'HEADER')
+    decay = tcspc.histogram(path, period, bin_width, header=6, chunk=chunk)
+    expected, edges = np.histogram(delays, bins=250, range=(0, 12500))
+    assert np.array_equal(decay.y, expected)
+    assert np.allclose(decay.x, 0.5 * (edges[1:] + edges[:-1]) * tcspc.TICK)
+    assert decay.headers['photons'] == str(len(ticks))
+
+
+def test_partial_last_bin_is_scaled(tmp_path):
+    # 12500 ticks in bins of 300: 41 full bins and the last one of 200
+    ticks = np.uint64(12500 * 2 ** 40) + np.uint64(12500) * np.arange(
+        3000, dtype=np.uint64)
+    ticks = np.sort(np.concatenate([ticks + np.uint64(12350),
+                                    ticks + np.uint64(100)]))
+    path = write_timestamps(tmp_path / 'raw.bin', ticks)
+    decay = tcspc.histogram(path, 12.5, 0.3)
+    assert len(decay) == 42
+    assert decay.y[0] == 3000 and decay.y[-1] == 3000 * 300 / 200.0
+    assert decay.y[1:-1].sum() == 0
+    assert np.isclose(decay.x[-1], 0.5 * (41 * 0.3 + 12.5))
+    assert np.isclose(decay.x[-2], 40.5 * 0.3)
+
+
+def test_fold_keeps_exact_phase():
+    base = np.uint64(2 ** 62 + 12345)
+    ticks = base + np.arange(5, dtype=np.uint64) * np.uint64(1000)
+    folded = tcspc.fold(ticks, 999.5)
+    expected = [float((int(t) * 2) % 1999) / 2 for t in ticks]
+    assert np.array_equal(folded, expected)